@@ -11,6 +11,12 @@ python manage.py collectstatic --no-input
 # Aplica las migraciones de la base de datos
 python manage.py migrate
 
+# Tabla de la caché compartida (CACHE_BACKEND=db); no hace nada si ya existe
+python manage.py createcachetable
+
+# Directorio de remitentes (DNI/RUC): enlaza los expedientes que aún no lo estén
+python manage.py poblar_remitentes
+
 python crear_usuario.py
 
 python cargar_datos_mpi.py
@@ -0,0 +1,115 @@
+# gestion/adjuntos.py
+"""
+Extracción del texto de los PDF adjuntos (para el buscador de la bandeja).
+
+Cuando se sube un PDF (archivo del expediente o adjunto de un movimiento) se encola
+el expediente en un pool de hilos; el hilo lee cada PDF página por página y guarda
+el texto de todos sus adjuntos en Documento.texto_adjuntos, que forma parte del
+índice de texto completo (ver busqueda.py). La petición HTTP no espera.
+
+Memoria acotada: pypdf carga cada página bajo demanda y el texto acumulado se corta
+en settings.ADJUNTOS_TEXTO_MAX_CARACTERES (el resto del PDF ni se procesa).
+Los PDF escaneados sin capa de texto quedan vacíos (no hay OCR).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+from .models import Documento, Movimiento
+
+logger = logging.getLogger(__name__)
+
+
+def es_pdf(archivo):
+    return bool(archivo) and archivo.name.lower().endswith('.pdf')
+
+
+def paginas_pdf(archivo):
+    """Genera el texto de cada página sin cargar el PDF completo en memoria."""
+    with archivo.open('rb') as f:
+        lector = PdfReader(f)
+        if lector.is_encrypted:
+            lector.decrypt('') # PDFs con permisos pero sin contraseña de apertura
+        for pagina in lector.pages:
+            yield pagina.extract_text() or ''
+
+
+def texto_de_adjuntos(doc, limite):
+    """Texto de todos los PDF del expediente (principal + movimientos), hasta 'limite' caracteres."""
+    archivos = [doc.archivo_adjunto] + [
+        mov.archivo_adjunto for mov in Movimiento.objects.filter(documento=doc, archivo_adjunto__iendswith='.pdf').order_by('id')
+    ]
+    partes, total = [], 0
+    for archivo in archivos:
+        if not es_pdf(archivo):
+            continue
+        try:
+            for texto in paginas_pdf(archivo):
+                texto = texto[:limite - total]
+                partes.append(texto)
+                total += len(texto)
+                if total >= limite:
+                    return '\n'.join(partes)
+        except (PyPdfError, OSError, ValueError) as e:
+            # PDF dañado o archivo inexistente en el storage: se indexa lo demás
+            logger.warning("No se pudo extraer el texto de %s: %s", archivo.name, e)
+    return '\n'.join(partes)
+
+
+def extraer_texto_documento(documento_id):
+    """Trabajo del pool: extrae y guarda el texto de los adjuntos de un expediente."""
+    try:
+        doc = Documento.objects.get(pk=documento_id)
+    except Documento.DoesNotExist:
+        return
+    limite = getattr(settings, 'ADJUNTOS_TEXTO_MAX_CARACTERES', 200_000)
+    texto = texto_de_adjuntos(doc, limite)
+    # update() no dispara señales (no vuelve a encolar); el trigger actualiza el índice
+    Documento.objects.filter(pk=documento_id).update(texto_adjuntos=texto, adjuntos_indexados_en=timezone.now())
+
+
+# --- POOL DE HILOS ---
+
+_pool = None
+_pendientes = set() # Expedientes ya encolados (no se encolan dos veces)
+_lock = threading.Lock()
+
+
+def _trabajo(documento_id):
+    with _lock:
+        _pendientes.discard(documento_id)
+    try:
+        extraer_texto_documento(documento_id)
+    except Exception:
+        logger.exception("Error extrayendo texto de los adjuntos del documento %s", documento_id)
+    finally:
+        close_old_connections() # Igual que al final de una petición (conexión del hilo caducada)
+
+
+def encolar_extraccion(documento_id):
+    """
+    Programa la extracción para cuando termine la transacción actual.
+    Con ADJUNTOS_WORKERS = 0 se ejecuta en el momento (útil en pruebas y en el shell).
+    """
+    workers = getattr(settings, 'ADJUNTOS_WORKERS', 2)
+    if workers <= 0:
+        transaction.on_commit(lambda: extraer_texto_documento(documento_id))
+        return
+
+    def enviar():
+        global _pool
+        with _lock:
+            if documento_id in _pendientes:
+                return
+            _pendientes.add(documento_id)
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='adjuntos')
+        _pool.submit(_trabajo, documento_id)
+
+    transaction.on_commit(enviar)
@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from .flujo import destinos_por_defecto, traspasar_bandeja
 from .models import Rol, PerfilUsuario, Procedimiento, PasoFlujo, Requisito, Documento, Movimiento, Notificacion
-from .models import DiaFeriado
+from .models import DiaFeriado, DocumentoHistorico, MovimientoHistorico, URGENCIA_SEMAFORO
 
 # Configuración para gestionar Pasos dentro de un Procedimiento
 class PasoFlujoInline(admin.TabularInline):
@@ -17,18 +18,82 @@ class ProcedimientoAdmin(admin.ModelAdmin):
     search_fields = ('codigo', 'nombre')
     inlines = [PasoFlujoInline, RequisitoInline]
 
+class SemaforoFilter(admin.SimpleListFilter):
+    title = "semáforo"
+    parameter_name = 'semaforo'
+
+    def lookups(self, request, model_admin):
+        return [('rojo', "Vencido"), ('amarillo', "Por vencer"), ('verde', "A tiempo"), ('gris', "Sin plazo")]
+
+    def queryset(self, request, queryset):
+        if self.value() in URGENCIA_SEMAFORO:
+            return queryset.por_semaforo(self.value())
+        return queryset
+
 @admin.register(Documento)
 class DocumentoAdmin(admin.ModelAdmin):
     list_display = ('expediente_id', 'procedimiento', 'paso_actual', 'estado', 'semaforo')
-    list_filter = ('estado', 'procedimiento')
+    list_filter = ('estado', SemaforoFilter, 'procedimiento')
+    list_select_related = ('procedimiento',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).con_semaforo()
+
+    @admin.display(description="Semáforo", ordering='urgencia_semaforo')
+    def semaforo(self, obj):
+        return obj.color_semaforo
 
 # Registro simple del resto
 admin.site.register(Rol)
-admin.site.register(PerfilUsuario)
 admin.site.register(Movimiento)
 admin.site.register(Notificacion)
 
+@admin.register(PerfilUsuario)
+class PerfilUsuarioAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'rol')
+    list_filter = ('rol',)
+    list_select_related = ('usuario', 'rol')
+    actions = ['traspasar_bandeja_action']
+
+    @admin.action(description="Traspasar bandeja a compañeros del mismo rol (baja/licencia)")
+    def traspasar_bandeja_action(self, request, queryset):
+        perfiles = list(queryset.select_related('usuario', 'rol'))
+        seleccionados = {p.pk for p in perfiles}
+        for perfil in perfiles:
+            # No se traspasa a otro perfil que también se está dando de baja
+            destinos = [d for d in destinos_por_defecto(perfil) if d.pk not in seleccionados]
+            if not destinos:
+                self.message_user(request, f"{perfil}: no hay compañeros activos con el mismo rol.", messages.WARNING)
+                continue
+            recibidos = traspasar_bandeja(perfil, destinos, f"Traspaso desde el admin por {request.user.username}")
+            total = sum(recibidos.values())
+            self.message_user(request, f"{perfil}: {total} expediente(s) repartidos entre {len(destinos)} perfil(es).", messages.SUCCESS)
+
 @admin.register(DiaFeriado)
 class DiaFeriadoAdmin(admin.ModelAdmin):
     list_display = ('fecha', 'descripcion')
-    ordering = ['-fecha']
\ No newline at end of file
+    ordering = ['-fecha']
+
+class MovimientoHistoricoInline(admin.TabularInline):
+    model = MovimientoHistorico
+    extra = 0
+    can_delete = False
+    fields = ('fecha_movimiento', 'tipo', 'usuario_origen', 'unidad_destino', 'observaciones')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(DocumentoHistorico)
+class DocumentoHistoricoAdmin(admin.ModelAdmin):
+    """Solo lectura: el archivo se alimenta con 'manage.py archivar_expedientes'."""
+    list_display = ('expediente_id', 'remitente', 'estado', 'fecha_ingreso', 'fecha_archivo')
+    search_fields = ('expediente_id', 'identificador_remitente', 'remitente')
+    list_filter = ('estado',)
+    inlines = [MovimientoHistoricoInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
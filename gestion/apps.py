@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def verificar_busqueda(sender, using, **kwargs):
+    """
+    Tras cada migrate: si SQLite reconstruyó gestion_documento (y con ella borró los
+    triggers de la búsqueda), se reinstalan. Solo si la búsqueda ya fue instalada (0015).
+    """
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .busqueda import asegurar_instalacion
+
+    conexion = connections[using]
+    if ('gestion', '0015_busqueda_texto_completo') in MigrationRecorder(conexion).applied_migrations():
+        asegurar_instalacion(conexion)
 
 
 class GestionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion'
+
+    def ready(self):
+        # Registra los receptores de señales (invalidación de caché)
+        from . import signals  # noqa: F401
+        post_migrate.connect(verificar_busqueda, sender=self)
@@ -0,0 +1,100 @@
+# gestion/archivo.py
+"""
+Archivo histórico de expedientes.
+
+Los expedientes finalizados (atendido / archivado) sin movimientos desde hace más de
+settings.ARCHIVO_ANTIGUEDAD_DIAS se pasan a DocumentoHistorico / MovimientoHistorico
+con 'manage.py archivar_expedientes'. Así Documento y Movimiento solo guardan el
+trabajo vivo y la bandeja, los reportes y el buscador no recorren años de historia.
+
+Los históricos conservan el id, el N° de expediente y los adjuntos (solo se mueve la
+fila, los archivos quedan donde estaban). La consulta pública, el listado por DNI/RUC
+y el detalle interno los siguen resolviendo (ver views.py).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .cache import invalidar_consultas
+from .models import (
+    ESTADOS_FINALIZADOS, Documento, DocumentoHistorico, LogEdicion, Movimiento, MovimientoHistorico,
+)
+
+# Campos que se copian tal cual (mismo nombre en ambos modelos)
+CAMPOS_DOCUMENTO = [
+    'id', 'expediente_id', 'procedimiento_id', 'asunto', 'estado', 'fecha_ingreso', 'fecha_limite_total',
+    'fecha_limite_paso_actual', 'paso_actual', 'responsable_actual_id', 'remitente', 'tipo_remitente',
+    'identificador_remitente', 'remitente_registro_id', 'archivo_adjunto', 'clave_seguridad', 'texto_adjuntos',
+]
+CAMPOS_MOVIMIENTO = [
+    'id', 'documento_id', 'fecha_movimiento', 'usuario_origen_id', 'unidad_destino_id', 'paso_flujo',
+    'observaciones', 'archivo_adjunto', 'tipo',
+]
+
+
+def antiguedad_por_defecto():
+    return getattr(settings, 'ARCHIVO_ANTIGUEDAD_DIAS', 365)
+
+
+def archivables(corte):
+    """
+    Expedientes finalizados ingresados antes de 'corte' y sin movimientos desde entonces.
+    NOT EXISTS por expediente (índice movimiento_doc_fecha_idx) en lugar de un
+    MAX(fecha_movimiento) agrupado sobre todos los finalizados.
+    """
+    recientes = Movimiento.objects.filter(documento=OuterRef('pk'), fecha_movimiento__gte=corte)
+    return Documento.objects.filter(estado__in=ESTADOS_FINALIZADOS, fecha_ingreso__lt=corte).filter(~Exists(recientes))
+
+
+def _archivar_lote(ids):
+    """Copia el lote a las tablas históricas y lo borra de las activas (una transacción)."""
+    docs = list(Documento.objects.filter(pk__in=ids).values(*CAMPOS_DOCUMENTO))
+    movimientos = list(Movimiento.objects.filter(documento_id__in=ids).values(*CAMPOS_MOVIMIENTO))
+
+    logs = {}
+    for log in LogEdicion.objects.filter(documento_id__in=ids).order_by('fecha').values('documento_id', 'fecha', 'usuario_id', 'cambios'):
+        logs.setdefault(log.pop('documento_id'), []).append({**log, 'fecha': log['fecha'].isoformat()})
+
+    DocumentoHistorico.objects.bulk_create(
+        [DocumentoHistorico(**doc, logs_edicion=logs.get(doc['id'], [])) for doc in docs], batch_size=500
+    )
+    MovimientoHistorico.objects.bulk_create([MovimientoHistorico(**mov) for mov in movimientos], batch_size=500)
+
+    # Borrado directo (sin cargar objetos ni disparar señales por fila); el trigger
+    # de la BD quita los expedientes del índice de búsqueda
+    LogEdicion.objects.filter(documento_id__in=ids)._raw_delete(LogEdicion.objects.db)
+    Movimiento.objects.filter(documento_id__in=ids)._raw_delete(Movimiento.objects.db)
+    Documento.objects.filter(pk__in=ids)._raw_delete(Documento.objects.db)
+
+    expedientes = [doc['expediente_id'] for doc in docs]
+    remitentes = {doc['identificador_remitente'] for doc in docs}
+    transaction.on_commit(lambda: invalidar_consultas(expedientes, remitentes))
+    return len(docs)
+
+
+def archivar_expedientes(ahora, antiguedad_dias=None, lote=500, simular=False):
+    """
+    Pasa al archivo histórico los expedientes finalizados sin actividad en 'antiguedad_dias'.
+    Cada lote va en su propia transacción. Devuelve la cantidad archivada
+    (o la que se archivaría, con simular=True).
+    """
+    if antiguedad_dias is None:
+        antiguedad_dias = antiguedad_por_defecto()
+    corte = ahora - timedelta(days=antiguedad_dias)
+
+    if simular:
+        return archivables(corte).count()
+
+    # Recorrido por id (keyset): cada lote sigue donde terminó el anterior, así los
+    # finalizados que no se archivan no se vuelven a evaluar en cada vuelta
+    total, ultimo_id = 0, 0
+    while True:
+        with transaction.atomic():
+            ids = list(archivables(corte).filter(pk__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:lote])
+            if not ids:
+                break
+            total += _archivar_lote(ids)
+        ultimo_id = ids[-1]
+    return total
@@ -0,0 +1,252 @@
+# gestion/benchmark.py
+"""
+Benchmark de las vistas más usadas, con presupuesto de latencia y de consultas SQL.
+
+Recorre las vistas con el cliente de pruebas de Django sobre la BD configurada
+(pensado para el conjunto de 'manage.py generar_datos_sinteticos') y mide, por vista,
+la latencia p50/p95 y la cantidad máxima de consultas por petición.
+
+    manage.py benchmark_vistas --guardar     # graba la línea base (JSON)
+    manage.py benchmark_vistas               # compara contra la línea base
+
+La comparación falla si una vista hace más consultas que las registradas o si su
+p95 supera el registrado más la tolerancia. Las peticiones que modifican datos
+(derivar) se ejecutan dentro de una transacción que se deshace al terminar; sus
+on_commit se corren igual dentro de la medición. Los GET van sin transacción
+propia, como en producción. Cada vista se calienta con peticiones que no entran
+en la muestra.
+
+    manage.py benchmark_vistas --perfil-produccion   # antes / después de PERFIL_PRODUCCION
+"""
+import copy
+import json
+import statistics
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.test import Client, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .flujo import ESTADOS_ABIERTOS
+from .models import Documento, PasoFlujo, PerfilUsuario
+from .permisos import PERMISOS
+
+# Peticiones por vista que se hacen antes de medir (conexión, plantillas y caché en frío)
+CALENTAMIENTO = 2
+
+
+def ruta_linea_base():
+    return Path(getattr(settings, 'BENCHMARK_LINEA_BASE', Path(settings.BASE_DIR) / 'benchmarks' / 'linea_base.json'))
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (p en 0-100)."""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def perfil_con_permisos(*permisos):
+    """Algún perfil cuyo rol tenga todos esos permisos (para reportes y exportación)."""
+    roles = set.intersection(*(PERMISOS[p] for p in permisos))
+    return PerfilUsuario.objects.filter(rol__nombre__in=roles).select_related('usuario').order_by('id').first()
+
+
+def perfil_por_defecto():
+    """El perfil con la bandeja más cargada (el caso más exigente para la bandeja)."""
+    return (
+        PerfilUsuario.objects.filter(documentos_asignados__estado__in=ESTADOS_ABIERTOS)
+        .annotate(abiertos=Count('documentos_asignados')).order_by('-abiertos', 'id').select_related('usuario').first()
+    )
+
+
+def _derivables(cantidad):
+    """Expedientes abiertos que se pueden derivar por la ruta TUPA sin generar PDF."""
+    siguiente = PasoFlujo.objects.filter(procedimiento=OuterRef('procedimiento'), orden=OuterRef('paso_actual') + 1)
+    resolucion = PasoFlujo.objects.filter(
+        procedimiento=OuterRef('procedimiento'), orden=OuterRef('paso_actual'), descripcion__contains="Resolución"
+    )
+    return list(
+        Documento.objects.filter(estado='en_proceso', responsable_actual__isnull=False)
+        .exclude(Q(procedimiento__codigo__contains="GEN") | Q(procedimiento__nombre__contains="No TUPA"))
+        .filter(Exists(siguiente)).exclude(Exists(resolucion))
+        .select_related('responsable_actual__usuario').order_by('id')[:cantidad]
+    )
+
+
+def escenarios(perfil, repeticiones, calentamiento=CALENTAMIENTO):
+    """
+    Lista de (nombre, calentamiento, peticiones): cada petición es (usuario o None,
+    método, url, datos). La bandeja y el detalle van con 'perfil'; reportes y CSV con
+    un perfil directivo. Las vistas de detalle / consulta / derivar rotan entre
+    distintos expedientes (sin caché caliente), y los de calentamiento no se repiten
+    en la muestra.
+    """
+    total = calentamiento + repeticiones
+    muestra = list(
+        Documento.objects.filter(identificador_remitente__isnull=False)
+        .order_by('-fecha_ingreso').values_list('expediente_id', 'identificador_remitente')[:total]
+    )
+    usuario = perfil.usuario
+    directivo = (perfil_con_permisos('reportes_globales', 'exportar_csv') or perfil).usuario
+    anonimo = None
+
+    def escenario(nombre, peticiones):
+        return (nombre, peticiones[:calentamiento], peticiones[calentamiento:])
+
+    def repetir(metodo, url, datos=None, quien=usuario):
+        return [(quien, metodo, url, datos)] * total
+
+    return [
+        escenario('listar_documentos', repetir('get', reverse('lista_documentos'))),
+        escenario('listar_documentos_busqueda', repetir('get', reverse('lista_documentos'), {'q': 'constancia egresado'})),
+        escenario('detalle_documento', [
+            (usuario, 'get', reverse('detalle_documento', args=[exp]), None) for exp, _ in muestra
+        ]),
+        escenario('derivar_documento', [
+            (doc.responsable_actual.usuario, 'post', reverse('derivar_documento', args=[doc.expediente_id]),
+             {'accion': 'derivar', 'observaciones': "Benchmark"})
+            for doc in _derivables(total)
+        ]),
+        escenario('reportes_dashboard', repetir('get', reverse('reportes_dashboard'), quien=directivo)),
+        escenario('exportar_documentos_csv', repetir('get', reverse('exportar_csv'), quien=directivo)),
+        escenario('consulta_expediente', [
+            (anonimo, 'get', reverse('consulta_expediente'), {'expediente_id': exp, 'identificador': ident})
+            for exp, ident in muestra
+        ]),
+        escenario('check_nuevas_notificaciones', repetir('get', reverse('api_check_notificaciones'))),
+    ]
+
+
+class ContadorConsultas:
+    """execute_wrapper que solo cuenta (sin el tope de connection.queries ni guardar el SQL)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def transaccion_deshecha():
+    """
+    Transacción que se deshace al salir: nada de lo que haga la vista queda guardado.
+    Los on_commit que registre se ejecutan al final del bloque, como al confirmar.
+    """
+    with transaction.atomic():
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            yield
+        transaction.set_rollback(True)
+
+
+def medir(peticiones, calentamiento=()):
+    """
+    Ejecuta las peticiones de 'calentamiento' (sin medirlas) y luego las de 'peticiones'.
+    Devuelve {'p50_ms', 'p95_ms', 'consultas', 'peticiones'} (None si no hay).
+    """
+    if not peticiones:
+        return None
+    cliente = Client()
+    sesion = None
+    tiempos, consultas = [], []
+    for i, (usuario, metodo, url, datos) in enumerate([*calentamiento, *peticiones]):
+        if usuario != sesion:
+            cliente.logout()
+            if usuario is not None:
+                cliente.force_login(usuario)
+            sesion = usuario
+        contador = ContadorConsultas()
+        with connection.execute_wrapper(contador):
+            inicio = time.perf_counter()
+            with transaccion_deshecha() if metodo != 'get' else nullcontext():
+                respuesta = getattr(cliente, metodo)(url, datos or {})
+                if getattr(respuesta, 'streaming', False):
+                    b''.join(respuesta.streaming_content)
+            transcurrido = time.perf_counter() - inicio
+        # Un GET que redirige (p. ej. por falta de permiso) no está midiendo la vista
+        if respuesta.status_code >= 400 or (metodo == 'get' and respuesta.status_code != 200):
+            raise RuntimeError(f"{metodo.upper()} {url} respondió {respuesta.status_code}")
+        if i >= len(calentamiento):
+            tiempos.append(transcurrido * 1000)
+            consultas.append(contador.total)
+    return {
+        'p50_ms': round(statistics.median(tiempos), 2),
+        'p95_ms': round(percentil(tiempos, 95), 2),
+        'consultas': max(consultas),
+        'peticiones': len(tiempos),
+    }
+
+
+def ejecutar(perfil, repeticiones=20, solo=None, progreso=None):
+    """Mide todos los escenarios (o los de 'solo'). Devuelve {vista: resultado}."""
+    resultados = {}
+    for nombre, calentamiento, peticiones in escenarios(perfil, repeticiones):
+        if solo and nombre not in solo:
+            continue
+        resultados[nombre] = medir(peticiones, calentamiento)
+        if progreso:
+            progreso(nombre, resultados[nombre])
+    return resultados
+
+
+def ajustes_perfil(produccion):
+    """
+    override_settings de sesiones y plantillas sin / con el perfil de producción
+    (settings.PERFIL_PRODUCCION), sin importar cuál esté activo en este proceso.
+    """
+    plantillas = copy.deepcopy(settings.TEMPLATES)
+    opciones = plantillas[0]['OPTIONS']
+    if produccion:
+        plantillas[0]['APP_DIRS'] = False
+        opciones['loaders'] = settings.CARGADORES_PLANTILLAS_PRODUCCION
+        return {'SESSION_ENGINE': settings.SESION_BACKEND_PRODUCCION, 'TEMPLATES': plantillas}
+    plantillas[0]['APP_DIRS'] = True
+    opciones.pop('loaders', None)
+    return {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'TEMPLATES': plantillas}
+
+
+def comparar_perfiles(perfil, repeticiones=20, solo=('listar_documentos',), progreso=None):
+    """Mide las vistas sin y con el perfil de producción: {'antes': {...}, 'despues': {...}}."""
+    resultados = {}
+    for etiqueta, produccion in (('antes', False), ('despues', True)):
+        with override_settings(**ajustes_perfil(produccion)):
+            resultados[etiqueta] = ejecutar(perfil, repeticiones, solo, progreso and (lambda n, r: progreso(etiqueta, n, r)))
+    return resultados
+
+
+def comparar(resultados, linea_base, tolerancia):
+    """Mensajes de las vistas que se salen del presupuesto de la línea base."""
+    excedidas = []
+    for nombre, actual in resultados.items():
+        base = linea_base.get('vistas', {}).get(nombre)
+        if not actual or not base:
+            continue
+        if actual['consultas'] > base['consultas']:
+            excedidas.append(f"{nombre}: {actual['consultas']} consultas (presupuesto {base['consultas']})")
+        limite = base['p95_ms'] * (1 + tolerancia)
+        if actual['p95_ms'] > limite:
+            excedidas.append(f"{nombre}: p95 {actual['p95_ms']} ms (presupuesto {limite:.2f} ms)")
+    return excedidas
+
+
+def guardar_linea_base(resultados, ruta):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    datos = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'motor': connection.vendor,
+        'documentos': Documento.objects.count(),
+        'vistas': resultados,
+    }
+    ruta.write_text(json.dumps(datos, indent=2, ensure_ascii=False) + "\n", encoding='utf-8')
+
+
+def leer_linea_base(ruta):
+    return json.loads(ruta.read_text(encoding='utf-8'))
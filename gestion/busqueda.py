@@ -0,0 +1,261 @@
+# gestion/busqueda.py
+"""
+Búsqueda de texto completo sobre los expedientes (buscador de la bandeja).
+
+Según el motor de base de datos:
+  - PostgreSQL: columna tsvector 'busqueda' en gestion_documento + índice GIN,
+    configuración 'sgd_es' (español con unaccent: "resolucion" encuentra "Resolución").
+  - SQLite: tabla virtual FTS5 'gestion_documento_fts' (rowid = id del documento).
+  - Otros motores: se mantiene el icontains de siempre.
+
+La columna / tabla de búsqueda la mantienen triggers de la propia BD, así que se
+actualiza en cada save() y también en bulk_create/update (que no disparan señales).
+La estructura se crea en la migración 0015. Si una migración posterior hace que
+SQLite reconstruya la tabla (alter table "remake"), los triggers desaparecen con
+ella: tras cada migrate, asegurar_instalacion() (post_migrate, ver apps.py) los
+verifica y, si faltan, vuelve a instalar y repoblar el índice. 'manage.py
+reindexar_busqueda' hace lo mismo a pedido.
+"""
+import logging
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Upper
+
+logger = logging.getLogger('gestion.busqueda')
+
+TABLA = 'gestion_documento'
+TABLA_FTS = 'gestion_documento_fts'
+
+# Columnas indexadas y su peso (A = más relevante)
+COLUMNAS = {
+    'expediente_id': 'A',
+    'remitente': 'B',
+    'identificador_remitente': 'B',
+    'asunto': 'C',
+    'texto_adjuntos': 'D', # Contenido de los PDF (ver adjuntos.py)
+}
+PESOS_BM25 = {'A': 10.0, 'B': 5.0, 'C': 1.0, 'D': 0.2}
+
+# N° de expediente completo o parcial: 'EXP-2025-0001', 'exp-2025-00', '2025-0001', '2025-'
+_EXPEDIENTE = re.compile(r'(?:EXP-?)?(\d{4}-\d*)', re.IGNORECASE)
+
+
+def terminos(texto):
+    """Palabras de la búsqueda, sin operadores ni comillas: 'Constancia "egresado"' -> ['Constancia', 'egresado']"""
+    return re.findall(r'\w+', texto or '')
+
+
+# --- INSTALACIÓN (migración / reindexar_busqueda) ---
+
+def _vector_pg(columnas, prefijo=''):
+    partes = [
+        f"setweight(to_tsvector('sgd_es', coalesce({prefijo}{col}, '')), '{COLUMNAS[col]}')"
+        for col in columnas
+    ]
+    return " || ".join(partes)
+
+
+def _instalar_postgresql(cursor, columnas):
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    cursor.execute("""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'sgd_es') THEN
+                CREATE TEXT SEARCH CONFIGURATION sgd_es (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION sgd_es
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END $$;
+    """)
+    cursor.execute(f"ALTER TABLE {TABLA} ADD COLUMN IF NOT EXISTS busqueda tsvector")
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION gestion_documento_busqueda_trigger() RETURNS trigger AS $$
+        BEGIN
+            NEW.busqueda := {_vector_pg(columnas, 'NEW.')};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+    """)
+    cursor.execute(f"DROP TRIGGER IF EXISTS gestion_documento_busqueda ON {TABLA}")
+    cursor.execute(f"""
+        CREATE TRIGGER gestion_documento_busqueda
+        BEFORE INSERT OR UPDATE OF {', '.join(columnas)} ON {TABLA}
+        FOR EACH ROW EXECUTE FUNCTION gestion_documento_busqueda_trigger()
+    """)
+    cursor.execute(f"UPDATE {TABLA} SET busqueda = {_vector_pg(columnas)}")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS documento_busqueda_gin ON {TABLA} USING GIN (busqueda)")
+
+
+def _instalar_sqlite(cursor, columnas):
+    nuevos = ', '.join(f"new.{col}" for col in columnas)
+    columnas = ', '.join(columnas)
+
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA_FTS}")
+    cursor.execute(f"CREATE VIRTUAL TABLE {TABLA_FTS} USING fts5({columnas}, tokenize='unicode61 remove_diacritics 2')")
+    for sufijo in ('ai', 'ad', 'au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}")
+
+    cursor.execute(f"""
+        CREATE TRIGGER {TABLA_FTS}_ai AFTER INSERT ON {TABLA} BEGIN
+            INSERT INTO {TABLA_FTS}(rowid, {columnas}) VALUES (new.id, {nuevos});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {TABLA_FTS}_ad AFTER DELETE ON {TABLA} BEGIN
+            DELETE FROM {TABLA_FTS} WHERE rowid = old.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {TABLA_FTS}_au AFTER UPDATE OF {columnas} ON {TABLA} BEGIN
+            DELETE FROM {TABLA_FTS} WHERE rowid = old.id;
+            INSERT INTO {TABLA_FTS}(rowid, {columnas}) VALUES (new.id, {nuevos});
+        END
+    """)
+    cursor.execute(f"INSERT INTO {TABLA_FTS}(rowid, {columnas}) SELECT id, {columnas} FROM {TABLA}")
+
+
+def _desinstalar_postgresql(cursor):
+    cursor.execute(f"DROP TRIGGER IF EXISTS gestion_documento_busqueda ON {TABLA}")
+    cursor.execute("DROP FUNCTION IF EXISTS gestion_documento_busqueda_trigger()")
+    cursor.execute("DROP INDEX IF EXISTS documento_busqueda_gin")
+    cursor.execute(f"ALTER TABLE {TABLA} DROP COLUMN IF EXISTS busqueda")
+
+
+def _desinstalar_sqlite(cursor):
+    for sufijo in ('ai', 'ad', 'au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}")
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA_FTS}")
+
+
+def instalar(conexion=connection):
+    """
+    Crea (o recrea) la estructura de búsqueda y la puebla con los documentos existentes.
+    Solo indexa las columnas que ya existen en la tabla (en una BD nueva, las
+    migraciones la van instalando a medida que se agregan columnas).
+    """
+    instaladores = {'postgresql': _instalar_postgresql, 'sqlite': _instalar_sqlite}
+    if conexion.vendor in instaladores:
+        with conexion.cursor() as cursor:
+            existentes = {c.name for c in conexion.introspection.get_table_description(cursor, TABLA)}
+            instaladores[conexion.vendor](cursor, [col for col in COLUMNAS if col in existentes])
+
+
+def _triggers_postgresql(cursor):
+    cursor.execute(
+        "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+        [TABLA],
+    )
+    return dict(cursor.fetchall())
+
+
+def _triggers_sqlite(cursor):
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [TABLA])
+    return dict(cursor.fetchall())
+
+
+# Trigger que recalcula la búsqueda al editar: debe nombrar todas las columnas indexadas
+_TRIGGER_ACTUALIZACION = {'postgresql': 'gestion_documento_busqueda', 'sqlite': f'{TABLA_FTS}_au'}
+_TRIGGERS = {
+    'postgresql': ('gestion_documento_busqueda',),
+    'sqlite': tuple(f'{TABLA_FTS}_{sufijo}' for sufijo in ('ai', 'ad', 'au')),
+}
+
+
+def instalada(conexion=connection):
+    """True si los triggers de búsqueda existen y cubren todas las columnas indexadas de la tabla."""
+    lectores = {'postgresql': _triggers_postgresql, 'sqlite': _triggers_sqlite}
+    if conexion.vendor not in lectores:
+        return True
+    with conexion.cursor() as cursor:
+        triggers = lectores[conexion.vendor](cursor)
+        existentes = {c.name for c in conexion.introspection.get_table_description(cursor, TABLA)}
+    if not all(nombre in triggers for nombre in _TRIGGERS[conexion.vendor]):
+        return False
+    definicion = triggers[_TRIGGER_ACTUALIZACION[conexion.vendor]]
+    return all(col in definicion for col in COLUMNAS if col in existentes)
+
+
+def asegurar_instalacion(conexion=connection):
+    """Reinstala y repuebla la búsqueda si faltan sus triggers. Devuelve True si tuvo que hacerlo."""
+    if instalada(conexion):
+        return False
+    logger.warning("Faltaban los triggers de búsqueda en %s: se reinstalan y se reconstruye el índice", TABLA)
+    instalar(conexion)
+    return True
+
+
+def desinstalar(conexion=connection):
+    desinstaladores = {'postgresql': _desinstalar_postgresql, 'sqlite': _desinstalar_sqlite}
+    if conexion.vendor in desinstaladores:
+        with conexion.cursor() as cursor:
+            desinstaladores[conexion.vendor](cursor)
+
+
+# --- CONSULTA ---
+
+def _coincidencia_y_rango(palabras):
+    """Expresiones SQL (coincide, rango) para el motor actual, o None si no hay FTS."""
+    if connection.vendor == 'postgresql':
+        # 'constan egres' -> 'constan:* & egres:*' (prefijos, para buscar mientras se escribe)
+        consulta = ' & '.join(f"{p}:*" for p in palabras)
+        return (
+            RawSQL(f"{TABLA}.busqueda @@ to_tsquery('sgd_es', %s)", [consulta], output_field=BooleanField()),
+            RawSQL(f"ts_rank({TABLA}.busqueda, to_tsquery('sgd_es', %s))", [consulta], output_field=FloatField()),
+        )
+    if connection.vendor == 'sqlite':
+        consulta = ' '.join(f'"{p}"*' for p in palabras)
+        # Un peso por columna de la tabla FTS (en el mismo orden)
+        pesos = ', '.join(str(PESOS_BM25[peso]) for peso in COLUMNAS.values())
+        return (
+            RawSQL(f"{TABLA}.id IN (SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s)", [consulta],
+                   output_field=BooleanField()),
+            # bm25() devuelve valores negativos: más negativo = más relevante. La búsqueda FTS se
+            # evalúa una sola vez (LIMIT -1 impide que SQLite aplane la subconsulta) y cada fila
+            # toma su puntaje con un índice automático, en vez de repetir el MATCH por fila.
+            RawSQL(f"(SELECT rango FROM (SELECT rowid AS fts_id, -bm25({TABLA_FTS}, {pesos}) AS rango "
+                   f"FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s LIMIT -1) WHERE fts_id = {TABLA}.id)",
+                   [consulta], output_field=FloatField()),
+        )
+    return None
+
+
+def prefijo_expediente(texto):
+    """'2025-00' -> 'EXP-2025-00' si el texto parece un N° de expediente; si no, None."""
+    coincidencia = _EXPEDIENTE.fullmatch((texto or '').strip())
+    return f"EXP-{coincidencia.group(1)}" if coincidencia else None
+
+
+def _por_prefijo_expediente(prefijo):
+    """
+    UPPER(expediente_id) en [prefijo, prefijo siguiente): rango anclado que usa el índice
+    documento_exp_upper_idx (un LIKE '%...%' obligaría a recorrer toda la tabla). El
+    startswith descarta lo que la intercalación de la BD pudiera colar en el rango.
+    """
+    siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    return Q(expediente_mayus__gte=prefijo, expediente_mayus__lt=siguiente, expediente_mayus__startswith=prefijo)
+
+
+def buscar(queryset, texto):
+    """
+    Filtra 'queryset' (de Documento) por el texto del buscador y anota 'rango_busqueda'
+    (mayor = más relevante). El N° de expediente también se acepta parcial ('2025-00'):
+    solo entonces se añade la búsqueda por prefijo del expediente a la de texto completo.
+    """
+    palabras = terminos(texto)
+    if not palabras:
+        return queryset.annotate(rango_busqueda=Value(0.0))
+
+    expresiones = _coincidencia_y_rango(palabras)
+    if expresiones is None:
+        return queryset.filter(
+            Q(expediente_id__icontains=texto) | Q(asunto__icontains=texto) | Q(remitente__icontains=texto)
+        ).annotate(rango_busqueda=Value(0.0))
+
+    coincide, rango = expresiones
+    filtro = Q(coincide_busqueda=True)
+    prefijo = prefijo_expediente(texto)
+    if prefijo:
+        queryset = queryset.alias(expediente_mayus=Upper('expediente_id'))
+        filtro |= _por_prefijo_expediente(prefijo)
+    return queryset.alias(coincide_busqueda=coincide).filter(filtro).annotate(rango_busqueda=rango)
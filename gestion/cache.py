@@ -0,0 +1,185 @@
+# gestion/cache.py
+"""
+Utilidades de caché de la app (consulta pública de expedientes, listado por
+remitente, perfil del usuario y lecturas frecuentes por espacio de nombres).
+
+Cada expediente tiene un "sello de versión" guardado en la caché. Las respuestas
+cacheadas incluyen ese sello en su clave, así que basta con cambiar el sello
+(al registrar un nuevo movimiento) para que todas las copias antiguas queden
+invalidadas sin tener que buscarlas una por una.
+
+El backend (memoria local, BD, archivos o Redis) se elige en settings con
+CACHE_BACKEND; con más de un worker debe ser uno compartido (db / redis) para
+que los sellos y los límites de tasa sean los mismos en todos.
+"""
+import hashlib
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metricas
+
+
+def normalizar_expediente(expediente_id):
+    """Clave de búsqueda normalizada: 'exp-2025-0001 ' -> 'EXP-2025-0001'"""
+    return (expediente_id or '').strip().upper()
+
+
+def obtener_version(clave):
+    """
+    Devuelve el sello de versión guardado en 'clave'.
+    Si no existe (o la caché lo expulsó) se crea con la hora actual en nanosegundos,
+    así nunca puede "volver" a un sello viejo y servir datos desactualizados.
+    """
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), None)
+        version = cache.get(clave)
+    return version
+
+
+def renovar_version(clave):
+    """Cambia el sello de versión: todo lo cacheado con el sello anterior caduca."""
+    cache.set(clave, time.time_ns(), None)
+
+
+def _clave_version(expediente_id):
+    return f"consulta:version:{normalizar_expediente(expediente_id)}"
+
+
+def version_consulta(expediente_id):
+    """Sello de versión actual de la consulta pública del expediente."""
+    return obtener_version(_clave_version(expediente_id))
+
+
+def invalidar_consulta(expediente_id):
+    """Todas las respuestas cacheadas del expediente caducan."""
+    renovar_version(_clave_version(expediente_id))
+
+
+def invalidar_consultas(expedientes, remitentes=()):
+    """Versión en lote (para operaciones masivas que no disparan señales)."""
+    ahora = time.time_ns()
+    sellos = {_clave_version(exp): ahora for exp in expedientes}
+    sellos.update({_clave_version_remitente(ident): ahora for ident in remitentes if ident})
+    cache.set_many(sellos, None)
+
+
+def clave_consulta(expediente_id, credencial):
+    """
+    Clave de caché por (expediente, credencial, versión).
+    La credencial (DNI/RUC o Clave Web) se guarda como hash, nunca en claro.
+    """
+    expediente = normalizar_expediente(expediente_id)
+    version = version_consulta(expediente)
+    firma = huella(expediente, credencial)
+    return f"consulta:html:{expediente}:{firma}:{version}", f'"{firma[:16]}-{version}"'
+
+
+def tiempo_cache_consulta():
+    return getattr(settings, 'CONSULTA_CACHE_TIMEOUT', 300)
+
+
+def huella(*partes):
+    """Hash corto para guardar credenciales en la caché sin dejarlas en claro."""
+    return hashlib.sha256("|".join(partes).encode()).hexdigest()[:32]
+
+
+# --- LISTADO PÚBLICO POR REMITENTE (DNI/RUC) ---
+
+def _clave_version_remitente(identificador):
+    return f"remitente:version:{identificador.strip()}"
+
+
+def clave_listado_remitente(identificador):
+    """Clave de caché del listado de expedientes del DNI/RUC (cambia con cada movimiento)."""
+    version = obtener_version(_clave_version_remitente(identificador))
+    return f"remitente:listado:{identificador.strip()}:{version}"
+
+
+def invalidar_remitente(identificador):
+    if identificador:
+        renovar_version(_clave_version_remitente(identificador))
+
+
+# --- PERFIL DEL USUARIO (rol, unidad) ---
+
+def clave_perfil(usuario_id):
+    return f"perfil:{usuario_id}"
+
+
+def invalidar_perfil(*usuario_ids):
+    """Olvida el perfil cacheado de esos usuarios (tras editar perfil, usuario o rol)."""
+    cache.delete_many([clave_perfil(uid) for uid in usuario_ids])
+
+
+def tiempo_cache_perfil():
+    return getattr(settings, 'PERFIL_CACHE_TIMEOUT', 60)
+
+
+# --- LECTURAS FRECUENTES POR ESPACIO DE NOMBRES ---
+# Catálogos que casi no cambian (flujo TUPA, procedimientos, feriados) se leen en
+# cada petición. Cada espacio tiene su sello de versión; signals.py lo renueva al
+# guardar o borrar los modelos de los que depende, y así todos los workers dejan
+# de usar la copia vieja a la vez.
+
+# Aciertos / fallos de este proceso: {(espacio, 'acierto' | 'fallo'): veces}.
+# Los totales de todos los workers están en /metricas/ (sgd_cache_total).
+estadisticas = Counter()
+
+
+def _clave_version_espacio(espacio):
+    return f"{espacio}:version"
+
+
+def _contar(espacio, resultado):
+    estadisticas[(espacio, resultado)] += 1
+    metricas.incrementar('sgd_cache_total', espacio=espacio, resultado=resultado)
+
+
+def cacheado(espacio, clave, calcular, timeout=None):
+    """
+    Valor de 'espacio:clave' desde la caché, o calcular() si no está o es de una versión vieja.
+
+    El valor se guarda junto con el sello del espacio, así una sola ida a la caché
+    (get_many) trae ambos. El sello se lee antes de calcular: si alguien invalida el
+    espacio mientras tanto, lo guardado queda con el sello viejo y no se vuelve a usar.
+    """
+    clave_version = _clave_version_espacio(espacio)
+    clave_valor = f"{espacio}:{clave}"
+    encontrados = cache.get_many([clave_version, clave_valor])
+    version = encontrados.get(clave_version)
+    guardado = encontrados.get(clave_valor)
+    if version is not None and guardado is not None and guardado[0] == version:
+        _contar(espacio, 'acierto')
+        return guardado[1]
+
+    _contar(espacio, 'fallo')
+    if version is None:
+        version = obtener_version(clave_version)
+    valor = calcular()
+    cache.set(clave_valor, (version, valor), tiempo_cache_lecturas() if timeout is None else timeout)
+    return valor
+
+
+def invalidar_espacio(*espacios):
+    """Todo lo cacheado en esos espacios caduca (en todos los workers)."""
+    ahora = time.time_ns()
+    cache.set_many({_clave_version_espacio(e): ahora for e in espacios}, None)
+
+
+def resumen_estadisticas():
+    """{espacio: {'aciertos', 'fallos', 'tasa'}} de este proceso."""
+    resumen = {}
+    for (espacio, resultado), veces in estadisticas.items():
+        fila = resumen.setdefault(espacio, {'aciertos': 0, 'fallos': 0})
+        fila['aciertos' if resultado == 'acierto' else 'fallos'] += veces
+    for fila in resumen.values():
+        fila['tasa'] = round(fila['aciertos'] / (fila['aciertos'] + fila['fallos']), 3)
+    return resumen
+
+
+def tiempo_cache_lecturas():
+    return getattr(settings, 'CACHE_LECTURAS_TIMEOUT', 3600)
@@ -1,14 +1,17 @@
 # gestion/context_processors.py
 
 from .models import Notificacion
+from .permisos import capacidades
 
 def notificaciones_processor(request):
     # Primero, verificamos si el usuario ha iniciado sesión.
     # Si no lo ha hecho, no tiene sentido buscar notificaciones.
     if request.user.is_authenticated:
         try:
-            # Buscamos el perfil del usuario actual
-            perfil_usuario = request.user.perfilusuario
+            # Buscamos el perfil del usuario actual (ya resuelto por PerfilUsuarioMiddleware)
+            perfil_usuario = request.perfil
+            if not perfil_usuario:
+                return {}
             
             # Contamos cuántas notificaciones tiene este usuario que no han sido leídas.
             notificaciones_no_leidas_count = Notificacion.objects.filter(
@@ -33,4 +36,9 @@ def notificaciones_processor(request):
             return {}
     
     # Si el usuario no está autenticado, devolvemos un diccionario vacío.
-    return {}
\ No newline at end of file
+    return {}
+
+
+def permisos_processor(request):
+    # 'permisos' en las plantillas: {% if 'anular' in permisos %}
+    return {'permisos': capacidades(getattr(request, 'perfil', None))}
@@ -0,0 +1,254 @@
+# gestion/datos_sinteticos.py
+"""
+Generador de datos sintéticos a escala de producción (pruebas de carga y benchmarks).
+
+Usa los Procedimiento / PasoFlujo y perfiles reales (cargar_datos_mpi.py) y simula
+cada expediente recorriendo su ruta TUPA: inicio en Mesa de Partes, derivaciones
+paso a paso, observaciones con retorno al paso anterior, desvíos manuales
+("[DESVÍO DE RUTA]", igual que la vista de derivación), envíos externos y
+finalización. Los expedientes recientes quedan abiertos (con plazos vencidos, por
+vencer y a tiempo) y los antiguos finalizados.
+
+Todo se inserta con bulk_create por lotes y con un random.Random(semilla) propio:
+la misma semilla genera los mismos expedientes (las fechas son relativas al día
+en que se ejecuta). Se ejecuta con 'manage.py generar_datos_sinteticos'.
+"""
+import random
+import string
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidar_espacio
+from .models import Correlativo, DiaFeriado, Documento, Movimiento, Notificacion, PasoFlujo, PerfilUsuario, Procedimiento
+
+NOMBRES = ["María", "José", "Rosa", "Luis", "Carmen", "Juan", "Ana", "Carlos", "Lucía", "Jorge", "Elena", "Miguel",
+           "Sofía", "Pedro", "Julia", "Víctor", "Diana", "Raúl", "Teresa", "César"]
+APELLIDOS = ["Quispe", "Flores", "Sánchez", "Rodríguez", "García", "Huamán", "Mamani", "Torres", "Chávez", "Vargas",
+             "Ramírez", "Castillo", "Mendoza", "Rojas", "Díaz", "Vásquez", "Romero", "Cruz", "Gutiérrez", "Salazar"]
+EMPRESAS = ["Inversiones", "Comercial", "Consultora", "Servicios Educativos", "Distribuidora", "Constructora"]
+ASUNTOS = [
+    "Solicito constancia de egresado para trámite de título",
+    "Solicito certificado de estudios del periodo {anio}",
+    "Solicito rectificación de nombre en el registro de notas",
+    "Solicito convalidación de unidades didácticas",
+    "Presento expediente para obtención del grado de bachiller",
+    "Solicito reserva de matrícula por motivos de salud",
+    "Solicito duplicado de carné de estudiante",
+    "Remito informe de prácticas preprofesionales",
+    "Solicito licencia de estudios por el semestre {anio}-II",
+    "Presento recurso de reconsideración contra resolución directoral",
+]
+OBSERVACIONES = ["Conforme, se deriva para continuar el trámite.", "Revisado. Procede.", "Se adjunta informe favorable.",
+                 "Visto bueno del área.", "Cumple con los requisitos del TUPA."]
+MOTIVOS_OBSERVACION = ["Falta copia legible del DNI.", "El recibo de pago no corresponde al trámite.",
+                       "Debe adjuntar constancia de no adeudo.", "Firma del solicitante ilegible."]
+
+# Feriados nacionales de fecha fija (Perú)
+FERIADOS_FIJOS = [
+    (1, 1, "Año Nuevo"), (5, 1, "Día del Trabajo"), (6, 7, "Batalla de Arica y Día de la Bandera"),
+    (6, 29, "San Pedro y San Pablo"), (7, 23, "Día de la Fuerza Aérea"), (7, 28, "Fiestas Patrias"),
+    (7, 29, "Fiestas Patrias"), (8, 6, "Batalla de Junín"), (8, 30, "Santa Rosa de Lima"),
+    (10, 8, "Combate de Angamos"), (11, 1, "Todos los Santos"), (12, 8, "Inmaculada Concepción"),
+    (12, 9, "Batalla de Ayacucho"), (12, 25, "Navidad"),
+]
+
+
+@contextmanager
+def _fechas_manuales(*modelos):
+    """Desactiva auto_now_add mientras se insertan filas con fechas históricas."""
+    campos = [f for m in modelos for f in m._meta.concrete_fields if getattr(f, 'auto_now_add', False)]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+def generar_feriados(anios):
+    filas = [DiaFeriado(fecha=date(anio, mes, dia), descripcion=desc) for anio in anios for mes, dia, desc in FERIADOS_FIJOS]
+    creados = len(DiaFeriado.objects.bulk_create(filas, ignore_conflicts=True))
+    invalidar_espacio('feriados') # bulk_create no dispara señales
+    return creados
+
+
+class Generador:
+    def __init__(self, semilla, ahora, anios, proporcion_abiertos=0.15):
+        self.rng = random.Random(semilla)
+        self.ahora = ahora
+        self.inicio = ahora - timedelta(days=365 * anios)
+        self.proporcion_abiertos = proporcion_abiertos
+
+        self.perfiles_por_rol = {}
+        for perfil in PerfilUsuario.objects.filter(rol__isnull=False).order_by('id'):
+            self.perfiles_por_rol.setdefault(perfil.rol_id, []).append(perfil.pk)
+        todos = [pk for pks in self.perfiles_por_rol.values() for pk in pks]
+
+        self.rutas = {}
+        for paso in PasoFlujo.objects.order_by('procedimiento_id', 'orden'):
+            self.rutas.setdefault(paso.procedimiento_id, []).append(paso)
+        # Solo procedimientos cuya ruta completa tiene a alguien asignado
+        self.procedimientos = [
+            proc_id for proc_id, pasos in self.rutas.items()
+            if all(p.rol_responsable_id in self.perfiles_por_rol for p in pasos)
+        ]
+        if not self.procedimientos or not todos:
+            raise ValueError("No hay procedimientos con ruta y perfiles asignados. Ejecute cargar_datos_mpi.py primero.")
+        self.todos = todos
+        self.nombres = dict(Procedimiento.objects.values_list('id', 'nombre'))
+
+        # Directorio de remitentes: unos pocos ciudadanos concentran varios trámites
+        self.remitentes = []
+
+    def _remitente(self):
+        rng = self.rng
+        if self.remitentes and rng.random() < 0.4:
+            return rng.choice(self.remitentes)
+        if rng.random() < 0.1:
+            remitente = ('PJ', "20" + "".join(rng.choices(string.digits, k=9)),
+                         f"{rng.choice(EMPRESAS)} {rng.choice(APELLIDOS)} S.A.C.")
+        else:
+            remitente = ('PN', "".join(rng.choices(string.digits, k=8)),
+                         f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}")
+        self.remitentes.append(remitente)
+        return remitente
+
+    def _perfil(self, paso):
+        return self.rng.choice(self.perfiles_por_rol[paso.rol_responsable_id])
+
+    def _avanzar(self, fecha, horas_max=40):
+        """Siguiente momento del trámite (en horario de oficina)."""
+        fecha += timedelta(hours=self.rng.uniform(0.5, horas_max))
+        if fecha.hour >= 17 or fecha.hour < 8:
+            fecha = (fecha + timedelta(days=1 if fecha.hour >= 17 else 0)).replace(hour=8, minute=self.rng.randint(0, 59))
+        return fecha
+
+    def expediente(self):
+        """Un Documento (sin guardar) y la lista de sus movimientos / notificaciones como tuplas."""
+        rng = self.rng
+        proc_id = rng.choice(self.procedimientos)
+        ruta = self.rutas[proc_id]
+        tipo_rem, ident, nombre = self._remitente()
+
+        abierto = rng.random() < self.proporcion_abiertos
+        if abierto:
+            ingreso = self.ahora - timedelta(days=rng.uniform(0, 30))
+        else:
+            ingreso = self.inicio + timedelta(seconds=rng.uniform(0, (self.ahora - self.inicio).total_seconds() - 40 * 86400))
+        ingreso = ingreso.replace(hour=rng.randint(8, 16), minute=rng.randint(0, 59))
+
+        # Hasta qué paso llega (los abiertos se quedan a medio camino)
+        ultimo = rng.randint(1, len(ruta)) if abierto else len(ruta)
+
+        movimientos, avisos = [], [] # (fecha, origen, destino, paso, tipo, obs)
+        fecha = ingreso
+        mesa = self._perfil(ruta[0])
+        movimientos.append((fecha, mesa, mesa, 1, 'inicio', f"Creación/Recepción de expediente: {self.nombres[proc_id]}"))
+        actual = mesa
+        for paso in ruta[1:ultimo]:
+            # Observación: vuelve al responsable anterior y luego se corrige
+            if rng.random() < 0.08:
+                fecha = self._avanzar(fecha)
+                movimientos.append((fecha, actual, mesa, paso.orden - 1, 'observacion', rng.choice(MOTIVOS_OBSERVACION)))
+                fecha = self._avanzar(fecha, horas_max=120)
+                movimientos.append((fecha, mesa, actual, paso.orden - 1, 'derivacion', "Subsanado por el administrado."))
+            if rng.random() < 0.05:
+                fecha = self._avanzar(fecha)
+                destino = rng.choice(self.todos)
+                movimientos.append((fecha, actual, destino, paso.orden, 'derivacion', f"[DESVÍO DE RUTA] {rng.choice(OBSERVACIONES)}"))
+                avisos.append((fecha, destino))
+                actual = destino
+            fecha = self._avanzar(fecha)
+            destino = self._perfil(paso)
+            movimientos.append((fecha, actual, destino, paso.orden, 'derivacion', rng.choice(OBSERVACIONES)))
+            avisos.append((fecha, destino))
+            actual = destino
+
+        doc = Documento(
+            procedimiento_id=proc_id,
+            asunto=rng.choice(ASUNTOS).format(anio=ingreso.year), fecha_ingreso=ingreso,
+            paso_actual=ultimo, remitente=nombre, tipo_remitente=tipo_rem, identificador_remitente=ident,
+            clave_seguridad="".join(rng.choices(string.ascii_uppercase + string.digits, k=6)),
+        )
+        if abierto:
+            doc.responsable_actual_id = actual
+            doc.estado = rng.choices(['en_proceso', 'observado', 'externo'], weights=[85, 10, 5])[0]
+            # Vencimiento del paso: repartido entre vencidos, por vencer y a tiempo
+            doc.fecha_limite_paso_actual = self.ahora + timedelta(hours=rng.uniform(-72, 120))
+            doc.fecha_limite_total = ingreso + timedelta(days=rng.randint(10, 30))
+            if doc.estado == 'externo':
+                movimientos.append((self._avanzar(fecha), actual, None, ultimo, 'externo', "Enviado a MINEDU para registro."))
+        else:
+            fecha = self._avanzar(fecha)
+            anulado = rng.random() < 0.03
+            doc.estado = 'archivado' if anulado else 'atendido'
+            doc.fecha_limite_total = ingreso + timedelta(days=rng.randint(10, 30))
+            movimientos.append((fecha, actual, None, ultimo, 'anulacion' if anulado else 'finalizacion',
+                                "Expediente anulado a pedido del administrado." if anulado else "Trámite atendido."))
+        return doc, movimientos, avisos, abierto
+
+
+def _siguiente_bloque_correlativo(anio, cantidad):
+    """Reserva 'cantidad' números de expediente del año (no choca con los reales)."""
+    Correlativo.objects.get_or_create(anio=anio, tipo='EXPEDIENTE', defaults={'ultimo_numero': 0})
+    contador = Correlativo.objects.filter(anio=anio, tipo='EXPEDIENTE')
+    contador.update(ultimo_numero=F('ultimo_numero') + cantidad)
+    return contador.values_list('ultimo_numero', flat=True).get() - cantidad
+
+
+def generar(documentos, semilla=42, anios=3, lote=5000, ahora=None, progreso=None):
+    """
+    Inserta 'documentos' expedientes sintéticos con sus movimientos y notificaciones.
+    Devuelve {'documentos': n, 'movimientos': n, 'notificaciones': n, 'feriados': n}.
+    """
+    ahora = ahora or timezone.now()
+    ahora = timezone.make_aware(datetime.combine(timezone.localdate(ahora), time(12))) # Mismo "hoy" en todo el día
+    generador = Generador(semilla, ahora, anios)
+    totales = {'documentos': 0, 'movimientos': 0, 'notificaciones': 0}
+    totales['feriados'] = generar_feriados(range(generador.inicio.year, ahora.year + 2))
+
+    with _fechas_manuales(Documento, Movimiento, Notificacion):
+        while totales['documentos'] < documentos:
+            cantidad = min(lote, documentos - totales['documentos'])
+            with transaction.atomic():
+                # Se numeran por año de ingreso (EXP-2024-00123), igual que en producción
+                generados = [generador.expediente() for _ in range(cantidad)]
+                por_anio = {}
+                for doc, *_ in generados:
+                    por_anio.setdefault(doc.fecha_ingreso.year, []).append(doc)
+                for anio, docs_anio in por_anio.items():
+                    base = _siguiente_bloque_correlativo(anio, len(docs_anio))
+                    for i, doc in enumerate(sorted(docs_anio, key=lambda d: d.fecha_ingreso), 1):
+                        doc.expediente_id = f"EXP-{anio}-{base + i:04d}"
+
+                docs = Documento.objects.bulk_create([g[0] for g in generados], batch_size=1000)
+
+                movimientos, notificaciones = [], []
+                for doc, (_, historia, avisos, abierto) in zip(docs, generados):
+                    enlace = f"/documentos/{doc.expediente_id}/"
+                    for fecha, origen, destino, paso, tipo, obs in historia:
+                        movimientos.append(Movimiento(
+                            documento_id=doc.pk, fecha_movimiento=fecha, usuario_origen_id=origen,
+                            unidad_destino_id=destino, paso_flujo=paso, tipo=tipo,
+                            observaciones=obs,
+                        ))
+                    for i, (fecha, destino) in enumerate(avisos):
+                        pendiente = abierto and i == len(avisos) - 1 # Solo el último aviso de un abierto sigue sin leer
+                        notificaciones.append(Notificacion(
+                            destinatario_id=destino, mensaje=f"Expediente recibido: {doc.expediente_id}",
+                            enlace=enlace, leida=not pendiente, fecha_creacion=fecha,
+                        ))
+                Movimiento.objects.bulk_create(movimientos, batch_size=2000)
+                Notificacion.objects.bulk_create(notificaciones, batch_size=2000)
+
+            totales['documentos'] += len(docs)
+            totales['movimientos'] += len(movimientos)
+            totales['notificaciones'] += len(notificaciones)
+            if progreso:
+                progreso(totales)
+    return totales
@@ -0,0 +1,29 @@
+# gestion/ejecutor_pruebas.py
+"""
+Ejecutor de 'manage.py test' (settings.TEST_RUNNER).
+
+Aplica la configuración propia de las pruebas de forma explícita, en vez de que
+settings.py adivine por sys.argv si está corriendo la suite:
+  - NMAS1_MODO = NMAS1_MODO_PRUEBAS ('fallar': una consulta N+1 hace fallar la prueba),
+  - el logger 'gestion' en LOG_LEVEL_PRUEBAS (WARNING: sin una línea por petición).
+"""
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class EjecutorPruebas(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._ajustes = override_settings(NMAS1_MODO=settings.NMAS1_MODO_PRUEBAS)
+        self._ajustes.enable()
+        logger = logging.getLogger('gestion')
+        self._nivel_log = logger.level
+        logger.setLevel(settings.LOG_LEVEL_PRUEBAS)
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger('gestion').setLevel(self._nivel_log)
+        self._ajustes.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,337 @@
+# gestion/flujo.py
+"""
+Servicio de transiciones del flujo documentario.
+
+Cada acción sobre un expediente (derivar, observar, asignar, etc.) se aplica en una
+sola transacción corta:
+  1. UPDATE condicional del documento: solo las columnas que cambian y solo si
+     sigue en poder del mismo usuario y en el mismo paso (concurrencia optimista).
+  2. INSERT del Movimiento y de la Notificación.
+No se toman bloqueos antes de la transacción ni se mantienen mientras se renderiza.
+"""
+import heapq
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from . import metricas
+from .cache import cacheado, invalidar_consultas
+from .models import Correlativo, Documento, Movimiento, Notificacion, PasoFlujo, PerfilUsuario
+
+logger = logging.getLogger('gestion.flujo')
+
+class TransicionConcurrente(Exception):
+    """El expediente cambió de manos (u otro paso) mientras se procesaba."""
+
+
+def enlace_documento(doc):
+    return f"/documentos/{doc.expediente_id}/"
+
+
+def transicion(doc, usuario, cambios, tipo, observaciones, destino=None, archivo=None, aviso=None, accion=None):
+    """
+    Aplica 'cambios' (dict campo -> valor) al documento y registra el movimiento.
+
+    - usuario: PerfilUsuario que ejecuta la acción (debe ser el responsable actual).
+    - destino: PerfilUsuario que recibe (None para salidas externas o finalización).
+    - aviso: texto de la Notificación para 'destino' (None = no notificar).
+    - accion: nombre de la acción del formulario, para las métricas (por defecto 'tipo').
+
+    Lanza TransicionConcurrente si otro usuario ya procesó el expediente.
+    """
+    accion = accion or tipo
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        filas = Documento.objects.filter(
+            pk=doc.pk,
+            responsable_actual=usuario,
+            paso_actual=doc.paso_actual,
+        ).update(**cambios)
+        if filas == 0:
+            metricas.incrementar('sgd_acciones_flujo_total', accion=accion, resultado='concurrente')
+            raise TransicionConcurrente(doc.expediente_id)
+
+        # Reflejamos los cambios en el objeto en memoria (sin volver a leerlo)
+        for campo, valor in cambios.items():
+            setattr(doc, campo, valor)
+
+        movimiento = Movimiento.objects.create(
+            documento=doc,
+            usuario_origen=usuario,
+            unidad_destino=destino,
+            tipo=tipo,
+            paso_flujo=doc.paso_actual,
+            observaciones=observaciones,
+            archivo_adjunto=archivo
+        )
+
+        if aviso and destino:
+            Notificacion.objects.create(destinatario=destino, mensaje=aviso, enlace=enlace_documento(doc))
+
+    metricas.incrementar('sgd_acciones_flujo_total', accion=accion, resultado='ok')
+    metricas.observar('sgd_accion_flujo_duracion_segundos', time.perf_counter() - inicio, accion=accion)
+    return movimiento
+
+
+def pasos_de(procedimiento_id):
+    """Ruta TUPA del procedimiento (pasos ordenados, con su rol), desde la caché compartida."""
+    return cacheado('flujo', f"pasos:{procedimiento_id}", lambda: list(
+        PasoFlujo.objects.filter(procedimiento_id=procedimiento_id).select_related('rol_responsable').order_by('orden')
+    ))
+
+
+def obtener_paso(procedimiento_id, orden):
+    """Como PasoFlujo.objects.get(...): lanza PasoFlujo.DoesNotExist si no existe."""
+    for paso in pasos_de(procedimiento_id):
+        if paso.orden == orden:
+            return paso
+    raise PasoFlujo.DoesNotExist(f"El procedimiento {procedimiento_id} no tiene paso {orden}")
+
+
+def siguiente_numero(tipo, anio):
+    """
+    Incrementa el correlativo (tipo, año) de forma atómica y devuelve el nuevo número.
+    El UPDATE ... SET ultimo_numero = ultimo_numero + 1 lo hace la BD, así dos usuarios
+    generando resoluciones a la vez nunca obtienen el mismo número.
+    """
+    with transaction.atomic():
+        Correlativo.objects.get_or_create(anio=anio, tipo=tipo, defaults={'ultimo_numero': 0})
+        contador = Correlativo.objects.filter(anio=anio, tipo=tipo)
+        contador.update(ultimo_numero=F('ultimo_numero') + 1)
+        return contador.values_list('ultimo_numero', flat=True).get()
+
+
+def liberar_numero(tipo, anio, numero):
+    """
+    Devuelve un número reservado con siguiente_numero() que al final no se usó.
+    Solo retrocede el contador si nadie tomó uno posterior (UPDATE condicional);
+    si ya lo hicieron, el número queda anulado y se registra en el log para que
+    el hueco en la numeración quede justificado. Devuelve True si se liberó.
+    """
+    liberado = Correlativo.objects.filter(anio=anio, tipo=tipo, ultimo_numero=numero).update(
+        ultimo_numero=F('ultimo_numero') - 1
+    )
+    if not liberado:
+        logger.warning("Correlativo %s N° %s de %s anulado: se reservó y no se llegó a usar", tipo, numero, anio)
+    return bool(liberado)
+
+
+# --- TRANSICIONES MASIVAS (BANDEJA) ---
+
+ACCIONES_MASIVAS = {
+    'derivar': "Derivar al siguiente paso (TUPA)",
+    'asignar_interno': "Asignar a mi equipo",
+    'redireccionar': "Redireccionar a otra área",
+}
+
+
+def es_flujo_libre(procedimiento):
+    return "GEN" in procedimiento.codigo or "No TUPA" in procedimiento.nombre
+
+
+def _plan_derivacion(docs):
+    """
+    Decide, para cada documento, su destino según la ruta TUPA.
+    Devuelve {doc_id: destino} (destino=None significa finalizar) y la lista de omitidos.
+    Los trámites libres y los pasos de Resolución (requieren PDF) se procesan uno por uno.
+    """
+    pasos = {
+        (p.procedimiento_id, p.orden): p
+        for p in PasoFlujo.objects.filter(procedimiento_id__in={d.procedimiento_id for d in docs}).select_related('rol_responsable')
+    }
+
+    # Primer usuario de cada rol (igual que rol.perfilusuario_set.first())
+    primero_por_rol = {}
+    roles = {p.rol_responsable_id for p in pasos.values()}
+    for perfil in PerfilUsuario.objects.filter(rol_id__in=roles).order_by('id'):
+        primero_por_rol.setdefault(perfil.rol_id, perfil)
+
+    plan, omitidos = {}, []
+    for doc in docs:
+        actual = pasos.get((doc.procedimiento_id, doc.paso_actual))
+        if es_flujo_libre(doc.procedimiento) or (actual and "Resolución" in actual.descripcion):
+            omitidos.append(doc)
+            continue
+
+        siguiente = pasos.get((doc.procedimiento_id, doc.paso_actual + 1))
+        if siguiente is None:
+            plan[doc.pk] = None # Último paso: se finaliza
+        elif siguiente.rol_responsable_id in primero_por_rol:
+            plan[doc.pk] = primero_por_rol[siguiente.rol_responsable_id]
+        else:
+            omitidos.append(doc) # Nadie tiene el rol del siguiente paso
+    return plan, omitidos
+
+
+def transicion_masiva(ids, usuario, accion, observaciones, destino=None, fecha_limite=None):
+    """
+    Aplica la misma acción a varios expedientes de la bandeja de 'usuario'.
+
+    Todo ocurre en una transacción: los cambios de estado se agrupan en pocos UPDATE
+    (uno por destino) y los Movimientos/Notificaciones se insertan con bulk_create.
+    - accion: 'derivar' (ruta TUPA), 'asignar_interno' o 'redireccionar' (ambas a 'destino').
+    - fecha_limite: vencimiento del nuevo paso al derivar.
+    Devuelve (procesados, omitidos): listas de expediente_id.
+    """
+    if accion not in ACCIONES_MASIVAS:
+        raise ValueError(f"Acción masiva no soportada: {accion}")
+
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        # Bloqueamos solo los documentos que siguen en poder del usuario
+        docs = list(
+            Documento.objects.select_for_update(of=('self',))
+            .filter(pk__in=ids, responsable_actual=usuario)
+            .select_related('procedimiento')
+            .order_by()
+        )
+
+        omitidos = []
+        if accion == 'derivar':
+            plan, omitidos = _plan_derivacion(docs)
+        else:
+            plan = {doc.pk: destino for doc in docs}
+
+        # 1. UPDATEs agrupados por destino
+        por_destino = {}
+        for doc_id, dest in plan.items():
+            por_destino.setdefault(dest, []).append(doc_id)
+
+        for dest, doc_ids in por_destino.items():
+            qs = Documento.objects.filter(pk__in=doc_ids)
+            if accion != 'derivar':
+                qs.update(responsable_actual=dest)
+            elif dest is None:
+                qs.update(estado='atendido', responsable_actual=None, fecha_limite_paso_actual=None)
+            else:
+                qs.update(
+                    responsable_actual=dest,
+                    paso_actual=F('paso_actual') + 1,
+                    estado='en_proceso',
+                    fecha_limite_paso_actual=fecha_limite
+                )
+
+        # 2. INSERTs en lote
+        tipo_mov = {'asignar_interno': 'asignacion_interna', 'redireccionar': 'redireccion'}
+        prefijo = {'asignar_interno': "ASIGNACIÓN INTERNA: ", 'redireccionar': "REDIRECCIÓN MANUAL: "}
+        aviso = {
+            'derivar': "Expediente recibido: {}",
+            'asignar_interno': "Tarea asignada por Jefatura: {}",
+            'redireccionar': "Documento redireccionado hacia ti: {}",
+        }
+
+        movimientos, notificaciones, procesados = [], [], []
+        for doc in docs:
+            if doc.pk not in plan:
+                continue
+            dest = plan[doc.pk]
+            if accion == 'derivar':
+                tipo = 'derivacion' if dest else 'finalizacion'
+                paso = doc.paso_actual + 1 if dest else doc.paso_actual
+            else:
+                tipo, paso = tipo_mov[accion], doc.paso_actual
+
+            movimientos.append(Movimiento(
+                documento=doc, usuario_origen=usuario, unidad_destino=dest, tipo=tipo,
+                paso_flujo=paso, observaciones=prefijo.get(accion, "") + observaciones
+            ))
+            if dest:
+                notificaciones.append(Notificacion(
+                    destinatario=dest, mensaje=aviso[accion].format(doc.expediente_id), enlace=enlace_documento(doc)
+                ))
+            procesados.append(doc.expediente_id)
+
+        Movimiento.objects.bulk_create(movimientos, batch_size=500)
+        Notificacion.objects.bulk_create(notificaciones, batch_size=500)
+
+        # bulk_create/update no disparan señales: invalidamos la consulta pública a mano
+        remitentes = {doc.identificador_remitente for doc in docs if doc.pk in plan}
+        transaction.on_commit(lambda: invalidar_consultas(procesados, remitentes))
+
+    # Los que ya no estaban en la bandeja del usuario también cuentan como omitidos
+    etiqueta = f'{accion}_masivo'
+    metricas.incrementar('sgd_acciones_flujo_total', len(procesados), accion=etiqueta, resultado='ok')
+    metricas.incrementar('sgd_acciones_flujo_total', len(set(ids)) - len(procesados), accion=etiqueta, resultado='omitido')
+    metricas.observar('sgd_accion_flujo_duracion_segundos', time.perf_counter() - inicio, accion=etiqueta)
+    return procesados, [d.expediente_id for d in omitidos]
+
+
+# --- TRASPASO DE BANDEJA (BAJA / LICENCIA DE PERSONAL) ---
+
+ESTADOS_ABIERTOS = ('en_proceso', 'observado', 'externo')
+
+
+def traspasar_bandeja(origen, destinos, motivo, lote=500):
+    """
+    Mueve todos los expedientes abiertos de 'origen' a los perfiles 'destinos',
+    repartiéndolos según la carga actual de cada uno (cada expediente va al menos cargado).
+
+    Trabaja por lotes de 'lote' expedientes, cada uno en su propia transacción,
+    con un UPDATE por destino y los Movimientos de auditoría en bulk_create.
+    Devuelve {destino: cantidad_recibida}.
+    """
+    destinos = [d for d in destinos if d.pk != origen.pk]
+    if not destinos:
+        raise ValueError("Debe indicar al menos un perfil de destino distinto del origen.")
+
+    # Carga inicial de cada destino (una consulta agrupada)
+    carga = dict(
+        Documento.objects.filter(responsable_actual__in=destinos, estado__in=ESTADOS_ABIERTOS)
+        .values('responsable_actual').annotate(total=Count('id')).values_list('responsable_actual', 'total')
+    )
+    monticulo = [(carga.get(d.pk, 0), d.pk) for d in destinos]
+    heapq.heapify(monticulo)
+    por_id = {d.pk: d for d in destinos}
+    recibidos = {d: 0 for d in destinos}
+
+    while True:
+        with transaction.atomic():
+            pendientes = list(
+                Documento.objects.select_for_update()
+                .filter(responsable_actual=origen, estado__in=ESTADOS_ABIERTOS)
+                .order_by('id')
+                .values_list('id', 'expediente_id', 'paso_actual', 'identificador_remitente')[:lote]
+            )
+            if not pendientes:
+                break
+
+            asignacion = {} # destino_id -> [ids]
+            movimientos = []
+            for doc_id, expediente_id, paso, _ in pendientes:
+                total, destino_id = heapq.heappop(monticulo)
+                heapq.heappush(monticulo, (total + 1, destino_id))
+                asignacion.setdefault(destino_id, []).append(doc_id)
+                movimientos.append(Movimiento(
+                    documento_id=doc_id, usuario_origen=origen, unidad_destino_id=destino_id,
+                    tipo='redireccion', paso_flujo=paso, observaciones=f"TRASPASO DE BANDEJA: {motivo}"
+                ))
+
+            for destino_id, ids in asignacion.items():
+                Documento.objects.filter(pk__in=ids).update(responsable_actual_id=destino_id)
+                recibidos[por_id[destino_id]] += len(ids)
+            Movimiento.objects.bulk_create(movimientos, batch_size=lote)
+
+            expedientes = [fila[1] for fila in pendientes]
+            remitentes = {fila[3] for fila in pendientes}
+            transaction.on_commit(lambda exps=expedientes, rems=remitentes: invalidar_consultas(exps, rems))
+
+    # Un solo aviso por destino (no uno por expediente)
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            destinatario=destino,
+            mensaje=f"Se le traspasaron {cantidad} expediente(s) de {origen.usuario.get_full_name() or origen.usuario.username}",
+            enlace="/documentos/"
+        )
+        for destino, cantidad in recibidos.items() if cantidad
+    ])
+    return recibidos
+
+
+def destinos_por_defecto(origen):
+    """Compañeros activos con el mismo rol (para traspasos sin destino explícito)."""
+    return list(
+        PerfilUsuario.objects.filter(rol=origen.rol, rol__isnull=False, usuario__is_active=True)
+        .exclude(pk=origen.pk).select_related('usuario')
+    )
@@ -16,7 +16,9 @@ def validar_archivo(archivo):
 from django import forms
 from .models import Documento, Procedimiento, PerfilUsuario
 from django.core.exceptions import ValidationError
-from django.db.models import Q # <--- Importante para el filtro
+from .permisos import capacidades
+from .cache import cacheado
+from .flujo import ACCIONES_MASIVAS
 
 def validar_archivo(archivo):
     limite_mb = 5
@@ -25,6 +27,10 @@ def validar_archivo(archivo):
     if not archivo.name.lower().endswith(('.pdf', '.jpg', '.jpeg', '.png')):
         raise ValidationError("Formato no soportado. Solo se permiten PDF, JPG o PNG.")
 
+def opciones_procedimiento():
+    """[(id, 'código - nombre')] de todos los procedimientos (cambian solo al editar el TUPA)."""
+    return cacheado('procedimientos', 'opciones', lambda: [(p.pk, str(p)) for p in Procedimiento.objects.order_by('id')])
+
 class DocumentoForm(forms.ModelForm):
     procedimiento = forms.ModelChoiceField(
         queryset=Procedimiento.objects.all(),
@@ -44,7 +50,7 @@ class DocumentoForm(forms.ModelForm):
     ) 
 
     destino_manual = forms.ModelChoiceField(
-        queryset=PerfilUsuario.objects.filter(usuario__is_active=True),
+        queryset=PerfilUsuario.objects.filter(usuario__is_active=True).select_related('usuario'),
         label="Derivar a (Área Destino)",
         required=False, 
         widget=forms.Select(attrs={'class': 'form-select', 'id': 'id_destino_manual'}),
@@ -70,7 +76,7 @@ class DocumentoForm(forms.ModelForm):
     identificador_remitente = forms.CharField(
         label="DNI o RUC",
         required=False, 
-        widget=forms.TextInput(attrs={'class': 'form-control', 'id': 'id_identificador_remitente'})
+        widget=forms.TextInput(attrs={'class': 'form-control', 'id': 'id_identificador_remitente', 'list': 'listaRemitentes', 'autocomplete': 'off'})
     )
     
     archivo_adjunto = forms.FileField(
@@ -97,16 +103,21 @@ class DocumentoForm(forms.ModelForm):
         super(DocumentoForm, self).__init__(*args, **kwargs)
         
         # 3. Usamos la variable 'user' que extrajimos
+        iniciables = None
         if user:
             try:
-                user_rol = user.perfilusuario.rol
-                # Filtro de trámites por rol
-                self.fields['procedimiento'].queryset = Procedimiento.objects.filter(
-                    Q(roles_inician=user_rol) | Q(roles_inician__isnull=True)
-                ).distinct()
-            except:
+                # Filtro de trámites por rol (precalculado en la matriz de permisos, sin JOIN ni DISTINCT)
+                iniciables = capacidades(user.perfilusuario).procedimientos
+                self.fields['procedimiento'].queryset = Procedimiento.objects.filter(id__in=iniciables)
+            except PerfilUsuario.DoesNotExist:
                 pass # Si no tiene perfil, mostramos todo (seguridad por defecto)
 
+        # Las opciones del select salen de la caché; el queryset solo valida lo elegido
+        campo = self.fields['procedimiento']
+        campo.choices = [('', campo.empty_label)] + [
+            (pk, etiqueta) for pk, etiqueta in opciones_procedimiento() if iniciables is None or pk in iniciables
+        ]
+
         # Mejoramos la etiqueta del selector de destinos
         self.fields['destino_manual'].label_from_instance = lambda obj: f"{obj.unidad_organizativa} ({obj.usuario.get_full_name() or obj.usuario.username})"
 
@@ -165,7 +176,7 @@ class DerivacionForm(forms.Form):
 
     # Selector de destino (Para trámites libres O desvíos forzados)
     destino_libre = forms.ModelChoiceField(
-        queryset=PerfilUsuario.objects.filter(usuario__is_active=True),
+        queryset=PerfilUsuario.objects.filter(usuario__is_active=True).select_related('usuario'),
         label="Derivar a (Siguiente Área)",
         required=False,
         widget=forms.Select(attrs={'class': 'form-select', 'id': 'selectDestinoManual'}), # ID IMPORTANTE
@@ -200,7 +211,7 @@ class DerivacionForm(forms.Form):
                     subordinados = PerfilUsuario.objects.filter(
                         unidad_organizativa=unidad_jefe,
                         usuario__is_active=True
-                    ).exclude(id=user.perfilusuario.id)
+                    ).exclude(id=user.perfilusuario.id).select_related('usuario')
                     
                     self.fields['responsable_interno'].queryset = subordinados
                     self.fields['responsable_interno'].label_from_instance = lambda obj: obj.usuario.get_full_name() or obj.usuario.username
@@ -223,7 +234,7 @@ class AtenderForm(forms.Form):
 
 class RedireccionForm(forms.Form):
     responsable_destino = forms.ModelChoiceField(
-        queryset=PerfilUsuario.objects.all(),
+        queryset=PerfilUsuario.objects.select_related('usuario', 'rol'), # __str__ usa ambos
         label="Redireccionar a (Selección Manual)",
         widget=forms.Select(attrs={'class': 'form-select'}),
         help_text="Úselo solo si el documento llegó a su área por error."
@@ -269,3 +280,45 @@ class EditarPerfilForm(forms.Form):
             # Pre-llenamos solo el celular
             self.fields['celular'].initial = user.perfilusuario.celular
 
+
+
+class AccionMasivaForm(forms.Form):
+    """Acción sobre varios expedientes seleccionados en la bandeja."""
+    accion = forms.ChoiceField(
+        label="Acción",
+        choices=[('', '-- Acción masiva --')] + list(ACCIONES_MASIVAS.items()),
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm', 'id': 'id_accion_masiva'})
+    )
+    destino = forms.ModelChoiceField(
+        queryset=PerfilUsuario.objects.filter(usuario__is_active=True).select_related('usuario'),
+        label="Destino",
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm', 'id': 'id_destino_masivo'}),
+        empty_label="-- Destino (asignar / redireccionar) --"
+    )
+    observaciones = forms.CharField(
+        label="Observaciones",
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Observaciones / Instrucciones'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.perfil = kwargs.pop('perfil', None)
+        super(AccionMasivaForm, self).__init__(*args, **kwargs)
+        self.fields['destino'].label_from_instance = lambda obj: f"{obj.unidad_organizativa} ({obj.usuario.get_full_name() or obj.usuario.username})"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        accion = cleaned_data.get('accion')
+        destino = cleaned_data.get('destino')
+
+        if accion in ('asignar_interno', 'redireccionar'):
+            if not destino:
+                self.add_error('destino', 'Seleccione a quién enviar los expedientes.')
+            elif self.perfil and destino.pk == self.perfil.pk:
+                self.add_error('destino', 'El destino no puede ser usted mismo.')
+
+        # Asignación interna: solo Jefes y solo dentro de su misma unidad
+        if accion == 'asignar_interno' and destino and self.perfil:
+            if not (self.perfil.rol and self.perfil.rol.es_jefe) or destino.unidad_organizativa != self.perfil.unidad_organizativa:
+                self.add_error('destino', 'Solo un Jefe puede asignar, y solo a miembros de su unidad.')
+        return cleaned_data
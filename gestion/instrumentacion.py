@@ -0,0 +1,148 @@
+# gestion/instrumentacion.py
+"""
+Medición por petición: consultas SQL, tiempo de BD, de plantillas y de la vista.
+
+InstrumentacionMiddleware (middleware.py) abre una Medicion por petición y al final:
+  - agrega la cabecera Server-Timing (visible en la pestaña Red del navegador),
+  - en las peticiones muestreadas, escribe una línea JSON en el logger 'gestion.peticiones',
+  - si la petición superó INSTRUMENTACION_UMBRAL_LENTO_MS, la registra como WARNING
+    con las consultas SQL más lentas.
+
+Solo una fracción de las peticiones (INSTRUMENTACION_MUESTREO) se mide en detalle
+(SQL y plantillas); el resto solo mide el tiempo total, así el costo con el
+muestreo en 0 es el de un par de llamadas a perf_counter (más la línea de las lentas).
+El tiempo de plantillas lo mide el backend DjangoTemplatesMedidas (settings.TEMPLATES).
+"""
+import heapq
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger('gestion.peticiones')
+
+# Medición de la petición en curso (None fuera de una petición o si no está muestreada)
+medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    def __init__(self, detallada, sql_lentas=5):
+        self.detallada = detallada
+        self.inicio = time.perf_counter()
+        self.total_ms = 0.0
+        self.vista_ms = 0.0
+        self.db_ms = 0.0
+        self.plantillas_ms = 0.0
+        self.consultas = 0
+        self._max_lentas = sql_lentas
+        self._lentas = [] # min-heap (ms, orden, sql) con las N más lentas
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: cuenta y cronometra cada consulta."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            self.db_ms += ms
+            self.consultas += 1
+            entrada = (ms, self.consultas, sql)
+            if len(self._lentas) < self._max_lentas:
+                heapq.heappush(self._lentas, entrada)
+            elif ms > self._lentas[0][0]:
+                heapq.heapreplace(self._lentas, entrada)
+
+    def terminar(self):
+        self.total_ms = (time.perf_counter() - self.inicio) * 1000
+
+    def sql_lentas(self):
+        return [{'ms': round(ms, 2), 'sql': sql[:500]} for ms, _, sql in sorted(self._lentas, reverse=True)]
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing."""
+        metricas = [f'total;dur={self.total_ms:.1f}', f'vista;dur={self.vista_ms:.1f}']
+        if self.detallada:
+            metricas += [
+                f'db;dur={self.db_ms:.1f};desc="{self.consultas} consultas"',
+                f'tpl;dur={self.plantillas_ms:.1f}',
+            ]
+        return ", ".join(metricas)
+
+    def registro(self, request, response):
+        """Campos de la línea de log estructurada."""
+        coincidencia = getattr(request, 'resolver_match', None)
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': coincidencia.url_name if coincidencia else None,
+            'estado': response.status_code,
+            'usuario': request.user.pk if getattr(request, 'user', None) and request.user.is_authenticated else None,
+            'total_ms': round(self.total_ms, 1),
+            'vista_ms': round(self.vista_ms, 1),
+        }
+        if self.detallada:
+            datos.update({
+                'consultas': self.consultas,
+                'db_ms': round(self.db_ms, 1),
+                'tpl_ms': round(self.plantillas_ms, 1),
+            })
+        return datos
+
+
+def iniciar_medicion():
+    """Crea la Medicion de la petición, muestreando según la configuración."""
+    muestreo = getattr(settings, 'INSTRUMENTACION_MUESTREO', 0.0)
+    detallada = muestreo >= 1 or (muestreo > 0 and random.random() < muestreo)
+    return Medicion(detallada, getattr(settings, 'INSTRUMENTACION_SQL_LENTAS', 5))
+
+
+def registrar(medicion, request, response):
+    """Escribe la línea de log (WARNING con el SQL más lento si la petición fue lenta)."""
+    datos = medicion.registro(request, response)
+    umbral = getattr(settings, 'INSTRUMENTACION_UMBRAL_LENTO_MS', 1000)
+    if medicion.total_ms >= umbral:
+        if medicion.detallada:
+            datos['sql_lentas'] = medicion.sql_lentas()
+        logger.warning("peticion_lenta %s", json.dumps(datos, ensure_ascii=False))
+    elif medicion.detallada and logger.isEnabledFor(logging.INFO):
+        logger.info("peticion %s", json.dumps(datos, ensure_ascii=False))
+
+
+def mostrar_server_timing(request):
+    """La cabecera se envía en DEBUG, al personal (is_staff) o a todos si así se configura."""
+    if settings.DEBUG or getattr(settings, 'INSTRUMENTACION_SERVER_TIMING_PUBLICO', False):
+        return True
+    usuario = getattr(request, 'user', None)
+    return bool(usuario and usuario.is_authenticated and usuario.is_staff)
+
+
+# --- TIEMPO DE PLANTILLAS ---
+
+class PlantillaMedida(Template):
+    def render(self, context=None, request=None):
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion.plantillas_ms += (time.perf_counter() - inicio) * 1000
+
+
+class DjangoTemplatesMedidas(DjangoTemplates):
+    """Backend de plantillas de Django que suma el tiempo de render a la medición en curso."""
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return PlantillaMedida(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
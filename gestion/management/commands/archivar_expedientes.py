@@ -0,0 +1,23 @@
+# gestion/management/commands/archivar_expedientes.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion.archivo import antiguedad_por_defecto, archivar_expedientes
+
+
+class Command(BaseCommand):
+    help = (
+        "Pasa al archivo histórico los expedientes finalizados sin movimientos en los últimos "
+        "N días (settings.ARCHIVO_ANTIGUEDAD_DIAS). Pensado para ejecutarse periódicamente (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None, help="antigüedad mínima (por defecto ARCHIVO_ANTIGUEDAD_DIAS)")
+        parser.add_argument('--lote', type=int, default=500, help="expedientes por transacción")
+        parser.add_argument('--simular', action='store_true', help="solo cuenta, no mueve nada")
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else antiguedad_por_defecto()
+        total = archivar_expedientes(timezone.now(), antiguedad_dias=dias, lote=options['lote'], simular=options['simular'])
+        accion = "Se archivarían" if options['simular'] else "Archivados"
+        self.stdout.write(self.style.SUCCESS(f"{accion}: {total} expediente(s) con más de {dias} días sin actividad"))
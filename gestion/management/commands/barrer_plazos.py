@@ -0,0 +1,23 @@
+# gestion/management/commands/barrer_plazos.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion.sla import barrer_plazos
+
+
+class Command(BaseCommand):
+    help = (
+        "Avisa de los expedientes por vencer y escala los vencidos al jefe de área. "
+        "Pensado para ejecutarse periódicamente (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="expedientes por transacción")
+        parser.add_argument('--simular', action='store_true', help="solo cuenta, no envía avisos")
+
+    def handle(self, *args, **options):
+        resumen = barrer_plazos(timezone.now(), lote=options['lote'], simular=options['simular'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Vencidos: {resumen['vencidos']} | Por vencer: {resumen['por_vencer']} | "
+            f"Notificaciones: {resumen['notificaciones']}"
+        ))
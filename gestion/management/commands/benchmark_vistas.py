@@ -0,0 +1,116 @@
+# gestion/management/commands/benchmark_vistas.py
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from gestion import benchmark
+
+
+def entorno_cliente():
+    """Cliente de pruebas: host 'testserver', sin límite de tasa y sin enviar correos reales."""
+    return override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        RATELIMIT_ENABLED=False,
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide latencia (p50/p95) y consultas SQL de las vistas principales sobre la BD actual "
+        "(p. ej. tras generar_datos_sinteticos). Con --guardar graba la línea base; sin él, "
+        "falla si alguna vista excede el presupuesto registrado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help="peticiones medidas por vista")
+        parser.add_argument('--usuario', help="username con el que se recorren las vistas (por defecto, la bandeja más cargada)")
+        parser.add_argument('--linea-base', help="archivo JSON (por defecto settings.BENCHMARK_LINEA_BASE)")
+        parser.add_argument('--guardar', action='store_true', help="graba los resultados como nueva línea base")
+        parser.add_argument('--tolerancia', type=float, default=0.25, help="margen sobre el p95 registrado (0.25 = 25%%)")
+        parser.add_argument('--solo', nargs='+', help="medir solo estas vistas")
+        parser.add_argument(
+            '--perfil-produccion', action='store_true',
+            help="compara sin / con PERFIL_PRODUCCION (sesiones y plantillas); por defecto solo la bandeja",
+        )
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            try:
+                perfil = User.objects.get(username=options['usuario']).perfilusuario
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+        else:
+            perfil = benchmark.perfil_por_defecto()
+        if perfil is None:
+            raise CommandError("No hay expedientes abiertos. Genere datos con 'manage.py generar_datos_sinteticos'.")
+
+        if options['perfil_produccion']:
+            return self.comparar_perfiles(perfil, options)
+
+        ruta = Path(options['linea_base']) if options['linea_base'] else benchmark.ruta_linea_base()
+        linea_base = None
+        if not options['guardar']:
+            if not ruta.exists():
+                raise CommandError(f"No existe la línea base {ruta}. Ejecute primero con --guardar.")
+            linea_base = benchmark.leer_linea_base(ruta)
+
+        def progreso(nombre, resultado):
+            if resultado is None:
+                self.stdout.write(self.style.WARNING(f"  {nombre:<30} sin datos para medir (omitida)"))
+                return
+            base = (linea_base or {}).get('vistas', {}).get(nombre)
+            referencia = f"   [base: p95 {base['p95_ms']} ms, {base['consultas']} consultas]" if base else ""
+            self.stdout.write(
+                f"  {nombre:<30} p50 {resultado['p50_ms']:>9.2f} ms   p95 {resultado['p95_ms']:>9.2f} ms   "
+                f"{resultado['consultas']:>4} consultas{referencia}"
+            )
+
+        self.stdout.write(f"Usuario: {perfil.usuario.username} | {options['repeticiones']} peticiones por vista")
+        with entorno_cliente():
+            try:
+                resultados = benchmark.ejecutar(perfil, options['repeticiones'], options['solo'], progreso)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        if options['guardar']:
+            benchmark.guardar_linea_base(resultados, ruta)
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {ruta}"))
+            return
+
+        excedidas = benchmark.comparar(resultados, linea_base, options['tolerancia'])
+        if excedidas:
+            raise CommandError("Presupuesto excedido:\n  " + "\n  ".join(excedidas))
+        self.stdout.write(self.style.SUCCESS("Todas las vistas dentro del presupuesto."))
+
+    def comparar_perfiles(self, perfil, options):
+        self.stdout.write(
+            f"Usuario: {perfil.usuario.username} | {options['repeticiones']} peticiones por vista | "
+            f"sesiones de producción: {settings.SESION_BACKEND_PRODUCCION.rsplit('.', 1)[-1]}"
+        )
+
+        def progreso(etiqueta, nombre, resultado):
+            if resultado:
+                self.stdout.write(
+                    f"  {etiqueta:<8} {nombre:<30} p50 {resultado['p50_ms']:>9.2f} ms   "
+                    f"p95 {resultado['p95_ms']:>9.2f} ms   {resultado['consultas']:>4} consultas"
+                )
+
+        with entorno_cliente():
+            try:
+                resultados = benchmark.comparar_perfiles(
+                    perfil, options['repeticiones'], options['solo'] or ['listar_documentos'], progreso
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        for nombre, antes in resultados['antes'].items():
+            despues = resultados['despues'].get(nombre)
+            if antes and despues:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{nombre}: p50 {antes['p50_ms']:.2f} -> {despues['p50_ms']:.2f} ms, "
+                    f"consultas {antes['consultas']} -> {despues['consultas']}"
+                ))
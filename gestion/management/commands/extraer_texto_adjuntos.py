@@ -0,0 +1,37 @@
+# gestion/management/commands/extraer_texto_adjuntos.py
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+
+from gestion.adjuntos import extraer_texto_documento
+from gestion.models import Documento
+
+
+def _extraer(documento_id):
+    try:
+        extraer_texto_documento(documento_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Extrae el texto de los PDF adjuntos de los expedientes aún no indexados (carga inicial)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--todos', action='store_true', help="re-extrae también los ya indexados")
+
+    def handle(self, *args, **options):
+        docs = Documento.objects.filter(
+            Q(archivo_adjunto__iendswith='.pdf') | Q(movimiento__archivo_adjunto__iendswith='.pdf')
+        )
+        if not options['todos']:
+            docs = docs.filter(adjuntos_indexados_en__isnull=True)
+        ids = list(docs.order_by().values_list('id', flat=True).distinct())
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            list(pool.map(_extraer, ids))
+
+        self.stdout.write(self.style.SUCCESS(f"Texto extraído de {len(ids)} expediente(s)."))
@@ -0,0 +1,49 @@
+# gestion/management/commands/generar_datos_sinteticos.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.datos_sinteticos import generar
+from gestion.remitentes import poblar_remitentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera expedientes sintéticos (con movimientos, notificaciones y feriados) sobre los "
+        "procedimientos y perfiles reales, para pruebas de carga y benchmarks. "
+        "Requiere haber ejecutado cargar_datos_mpi.py. No usar en producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=100_000, help="cantidad de expedientes a generar")
+        parser.add_argument('--semilla', type=int, default=42, help="misma semilla = mismos datos")
+        parser.add_argument('--anios', type=int, default=3, help="años de historia hacia atrás")
+        parser.add_argument('--lote', type=int, default=5000, help="expedientes por transacción")
+        parser.add_argument('--sin-remitentes', action='store_true', help="no poblar el directorio de remitentes al final")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+
+        def progreso(totales):
+            self.stdout.write(
+                f"  {totales['documentos']} expedientes | {totales['movimientos']} movimientos "
+                f"({time.monotonic() - inicio:.0f} s)"
+            )
+
+        try:
+            totales = generar(
+                options['documentos'], semilla=options['semilla'], anios=options['anios'],
+                lote=options['lote'], progreso=progreso,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not options['sin_remitentes']:
+            creados, enlazados = poblar_remitentes()
+            self.stdout.write(f"  Remitentes creados: {creados} | Expedientes enlazados: {enlazados}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Expedientes: {totales['documentos']} | Movimientos: {totales['movimientos']} | "
+            f"Notificaciones: {totales['notificaciones']} | Feriados nuevos: {totales['feriados']} "
+            f"| {time.monotonic() - inicio:.0f} s"
+        ))
@@ -0,0 +1,15 @@
+# gestion/management/commands/poblar_remitentes.py
+from django.core.management.base import BaseCommand
+
+from gestion.remitentes import poblar_remitentes
+
+
+class Command(BaseCommand):
+    help = "Crea el directorio de remitentes (DNI/RUC) a partir de los expedientes existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        creados, enlazados = poblar_remitentes(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Remitentes creados: {creados} | Expedientes enlazados: {enlazados}"))
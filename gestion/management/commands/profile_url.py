@@ -0,0 +1,83 @@
+# gestion/management/commands/profile_url.py
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from gestion.perfilado import perfilar
+
+
+class Command(BaseCommand):
+    help = (
+        "Perfila una petición a la URL indicada (con todos los middlewares y la sesión de --user): "
+        "funciones más costosas (cProfile), cada consulta SQL con su tiempo y su EXPLAIN, y el "
+        "tiempo de render por plantilla. La BD queda sin cambios (todo se deshace al terminar)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help="ruta a pedir, p. ej. /documentos/EXP-2025-0001/")
+        parser.add_argument('--user', help="username con el que se hace la petición (por defecto, anónimo)")
+        parser.add_argument('--post', nargs='*', metavar='CAMPO=VALOR', help="enviar un POST con estos datos en vez de un GET")
+        parser.add_argument('--top', type=int, default=30, help="cantidad de funciones a listar")
+        parser.add_argument('--orden', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'], help="orden de la tabla de funciones")
+        parser.add_argument('--sin-explain', action='store_true', help="no obtener el plan de cada consulta")
+        parser.add_argument('--flamegraph', metavar='ARCHIVO', help="escribe las pilas muestreadas en formato folded (flamegraph.pl, speedscope)")
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['user']:
+            try:
+                usuario = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['user']}.")
+
+        metodo, datos = 'get', None
+        if options['post'] is not None:
+            metodo = 'post'
+            try:
+                datos = dict(par.split('=', 1) for par in options['post'])
+            except ValueError:
+                raise CommandError("Los datos del POST deben tener la forma CAMPO=VALOR.")
+
+        # Cliente de pruebas: host 'testserver', sin límite de tasa y sin enviar correos reales
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            RATELIMIT_ENABLED=False,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ):
+            resultado = perfilar(
+                options['ruta'], usuario, metodo, datos,
+                explain=not options['sin_explain'], muestrear=bool(options['flamegraph']),
+            )
+
+        respuesta = resultado.respuesta
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{metodo.upper()} {options['ruta']} -> {respuesta.status_code} en {resultado.total_ms:.1f} ms"
+        ))
+        if respuesta.status_code in (301, 302):
+            self.stdout.write(self.style.WARNING(f"  Redirige a {respuesta['Location']} (¿falta --user o permisos?)"))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nFunciones (top {options['top']}, orden {options['orden']})"))
+        self.stdout.write(resultado.funciones(options['orden'], options['top']))
+
+        consultas = resultado.consultas
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Consultas SQL: {len(consultas)} en {sum(c.ms for c in consultas):.1f} ms"
+        ))
+        for i, consulta in enumerate(consultas, 1):
+            self.stdout.write(f"\n  #{i}  {consulta.ms:.2f} ms")
+            self.stdout.write(f"  {consulta.sql}")
+            if consulta.params:
+                self.stdout.write(f"  params: {list(consulta.params)}")
+            for linea in consulta.plan:
+                self.stdout.write(f"    PLAN {linea}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nPlantillas (ms totales incluyen las hijas)"))
+        for nombre, veces, total, propio in resultado.plantillas.filas():
+            self.stdout.write(f"  {nombre:<45} {veces:>4}x   total {total:>8.1f} ms   propio {propio:>8.1f} ms")
+
+        if options['flamegraph']:
+            resultado.muestreador.escribir(options['flamegraph'])
+            self.stdout.write(self.style.SUCCESS(
+                f"\nPilas ({sum(resultado.muestreador.pilas.values())} muestras) en {options['flamegraph']}"
+            ))
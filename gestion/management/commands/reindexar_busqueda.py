@@ -0,0 +1,12 @@
+# gestion/management/commands/reindexar_busqueda.py
+from django.core.management.base import BaseCommand
+
+from gestion.busqueda import instalar
+
+
+class Command(BaseCommand):
+    help = "Recrea la estructura de búsqueda de texto completo (triggers e índice) y la repuebla."
+
+    def handle(self, *args, **options):
+        instalar()
+        self.stdout.write(self.style.SUCCESS("Índice de búsqueda reconstruido."))
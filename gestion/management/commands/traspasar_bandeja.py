@@ -0,0 +1,53 @@
+# gestion/management/commands/traspasar_bandeja.py
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.flujo import destinos_por_defecto, traspasar_bandeja
+from gestion.models import PerfilUsuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Traspasa todos los expedientes abiertos de un usuario (baja o licencia) "
+        "a uno o más usuarios, repartidos según su carga actual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('origen', help="username del usuario que deja el puesto")
+        parser.add_argument(
+            '--a', dest='destinos', nargs='+', default=[], metavar='USERNAME',
+            help="usernames que reciben los expedientes (por defecto: compañeros activos con el mismo rol)"
+        )
+        parser.add_argument('--motivo', default="Baja / licencia del responsable")
+        parser.add_argument('--lote', type=int, default=500, help="expedientes por transacción")
+        parser.add_argument('--desactivar', action='store_true', help="desactiva además la cuenta del usuario de origen")
+
+    def handle(self, *args, **options):
+        perfiles = PerfilUsuario.objects.select_related('usuario', 'rol')
+        try:
+            origen = perfiles.get(usuario__username=options['origen'])
+        except PerfilUsuario.DoesNotExist:
+            raise CommandError(f"No existe un perfil para el usuario '{options['origen']}'.")
+
+        if options['destinos']:
+            destinos = list(perfiles.filter(usuario__username__in=options['destinos']))
+            faltantes = set(options['destinos']) - {d.usuario.username for d in destinos}
+            if faltantes:
+                raise CommandError(f"Usuarios de destino inexistentes: {', '.join(sorted(faltantes))}")
+        else:
+            destinos = destinos_por_defecto(origen)
+
+        try:
+            recibidos = traspasar_bandeja(origen, destinos, options['motivo'], lote=options['lote'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for destino, cantidad in recibidos.items():
+            self.stdout.write(f"  {destino.usuario.username}: {cantidad}")
+
+        if options['desactivar']:
+            origen.usuario.is_active = False
+            origen.usuario.save(update_fields=['is_active'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Traspasados {sum(recibidos.values())} expediente(s) de {origen.usuario.username}."
+        ))
@@ -0,0 +1,274 @@
+# gestion/metricas.py
+"""
+Registro de métricas (contadores e histogramas) en formato Prometheus.
+
+Cada proceso (worker de gunicorn) acumula sus métricas en memoria y cada
+METRICAS_INTERVALO segundos las vuelca a METRICAS_DIR/<pid>-<arranque>.json
+(escritura atómica). El endpoint /metricas/ suma los archivos de todos los workers,
+así el scraper ve los totales del servicio sin importar qué worker atiende la petición.
+
+El id de arranque evita que un worker nuevo que recibe el PID de uno ya terminado
+pise su archivo (los contadores sumados bajarían). Al arrancar, cada worker pliega
+los archivos de los procesos muertos en METRICAS_DIR/acumulado.json y los borra:
+los totales se conservan y la carpeta no crece con cada reinicio. El plegado usa
+un candado de archivo (fcntl) y os.kill(pid, 0); en sistemas sin fcntl (Windows,
+solo desarrollo) no se hace y los archivos simplemente se acumulan.
+
+Métricas:
+  - sgd_peticiones_total{vista, metodo, estado}
+  - sgd_peticion_duracion_segundos{vista}                 (histograma)
+  - sgd_acciones_flujo_total{accion, resultado}           (resultado: ok / concurrente / omitido)
+  - sgd_accion_flujo_duracion_segundos{accion}            (histograma)
+  - sgd_cache_total{espacio, resultado}                   (resultado: acierto / fallo)
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from django.conf import settings
+
+logger = logging.getLogger('gestion.metricas')
+
+# nombre -> (tipo, ayuda)
+METRICAS = {
+    'sgd_peticiones_total': ('counter', "Peticiones HTTP atendidas, por vista, método y código de estado."),
+    'sgd_peticion_duracion_segundos': ('histogram', "Duración de las peticiones HTTP por vista."),
+    'sgd_acciones_flujo_total': ('counter', "Acciones del flujo documentario por acción y resultado."),
+    'sgd_accion_flujo_duracion_segundos': ('histogram', "Duración de la transacción de cada acción del flujo."),
+    'sgd_cache_total': ('counter', "Lecturas cacheadas (gestion/cache.py) por espacio y resultado."),
+}
+
+# Límites superiores de los buckets (segundos); el último bucket (+Inf) es implícito
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_contadores = {} # (nombre, etiquetas) -> valor
+_histogramas = {} # (nombre, etiquetas) -> [conteos por bucket (+Inf al final), suma]
+_ultimo_volcado = 0.0
+_compactado = False # Este proceso ya plegó los archivos de los workers muertos
+
+ARRANQUE = uuid.uuid4().hex[:12] # Distingue a este proceso de otro que reciba el mismo PID
+ACUMULADO = 'acumulado.json'
+_ARCHIVO_WORKER = re.compile(r'^(\d+)-(\w+)\.json$')
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def incrementar(nombre, valor=1, **etiquetas):
+    clave = (nombre, _etiquetas(etiquetas))
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+    volcar()
+
+
+def observar(nombre, valor, **etiquetas):
+    """Registra una observación (en segundos) en el histograma."""
+    clave = (nombre, _etiquetas(etiquetas))
+    with _lock:
+        conteos, suma = _histogramas.get(clave) or ([0] * (len(BUCKETS) + 1), 0.0)
+        conteos[bisect_left(BUCKETS, valor)] += 1
+        _histogramas[clave] = [conteos, suma + valor]
+    volcar()
+
+
+# --- AGREGACIÓN ENTRE WORKERS ---
+
+def directorio():
+    return Path(getattr(settings, 'METRICAS_DIR', None) or Path(tempfile.gettempdir()) / 'sgd_metricas')
+
+
+def archivo_propio():
+    return directorio() / f"{os.getpid()}-{ARRANQUE}.json"
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Existe, aunque sea de otro usuario
+    return True
+
+
+def _sumar(destino, datos):
+    """Suma unas métricas volcadas ({'contadores', 'histogramas'}) a (contadores, histogramas)."""
+    contadores, histogramas = destino
+    for nombre, etiquetas, valor in datos['contadores']:
+        clave = (nombre, tuple(map(tuple, etiquetas)))
+        contadores[clave] = contadores.get(clave, 0) + valor
+    for nombre, etiquetas, conteos, suma in datos['histogramas']:
+        clave = (nombre, tuple(map(tuple, etiquetas)))
+        previo = histogramas.get(clave) or ([0] * len(conteos), 0.0)
+        histogramas[clave] = ([a + b for a, b in zip(previo[0], conteos)], previo[1] + suma)
+
+
+def _serializar(contadores, histogramas):
+    return {
+        'contadores': [[n, list(map(list, e)), v] for (n, e), v in contadores.items()],
+        'histogramas': [[n, list(map(list, e)), c, s] for (n, e), (c, s) in histogramas.items()],
+    }
+
+
+def _escribir(ruta, datos):
+    """Escritura atómica: temporal único (dos hilos no se pisan) + os.replace."""
+    descriptor, temporal = tempfile.mkstemp(prefix=f".{os.getpid()}.", suffix='.tmp', dir=ruta.parent)
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+            json.dump(datos, archivo)
+        os.replace(temporal, ruta) # El lector nunca ve un archivo a medias
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+
+
+def _leer(ruta):
+    try:
+        return json.loads(ruta.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None # Inexistente o dañado
+
+
+def compactar():
+    """
+    Pliega en acumulado.json los archivos de los workers que ya no existen y los borra.
+    'incluidos' registra qué archivos ya se sumaron: si el proceso muere entre escribir
+    el acumulado y borrarlos, el siguiente plegado los borra sin volver a sumarlos.
+    """
+    if fcntl is None:
+        return
+    carpeta = directorio()
+    with open(carpeta / '.compactar.lock', 'a') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        previo = _leer(carpeta / ACUMULADO) or {'contadores': [], 'histogramas': [], 'incluidos': []}
+        for nombre in previo.get('incluidos', []):
+            (carpeta / nombre).unlink(missing_ok=True)
+
+        muertos = []
+        for archivo in carpeta.glob('*.json'):
+            coincide = _ARCHIVO_WORKER.match(archivo.name)
+            if coincide and not _proceso_vivo(int(coincide.group(1))):
+                muertos.append(archivo)
+        if not muertos:
+            return
+
+        total = ({}, {})
+        _sumar(total, previo)
+        for archivo in muertos:
+            datos = _leer(archivo)
+            if datos is not None:
+                _sumar(total, datos)
+        _escribir(carpeta / ACUMULADO, {**_serializar(*total), 'incluidos': [a.name for a in muertos]})
+        for archivo in muertos:
+            archivo.unlink(missing_ok=True)
+
+
+def _al_salir():
+    # Lo acumulado desde el último volcado no se pierde al reiniciar el worker
+    if _contadores or _histogramas:
+        volcar(forzar=True)
+
+
+atexit.register(_al_salir)
+
+
+def volcar(forzar=False):
+    """
+    Escribe las métricas de este proceso (como mucho cada METRICAS_INTERVALO segundos).
+    Nunca lanza excepciones: se llama desde el flujo ya confirmado (flujo.transicion) y
+    un disco lleno o de solo lectura no debe convertir una derivación hecha en un 500.
+    """
+    global _ultimo_volcado, _compactado
+    ahora = time.monotonic()
+    if not forzar and ahora - _ultimo_volcado < getattr(settings, 'METRICAS_INTERVALO', 5):
+        return
+    with _lock:
+        _ultimo_volcado = ahora
+        datos = _serializar(_contadores, _histogramas)
+        compactar_ahora, _compactado = not _compactado, True
+    try:
+        directorio().mkdir(parents=True, exist_ok=True)
+        if compactar_ahora: # Primer volcado del worker
+            compactar()
+        _escribir(archivo_propio(), datos)
+    except Exception:
+        logger.exception("No se pudieron volcar las métricas en %s", directorio())
+
+
+def agregado():
+    """Suma las métricas volcadas por todos los workers: (contadores, histogramas)."""
+    volcar(forzar=True)
+    carpeta = directorio()
+    total = ({}, {})
+    acumulado = _leer(carpeta / ACUMULADO)
+    ya_sumados = set(acumulado.get('incluidos', [])) if acumulado else set()
+    for archivo in carpeta.glob('*.json'):
+        if archivo.name in ya_sumados:
+            continue # Plegado en el acumulado, pendiente de borrar
+        datos = acumulado if archivo.name == ACUMULADO else _leer(archivo)
+        if datos is None:
+            continue # Archivo dañado: se omite en esta lectura
+        _sumar(total, datos)
+    return total
+
+
+def reiniciar():
+    """Borra las métricas del proceso y los archivos volcados (pruebas / mantenimiento)."""
+    global _ultimo_volcado, _compactado
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+        _ultimo_volcado = 0.0
+        _compactado = False
+    for archivo in directorio().glob('*.json'):
+        archivo.unlink(missing_ok=True)
+
+
+# --- FORMATO DE TEXTO DE PROMETHEUS ---
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _serie(nombre, etiquetas, extra=()):
+    pares = [*etiquetas, *extra]
+    if not pares:
+        return nombre
+    return nombre + "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def exportar_prometheus():
+    contadores, histogramas = agregado()
+    lineas = []
+    for nombre, (tipo, ayuda) in METRICAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        if tipo == 'counter':
+            for (n, etiquetas), valor in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{_serie(nombre, etiquetas)} {valor}")
+            continue
+        for (n, etiquetas), (conteos, suma) in sorted(histogramas.items()):
+            if n != nombre:
+                continue
+            acumulado = 0
+            for limite, cantidad in zip([*map(str, BUCKETS), '+Inf'], conteos):
+                acumulado += cantidad
+                lineas.append(f"{_serie(nombre + '_bucket', etiquetas, [('le', limite)])} {acumulado}")
+            lineas.append(f"{_serie(nombre + '_sum', etiquetas)} {suma:.6f}")
+            lineas.append(f"{_serie(nombre + '_count', etiquetas)} {acumulado}")
+    return "\n".join(lineas) + "\n"
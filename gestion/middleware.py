@@ -0,0 +1,122 @@
+# gestion/middleware.py
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from . import metricas, nmas1
+from .cache import clave_perfil, tiempo_cache_perfil
+from .instrumentacion import iniciar_medicion, medicion_actual, mostrar_server_timing, registrar
+from .models import PerfilUsuario, Rol
+
+
+# Columnas que se guardan en caché: las del perfil y las de su rol. Nunca el User
+# (hash de contraseña, is_active): request.user lo carga la autenticación en cada petición.
+CAMPOS_PERFIL = [f.attname for f in PerfilUsuario._meta.concrete_fields]
+CAMPOS_ROL = [f.attname for f in Rol._meta.concrete_fields]
+
+
+def obtener_perfil(request):
+    """
+    Perfil del usuario logueado con su rol (una sola consulta, o ninguna si está en caché).
+    Devuelve None para anónimos o usuarios sin PerfilUsuario (ej. superadmin).
+    """
+    if not request.user.is_authenticated:
+        return None
+
+    clave = clave_perfil(request.user.pk)
+    fila = cache.get(clave)
+    if fila is None:
+        fila = (
+            PerfilUsuario.objects.filter(usuario_id=request.user.pk)
+            .values_list(*CAMPOS_PERFIL, *(f'rol__{campo}' for campo in CAMPOS_ROL)).first()
+        )
+        # Guardamos False para "no tiene perfil" y así no volver a consultarlo
+        cache.set(clave, fila or False, tiempo_cache_perfil())
+
+    if not fila:
+        return None
+
+    perfil = PerfilUsuario.from_db(connection.alias, CAMPOS_PERFIL, fila[:len(CAMPOS_PERFIL)])
+    rol = Rol.from_db(connection.alias, CAMPOS_ROL, fila[len(CAMPOS_PERFIL):]) if perfil.rol_id else None
+    campo_usuario = PerfilUsuario._meta.get_field('usuario')
+    PerfilUsuario._meta.get_field('rol').set_cached_value(perfil, rol)
+    campo_usuario.set_cached_value(perfil, request.user)
+    # Así 'user.perfilusuario' (formularios, plantillas) reutiliza este mismo objeto
+    campo_usuario.remote_field.set_cached_value(request.user, perfil)
+    return perfil
+
+
+class PerfilUsuarioMiddleware:
+    """
+    Expone request.perfil: el PerfilUsuario (con rol) del usuario actual,
+    resuelto una sola vez por petición y solo si alguien lo usa.
+    Debe ir después de AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.perfil = SimpleLazyObject(lambda: obtener_perfil(request))
+        return self.get_response(request)
+
+
+class InstrumentacionMiddleware:
+    """
+    Mide cada petición (ver instrumentacion.py): Server-Timing, log estructurado,
+    captura del SQL más lento en las peticiones lentas y métricas por vista (metricas.py).
+    Debe ir primero en MIDDLEWARE para que el total incluya a los demás middlewares.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = iniciar_medicion()
+        if not medicion.detallada:
+            response = self.get_response(request)
+        else:
+            token = medicion_actual.set(medicion)
+            try:
+                with connection.execute_wrapper(medicion):
+                    response = self.get_response(request)
+            finally:
+                medicion_actual.reset(token)
+
+        medicion.terminar()
+        if hasattr(request, '_inicio_vista'):
+            medicion.vista_ms = (time.perf_counter() - request._inicio_vista) * 1000
+        if mostrar_server_timing(request):
+            response['Server-Timing'] = medicion.server_timing()
+        registrar(medicion, request, response)
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.url_name if coincidencia and coincidencia.url_name else 'sin_ruta'
+        metricas.incrementar('sgd_peticiones_total', vista=vista, metodo=request.method, estado=response.status_code)
+        metricas.observar('sgd_peticion_duracion_segundos', medicion.total_ms / 1000, vista=vista)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # El tiempo de la vista incluye el render de sus plantillas
+        request._inicio_vista = time.perf_counter()
+
+
+class DetectorNMas1Middleware:
+    """
+    Detector de consultas N+1 por petición (ver nmas1.py). Solo se activa si
+    NMAS1_MODO es 'avisar' (WARNING con el informe) o 'fallar' (lanza NMas1Detectado).
+    """
+    def __init__(self, get_response):
+        if nmas1.modo() not in ('avisar', 'fallar'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with nmas1.detectar() as detector:
+            response = self.get_response(request)
+        if detector.repetidas():
+            if nmas1.modo() == 'fallar':
+                raise nmas1.NMas1Detectado(f"{request.method} {request.path}\n{detector.informe()}")
+            nmas1.logger.warning("%s %s\n%s", request.method, request.path, detector.informe())
+        return response
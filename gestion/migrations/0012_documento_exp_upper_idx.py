@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:39
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_perfilusuario_celular_perfilusuario_foto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(django.db.models.functions.text.Upper('expediente_id'), name='documento_exp_upper_idx'),
+        ),
+    ]
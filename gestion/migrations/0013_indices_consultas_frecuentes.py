@@ -0,0 +1,67 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_documento_exp_upper_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['responsable_actual', 'estado'], name='documento_resp_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['estado', 'fecha_ingreso'], name='documento_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['documento', 'fecha_movimiento'], name='movimiento_doc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['usuario_origen', 'documento'], name='movimiento_origen_doc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['unidad_destino', 'documento'], name='movimiento_destino_doc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['destinatario', 'fecha_creacion'], name='notif_dest_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(condition=models.Q(('leida', False)), fields=['destinatario'], name='notif_no_leidas_idx'),
+        ),
+        migrations.AlterField(
+            model_name='documento',
+            name='responsable_actual',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='documentos_asignados', to='gestion.perfilusuario'),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='documento',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='gestion.documento'),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='unidad_destino',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recepciones', to='gestion.perfilusuario'),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='usuario_origen',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='envios', to='gestion.perfilusuario'),
+        ),
+        migrations.AlterField(
+            model_name='notificacion',
+            name='destinatario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to='gestion.perfilusuario'),
+        ),
+    ]
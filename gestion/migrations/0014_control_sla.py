@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='limite_sla',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='nivel_sla',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Sin aviso'), (1, 'Aviso por vencer'), (2, 'Escalado por vencimiento')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['fecha_limite_paso_actual', 'estado'], name='documento_limite_estado_idx'),
+        ),
+    ]
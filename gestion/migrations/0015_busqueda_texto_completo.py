@@ -0,0 +1,25 @@
+# Búsqueda de texto completo: columna tsvector + GIN (PostgreSQL) o tabla FTS5 (SQLite),
+# mantenidas por triggers. Ver gestion/busqueda.py.
+
+from django.db import migrations
+
+
+def instalar(apps, schema_editor):
+    from gestion.busqueda import instalar
+    instalar(schema_editor.connection)
+
+
+def desinstalar(apps, schema_editor):
+    from gestion.busqueda import desinstalar
+    desinstalar(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_control_sla'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, desinstalar),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:54
+
+from django.db import migrations, models
+
+
+def reinstalar_busqueda(apps, schema_editor):
+    # La columna nueva entra al índice de texto completo (ver gestion/busqueda.py)
+    from gestion.busqueda import instalar
+    instalar(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='adjuntos_indexados_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='texto_adjuntos',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        # Al revertir: ejecutar 'manage.py reindexar_busqueda' con el código anterior
+        migrations.RunPython(reinstalar_busqueda, migrations.RunPython.noop),
+    ]
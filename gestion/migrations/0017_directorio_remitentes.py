@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_texto_adjuntos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Remitente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identificador', models.CharField(max_length=11, unique=True, verbose_name='DNI/RUC')),
+                ('tipo', models.CharField(choices=[('PN', 'Persona Natural'), ('PJ', 'Persona Jurídica (Empresa)')], default='PN', max_length=2)),
+                ('nombre', models.CharField(max_length=200, verbose_name='Nombre o Razón Social')),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('ultima_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['identificador'],
+            },
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='remitente_registro',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='expedientes', to='gestion.remitente'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:59
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0017_directorio_remitentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoHistorico',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('expediente_id', models.CharField(max_length=20, unique=True, verbose_name='ID Expediente')),
+                ('asunto', models.TextField(verbose_name='Asunto Detallado')),
+                ('estado', models.CharField(choices=[('en_proceso', 'En Proceso'), ('observado', 'Observado / Devuelto'), ('externo', 'En Trámite Externo (MINEDU/SUNEDU)'), ('atendido', 'Atendido / Finalizado'), ('archivado', 'Archivado / Cancelado')], max_length=20)),
+                ('fecha_ingreso', models.DateTimeField()),
+                ('fecha_limite_total', models.DateTimeField(blank=True, null=True)),
+                ('fecha_limite_paso_actual', models.DateTimeField(blank=True, null=True)),
+                ('paso_actual', models.IntegerField(default=1)),
+                ('remitente', models.CharField(max_length=200)),
+                ('tipo_remitente', models.CharField(choices=[('PN', 'Persona Natural'), ('PJ', 'Persona Jurídica (Empresa)')], default='PN', max_length=2)),
+                ('identificador_remitente', models.CharField(blank=True, max_length=11, null=True, verbose_name='DNI/RUC')),
+                ('archivo_adjunto', models.FileField(blank=True, null=True, upload_to='documentos/')),
+                ('clave_seguridad', models.CharField(blank=True, max_length=10, null=True, verbose_name='Clave Web')),
+                ('texto_adjuntos', models.TextField(blank=True, null=True)),
+                ('logs_edicion', models.JSONField(blank=True, default=list)),
+                ('fecha_archivo', models.DateTimeField(auto_now_add=True)),
+                ('procedimiento', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='gestion.procedimiento', verbose_name='Trámite TUPA/MPI')),
+                ('remitente_registro', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='expedientes_historicos', to='gestion.remitente')),
+                ('responsable_actual', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gestion.perfilusuario')),
+            ],
+            options={
+                'verbose_name': 'Expediente histórico',
+                'verbose_name_plural': 'Expedientes históricos',
+                'ordering': ['-fecha_ingreso'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoHistorico',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('fecha_movimiento', models.DateTimeField()),
+                ('paso_flujo', models.IntegerField(default=1)),
+                ('observaciones', models.TextField(blank=True, null=True)),
+                ('archivo_adjunto', models.FileField(blank=True, null=True, upload_to='respuestas/', verbose_name='Adjunto del Paso')),
+                ('tipo', models.CharField(choices=[('inicio', 'Inicio de Trámite'), ('derivacion', 'Derivación Automática'), ('asignacion_interna', 'Asignación Interna'), ('observacion', 'Observación / Retorno'), ('externo', 'Envío Externo'), ('redireccion', 'Redirección por Error'), ('anulacion', 'Anulación / Cancelación'), ('finalizacion', 'Finalización')], default='derivacion', max_length=20)),
+                ('documento', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimiento_set', to='gestion.documentohistorico')),
+                ('unidad_destino', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gestion.perfilusuario')),
+                ('usuario_origen', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gestion.perfilusuario')),
+            ],
+            options={
+                'ordering': ['-fecha_movimiento'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='documentohistorico',
+            index=models.Index(django.db.models.functions.text.Upper('expediente_id'), name='doc_hist_exp_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientohistorico',
+            index=models.Index(fields=['documento', 'fecha_movimiento'], name='mov_hist_doc_fecha_idx'),
+        ),
+    ]
@@ -3,6 +3,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+from datetime import timedelta
 
 
 # --- NUEVOS MODELOS PARA USUARIOS Y ROLES ---
@@ -78,6 +81,91 @@ class Requisito(models.Model):
 
 # --- MODELOS TRANSACCIONALES (LOS TRÁMITES REALES) ---
 
+class Remitente(models.Model):
+    """
+    Directorio de remitentes externos, identificados por DNI/RUC.
+    Se alimenta al registrar expedientes (ver remitentes.py) y permite
+    autocompletar el nombre y ver el historial de trámites de una persona/empresa.
+    """
+    TIPO_CHOICES = [
+        ('PN', 'Persona Natural'),
+        ('PJ', 'Persona Jurídica (Empresa)'),
+    ]
+    # unique = índice: búsqueda exacta y por prefijo (rango) sin escanear la tabla
+    identificador = models.CharField(max_length=11, unique=True, verbose_name="DNI/RUC")
+    tipo = models.CharField(max_length=2, choices=TIPO_CHOICES, default='PN')
+    nombre = models.CharField(max_length=200, verbose_name="Nombre o Razón Social")
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+    ultima_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.identificador} - {self.nombre}"
+
+    class Meta:
+        ordering = ['identificador']
+
+
+ESTADOS_FINALIZADOS = ('atendido', 'archivado')
+
+# Orden de urgencia del semáforo (para ordenar la bandeja)
+URGENCIA_SEMAFORO = {'rojo': 0, 'amarillo': 1, 'verde': 2, 'gris': 3, 'azul': 4}
+
+
+def condiciones_semaforo(ahora=None):
+    """
+    Condiciones (disjuntas) de cada color, con las mismas reglas que Documento.semaforo.
+    'verde' es el resto: con fecha límite, abierto y a más de 24 horas.
+    """
+    ahora = ahora or timezone.now()
+    sin_plazo = Q(fecha_limite_paso_actual__isnull=True)
+    finalizado = Q(estado__in=ESTADOS_FINALIZADOS)
+    return {
+        'gris': sin_plazo,
+        'azul': ~sin_plazo & finalizado,
+        'rojo': Q(fecha_limite_paso_actual__lt=ahora) & ~finalizado,
+        'amarillo': Q(fecha_limite_paso_actual__gte=ahora, fecha_limite_paso_actual__lt=ahora + timedelta(days=1)) & ~finalizado,
+    }
+
+
+class DocumentoQuerySet(models.QuerySet):
+    def con_semaforo(self, ahora=None):
+        """Anota 'color_semaforo' y 'urgencia_semaforo' calculados en la BD."""
+        condiciones = condiciones_semaforo(ahora)
+        return self.annotate(
+            color_semaforo=Case(
+                *[When(cond, then=Value(color)) for color, cond in condiciones.items()],
+                default=Value('verde'),
+                output_field=models.CharField(),
+            ),
+            urgencia_semaforo=Case(
+                *[When(cond, then=Value(URGENCIA_SEMAFORO[color])) for color, cond in condiciones.items()],
+                default=Value(URGENCIA_SEMAFORO['verde']),
+                output_field=IntegerField(),
+            ),
+        )
+
+    def por_semaforo(self, color, ahora=None):
+        """Filtra por color (los filtros van directo a fecha_limite/estado, sin anotar)."""
+        condiciones = condiciones_semaforo(ahora)
+        if color == 'verde':
+            return self.exclude(Q(*condiciones.values(), _connector=Q.OR))
+        return self.filter(condiciones[color])
+
+    def alertas_por_area(self, ahora=None):
+        """Expedientes en rojo y amarillo por área responsable (una sola consulta agrupada)."""
+        condiciones = condiciones_semaforo(ahora)
+        return (
+            self.exclude(responsable_actual__isnull=True)
+            .values('responsable_actual__unidad_organizativa')
+            .annotate(
+                rojos=Count('id', filter=condiciones['rojo']),
+                amarillos=Count('id', filter=condiciones['amarillo']),
+            )
+            .filter(Q(rojos__gt=0) | Q(amarillos__gt=0))
+            .order_by('-rojos', '-amarillos')
+        )
+
+
 class Documento(models.Model):
     ESTADO_DOCUMENTO_CHOICES = [
         ('en_proceso', 'En Proceso'),
@@ -110,18 +198,37 @@ class Documento(models.Model):
     paso_actual = models.IntegerField(default=1, verbose_name="Número de paso actual")
     
     # Responsable: Quién tiene el documento AHORA
-    responsable_actual = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, blank=True, related_name="documentos_asignados")
+    # (Sin índice propio: lo cubre el índice compuesto (responsable_actual, estado))
+    responsable_actual = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, blank=True, related_name="documentos_asignados", db_index=False)
     
     # Remitente
     remitente = models.CharField(max_length=200)
     tipo_remitente = models.CharField(max_length=2, choices=TIPO_REMITENTE_CHOICES, default='PN')
     identificador_remitente = models.CharField(max_length=11, blank=True, null=True, verbose_name="DNI/RUC")
+    # Ficha del directorio (None en trámites internos); el nombre/DNI de arriba quedan como se registraron
+    remitente_registro = models.ForeignKey(Remitente, on_delete=models.SET_NULL, null=True, blank=True, related_name="expedientes", editable=False)
     
     # Archivo principal (ej. la solicitud escaneada)
     archivo_adjunto = models.FileField(upload_to='documentos/', blank=True, null=True)
     
     clave_seguridad = models.CharField(max_length=10, blank=True, null=True, verbose_name="Clave Web")
 
+    # Control del barrido de plazos (comando barrer_plazos): último aviso enviado y
+    # la fecha límite a la que correspondía. Si el paso cambia, la fecha ya no coincide
+    # y el expediente vuelve a ser elegible sin tener que resetear nada al derivar.
+    NIVEL_SLA_CHOICES = [
+        (0, 'Sin aviso'),
+        (1, 'Aviso por vencer'),
+        (2, 'Escalado por vencimiento'),
+    ]
+    nivel_sla = models.PositiveSmallIntegerField(choices=NIVEL_SLA_CHOICES, default=0)
+    limite_sla = models.DateTimeField(null=True, blank=True)
+
+    # Texto de los PDF adjuntos (lo llena el pool de adjuntos.py; entra al buscador)
+    texto_adjuntos = models.TextField(null=True, blank=True, editable=False)
+    adjuntos_indexados_en = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = DocumentoQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.expediente_id} ({self.procedimiento.codigo})"
@@ -129,15 +236,29 @@ class Documento(models.Model):
     class Meta:
         ordering = ['-fecha_ingreso']
         verbose_name = "Expediente"
+        indexes = [
+            # Índice para la consulta pública (búsqueda sin distinguir mayúsculas)
+            models.Index(Upper('expediente_id'), name='documento_exp_upper_idx'),
+            # Bandeja del usuario: "lo que tengo en mi poder" (y por estado)
+            models.Index(fields=['responsable_actual', 'estado'], name='documento_resp_estado_idx'),
+            # Reportes y filtros por estado + rango de fechas
+            models.Index(fields=['estado', 'fecha_ingreso'], name='documento_estado_fecha_idx'),
+            # Barrido de plazos y filtros del semáforo: vencidos / por vencer
+            models.Index(fields=['fecha_limite_paso_actual', 'estado'], name='documento_limite_estado_idx'),
+        ]
 
     # Método Helper para el Semáforo
+    # (Si el queryset usó con_semaforo(), se usa el color ya calculado en la BD)
     @property
     def semaforo(self):
+        if 'color_semaforo' in self.__dict__:
+            return self.color_semaforo
+
         if not self.fecha_limite_paso_actual:
             return 'gris' # No aplica
         
         now = timezone.now()
-        if self.estado in ['atendido', 'archivado']:
+        if self.estado in ESTADOS_FINALIZADOS:
             return 'azul' # Finalizado
         
         # Si ya pasó la fecha
@@ -157,11 +278,12 @@ class Movimiento(models.Model):
     """
     Historial de pasos. Se genera automáticamente al derivar.
     """
-    documento = models.ForeignKey(Documento, on_delete=models.CASCADE)
+    # Los tres FK no llevan índice propio: los cubren los índices compuestos de Meta
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, db_index=False)
     fecha_movimiento = models.DateTimeField(auto_now_add=True)
     
-    usuario_origen = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name="envios")
-    unidad_destino = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name="recepciones")
+    usuario_origen = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name="envios", db_index=False)
+    unidad_destino = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name="recepciones", db_index=False)
     
     # Guardamos en qué paso del flujo estaba este movimiento
     paso_flujo = models.IntegerField(default=1)
@@ -183,12 +305,19 @@ class Movimiento(models.Model):
 
     class Meta:
         ordering = ['-fecha_movimiento']
+        indexes = [
+            # Historial de un expediente en orden cronológico
+            models.Index(fields=['documento', 'fecha_movimiento'], name='movimiento_doc_fecha_idx'),
+            # "Documentos donde participé" (bandeja, reportes)
+            models.Index(fields=['usuario_origen', 'documento'], name='movimiento_origen_doc_idx'),
+            models.Index(fields=['unidad_destino', 'documento'], name='movimiento_destino_doc_idx'),
+        ]
 
 
 # --- NUEVO MODELO PARA NOTIFICACIONES ---
 # Modelo de Notificación (lo mantenemos igual, es útil)
 class Notificacion(models.Model):
-    destinatario = models.ForeignKey(PerfilUsuario, on_delete=models.CASCADE, related_name='notificaciones')
+    destinatario = models.ForeignKey(PerfilUsuario, on_delete=models.CASCADE, related_name='notificaciones', db_index=False)
     mensaje = models.CharField(max_length=255)
     leida = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
@@ -196,6 +325,12 @@ class Notificacion(models.Model):
 
     class Meta:
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Campanita: últimas notificaciones del usuario
+            models.Index(fields=['destinatario', 'fecha_creacion'], name='notif_dest_fecha_idx'),
+            # Contador de no leídas (índice parcial: solo las pendientes, se mantiene pequeño)
+            models.Index(fields=['destinatario'], condition=models.Q(leida=False), name='notif_no_leidas_idx'),
+        ]
 
 # --- AL FINAL DE gestion/models.py ---
 
@@ -242,4 +377,70 @@ class LogEdicion(models.Model):
         return f"Edición en {self.documento.expediente_id} por {self.usuario}"
 
     class Meta:
-        ordering = ['-fecha']
\ No newline at end of file
+        ordering = ['-fecha']
+
+# --- ARCHIVO HISTÓRICO ---
+# Expedientes cerrados y antiguos se mueven aquí (comando archivar_expedientes) para que
+# Documento / Movimiento solo contengan el trabajo vivo. Conservan el mismo id y los
+# mismos nombres de campos, así las plantillas de detalle y consulta sirven para ambos.
+
+class DocumentoHistorico(models.Model):
+    id = models.IntegerField(primary_key=True) # El mismo id que tenía en Documento
+    expediente_id = models.CharField(max_length=20, unique=True, verbose_name="ID Expediente")
+    procedimiento = models.ForeignKey(Procedimiento, on_delete=models.PROTECT, related_name='+', verbose_name="Trámite TUPA/MPI")
+    asunto = models.TextField(verbose_name="Asunto Detallado")
+    estado = models.CharField(max_length=20, choices=Documento.ESTADO_DOCUMENTO_CHOICES)
+
+    fecha_ingreso = models.DateTimeField()
+    fecha_limite_total = models.DateTimeField(null=True, blank=True)
+    fecha_limite_paso_actual = models.DateTimeField(null=True, blank=True)
+    paso_actual = models.IntegerField(default=1)
+    responsable_actual = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    remitente = models.CharField(max_length=200)
+    tipo_remitente = models.CharField(max_length=2, choices=Documento.TIPO_REMITENTE_CHOICES, default='PN')
+    identificador_remitente = models.CharField(max_length=11, blank=True, null=True, verbose_name="DNI/RUC")
+    remitente_registro = models.ForeignKey(Remitente, on_delete=models.SET_NULL, null=True, blank=True, related_name="expedientes_historicos")
+
+    archivo_adjunto = models.FileField(upload_to='documentos/', blank=True, null=True)
+    clave_seguridad = models.CharField(max_length=10, blank=True, null=True, verbose_name="Clave Web")
+    texto_adjuntos = models.TextField(null=True, blank=True)
+
+    # Auditoría de ediciones (LogEdicion) del expediente: [{fecha, usuario_id, cambios}]
+    logs_edicion = models.JSONField(default=list, blank=True)
+    fecha_archivo = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.expediente_id} (histórico)"
+
+    # Los expedientes archivados siempre están cerrados
+    semaforo = 'azul'
+    es_historico = True
+
+    class Meta:
+        ordering = ['-fecha_ingreso']
+        verbose_name = "Expediente histórico"
+        verbose_name_plural = "Expedientes históricos"
+        indexes = [
+            # Consulta pública (misma búsqueda normalizada que en Documento)
+            models.Index(Upper('expediente_id'), name='doc_hist_exp_upper_idx'),
+        ]
+
+
+class MovimientoHistorico(models.Model):
+    id = models.IntegerField(primary_key=True)
+    # related_name igual al de Documento (movimiento_set): las plantillas no distinguen
+    documento = models.ForeignKey(DocumentoHistorico, on_delete=models.CASCADE, related_name='movimiento_set', db_index=False)
+    fecha_movimiento = models.DateTimeField()
+    usuario_origen = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name='+')
+    unidad_destino = models.ForeignKey(PerfilUsuario, on_delete=models.SET_NULL, null=True, related_name='+')
+    paso_flujo = models.IntegerField(default=1)
+    observaciones = models.TextField(blank=True, null=True)
+    archivo_adjunto = models.FileField(upload_to='respuestas/', blank=True, null=True, verbose_name="Adjunto del Paso")
+    tipo = models.CharField(max_length=20, choices=Movimiento.TIPO_MOVIMIENTO_CHOICES, default='derivacion')
+
+    class Meta:
+        ordering = ['-fecha_movimiento']
+        indexes = [
+            models.Index(fields=['documento', 'fecha_movimiento'], name='mov_hist_doc_fecha_idx'),
+        ]
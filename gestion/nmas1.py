@@ -0,0 +1,125 @@
+# gestion/nmas1.py
+"""
+Detector de consultas N+1 para desarrollo y pruebas.
+
+Agrupa el SQL ejecutado por "forma" (la sentencia normalizada: sin literales y con
+las listas IN colapsadas) y por sitio de llamada (la línea de plantilla o de código
+de gestion/ que la disparó). Si la misma forma se repite desde el mismo sitio más
+de NMAS1_UMBRAL veces, es casi seguro un acceso perezoso dentro de un bucle
+(p. ej. {{ doc.procedimiento.nombre }} sin select_related).
+
+    - Por petición: DetectorNMas1Middleware, con NMAS1_MODO = 'avisar' (WARNING en
+      el logger 'gestion.nmas1') o 'fallar' (lanza NMas1Detectado).
+    - En una prueba o un bloque de código:
+
+          with nmas1.detectar(umbral=3, fallar=True):
+              self.client.get(url)
+"""
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('gestion.nmas1')
+
+RAIZ_APP = str(Path(__file__).resolve().parent)
+ESTE_ARCHIVO = str(Path(__file__).resolve())
+
+_LITERALES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"), # cadenas
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"), # números
+    (re.compile(r"%s"), "?"), # parámetros
+    (re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE), "IN (...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+class NMas1Detectado(Exception):
+    """Una misma consulta se repitió más veces que el umbral permitido."""
+
+
+def normalizar(sql):
+    for patron, reemplazo in _LITERALES:
+        sql = patron.sub(reemplazo, sql)
+    return sql.strip()
+
+
+def sitio_de_llamada():
+    """
+    'plantilla.html:línea' si la consulta la disparó una plantilla; si no, la primera
+    línea de código de la aplicación en la pila (excluyendo este módulo y las pruebas).
+    """
+    from django.template.base import Node
+
+    frame = sys._getframe(2)
+    while frame is not None:
+        nodo = frame.f_locals.get('self')
+        # type() y no isinstance(): isinstance evaluaría objetos perezosos (request.perfil)
+        if issubclass(type(nodo), Node) and getattr(nodo, 'origin', None) and getattr(nodo, 'token', None):
+            return f"{nodo.origin.template_name or nodo.origin.name}:{nodo.token.lineno}"
+        archivo = frame.f_code.co_filename
+        es_envoltorio = frame.f_code.co_name == '__call__' and 'execute' in frame.f_locals # Otros execute_wrapper
+        if (archivo.startswith(RAIZ_APP) and archivo != ESTE_ARCHIVO and not es_envoltorio
+                and not archivo.endswith('tests.py')):
+            return f"{Path(archivo).relative_to(Path(RAIZ_APP).parent)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "?"
+
+
+def tablas_de_cache():
+    """Tablas de las cachés con backend de BD (sus consultas no son N+1 del ORM)."""
+    return [
+        f'"{opciones["LOCATION"]}"' for opciones in settings.CACHES.values()
+        if opciones['BACKEND'].endswith('DatabaseCache')
+    ]
+
+
+class Detector:
+    """execute_wrapper que cuenta las consultas por (forma, sitio de llamada)."""
+
+    def __init__(self, umbral=None):
+        self.umbral = umbral if umbral is not None else getattr(settings, 'NMAS1_UMBRAL', 5)
+        self.grupos = Counter()
+        self.ejemplos = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if any(tabla in sql for tabla in tablas_de_cache()):
+            return execute(sql, params, many, context) # Idas a la caché (CACHE_BACKEND=db), no al ORM
+        clave = (normalizar(sql), sitio_de_llamada())
+        self.grupos[clave] += 1
+        self.ejemplos.setdefault(clave, sql)
+        return execute(sql, params, many, context)
+
+    def repetidas(self):
+        """[(sitio, sql, veces)] de las formas que superan el umbral, la más repetida primero."""
+        return [
+            (sitio, self.ejemplos[(forma, sitio)], veces)
+            for (forma, sitio), veces in self.grupos.most_common()
+            if veces > self.umbral
+        ]
+
+    def informe(self):
+        lineas = [f"Consultas repetidas más de {self.umbral} veces (posible N+1):"]
+        for sitio, sql, veces in self.repetidas():
+            lineas.append(f"  {veces}x en {sitio}\n      {sql[:300]}")
+        return "\n".join(lineas)
+
+
+@contextmanager
+def detectar(umbral=None, fallar=False, conexion=connection):
+    """Cuenta las consultas del bloque; con fallar=True lanza NMas1Detectado al salir."""
+    detector = Detector(umbral)
+    with conexion.execute_wrapper(detector):
+        yield detector
+    if fallar and detector.repetidas():
+        raise NMas1Detectado(detector.informe())
+
+
+def modo():
+    """'avisar', 'fallar' o '' (desactivado)."""
+    return getattr(settings, 'NMAS1_MODO', '')
@@ -0,0 +1,195 @@
+# gestion/perfilado.py
+"""
+Perfilado bajo demanda de una URL (manage.py profile_url).
+
+Ejecuta una petición con el cliente de pruebas de Django (pasa por todos los
+middlewares, con la sesión del usuario indicado) y recoge a la vez:
+  - cProfile de toda la petición,
+  - cada consulta SQL con su tiempo y su plan (EXPLAIN),
+  - el tiempo de render de cada plantilla (incluidas las de {% include %} / {% extends %}),
+  - opcionalmente, muestras de la pila cada pocos milisegundos en formato "folded"
+    (una línea 'marco;marco;marco N' por pila), que leen flamegraph.pl y speedscope.
+
+Todo ocurre dentro de una transacción que se deshace al terminar: perfilar un POST
+no deja cambios en la BD.
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.template.base import Template
+from django.test import Client
+
+
+class ConsultaCapturada:
+    def __init__(self, sql, params, ms):
+        self.sql = sql
+        self.params = params
+        self.ms = ms
+        self.plan = []
+
+
+class CapturaSQL:
+    """execute_wrapper que guarda cada consulta con sus parámetros y su duración."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append(ConsultaCapturada(sql, params, (time.perf_counter() - inicio) * 1000))
+
+
+def explicar(consulta):
+    """Plan de ejecución de una consulta SELECT (lista de líneas de texto)."""
+    if not consulta.sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    prefijo = connection.ops.explain_query_prefix()
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"{prefijo} {consulta.sql}", consulta.params)
+            filas = cursor.fetchall()
+    except Exception as e:
+        return [f"(no se pudo obtener el plan: {e})"]
+    # SQLite: (id, padre, -, detalle); PostgreSQL / MySQL: una columna de texto por línea
+    return [str(fila[-1]) for fila in filas]
+
+
+class TiemposPlantillas:
+    """Tiempo total (incluye hijas) y propio (sin hijas) de cada plantilla renderizada."""
+
+    def __init__(self):
+        self.total = Counter()
+        self.propio = Counter()
+        self.veces = Counter()
+        self._pila = [] # [nombre, inicio, ms de hijas]
+
+    def entrar(self, nombre):
+        self._pila.append([nombre, time.perf_counter(), 0.0])
+
+    def salir(self):
+        nombre, inicio, hijas = self._pila.pop()
+        ms = (time.perf_counter() - inicio) * 1000
+        self.total[nombre] += ms
+        self.propio[nombre] += ms - hijas
+        self.veces[nombre] += 1
+        if self._pila:
+            self._pila[-1][2] += ms
+
+    def filas(self):
+        """[(plantilla, veces, total_ms, propio_ms)] de la más costosa a la menos."""
+        return [(n, self.veces[n], self.total[n], self.propio[n]) for n, _ in self.propio.most_common()]
+
+
+@contextmanager
+def medir_plantillas(tiempos):
+    """Envuelve Template._render (el mismo punto que usa el entorno de pruebas de Django)."""
+    original = Template._render
+
+    def _render(plantilla, context):
+        tiempos.entrar(plantilla.origin.template_name or plantilla.origin.name)
+        try:
+            return original(plantilla, context)
+        finally:
+            tiempos.salir()
+
+    Template._render = _render
+    try:
+        yield
+    finally:
+        Template._render = original
+
+
+class Muestreador(threading.Thread):
+    """Toma la pila del hilo 'objetivo' cada 'intervalo' segundos (pilas "folded")."""
+
+    def __init__(self, objetivo, raiz, intervalo=0.001):
+        super().__init__(daemon=True)
+        self.objetivo = objetivo
+        self.raiz = raiz # Código de la función donde empieza la pila que interesa
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.objetivo)
+            marcos = []
+            while frame is not None and frame.f_code is not self.raiz:
+                marcos.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+                frame = frame.f_back
+            if frame is not None and marcos: # Solo las muestras tomadas dentro de la petición
+                self.pilas[";".join(reversed(marcos))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def escribir(self, ruta):
+        texto = "".join(f"{pila} {veces}\n" for pila, veces in self.pilas.most_common())
+        Path(ruta).write_text(texto, encoding='utf-8')
+
+
+class Resultado:
+    def __init__(self, respuesta, total_ms, perfil, consultas, plantillas, muestreador):
+        self.respuesta = respuesta
+        self.total_ms = total_ms
+        self.perfil = perfil
+        self.consultas = consultas
+        self.plantillas = plantillas
+        self.muestreador = muestreador
+
+    def funciones(self, orden='cumulative', limite=30):
+        """Texto de pstats con las 'limite' funciones más costosas."""
+        salida = io.StringIO()
+        pstats.Stats(self.perfil, stream=salida).strip_dirs().sort_stats(orden).print_stats(limite)
+        return salida.getvalue()
+
+
+def _pedir(cliente, metodo, ruta, datos):
+    respuesta = getattr(cliente, metodo)(ruta, datos or {})
+    if getattr(respuesta, 'streaming', False):
+        b''.join(respuesta.streaming_content)
+    return respuesta
+
+
+def perfilar(ruta, usuario=None, metodo='get', datos=None, explain=True, muestrear=False):
+    """Ejecuta la petición instrumentada y devuelve un Resultado (la BD queda como estaba)."""
+    cliente = Client()
+    if usuario is not None:
+        cliente.force_login(usuario)
+
+    perfil = cProfile.Profile()
+    captura = CapturaSQL()
+    plantillas = TiemposPlantillas()
+    muestreador = Muestreador(threading.get_ident(), _pedir.__code__) if muestrear else None
+
+    with transaction.atomic():
+        with connection.execute_wrapper(captura), medir_plantillas(plantillas):
+            if muestreador:
+                muestreador.start()
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                respuesta = _pedir(cliente, metodo, ruta, datos)
+            finally:
+                perfil.disable()
+                total_ms = (time.perf_counter() - inicio) * 1000
+                if muestreador:
+                    muestreador.detener()
+        if explain:
+            for consulta in captura.consultas:
+                consulta.plan = explicar(consulta)
+        transaction.set_rollback(True)
+
+    return Resultado(respuesta, total_ms, perfil, captura.consultas, plantillas, muestreador)
@@ -0,0 +1,120 @@
+# gestion/permisos.py
+"""
+Matriz de permisos por rol.
+
+En lugar de comparar nombres de roles en cada vista/plantilla, se compila una sola
+vez por proceso una tabla  rol -> (permisos, procedimientos que puede iniciar)
+y luego cada verificación es una búsqueda en un conjunto (O(1)).
+
+La tabla se recompila cuando cambia su sello de versión (en la caché compartida),
+que se renueva al editar roles, procedimientos o sus roles_inician (ver signals.py).
+El sello se lee como mucho cada PERMISOS_VERIFICAR_CADA segundos: con la caché en
+BD cada lectura es una consulta, y una petición verifica permisos varias veces. Los
+demás workers ven el cambio tras ese intervalo; el que lo hizo, en el acto.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import obtener_version, renovar_version
+from .models import Procedimiento, Rol
+
+# Permiso -> roles que lo tienen
+PERMISOS = {
+    # Bandeja: ver todos los expedientes (no solo los propios)
+    'ver_todos': {"Mesa de Partes", "Dirección General", "Área de Calidad"},
+    # Reportes con el universo completo de documentos y carga por área
+    'reportes_globales': {"Dirección General", "Área de Calidad"},
+    'exportar_csv': {"Dirección General", "Área de Calidad"},
+    # Mantenimiento de expedientes
+    'editar_cualquiera': {"Mesa de Partes"},
+    'eliminar': {"Mesa de Partes"},
+    'anular': {"Mesa de Partes", "Secretaría Académica", "Dirección General"},
+}
+
+# Permisos que tienen todos los roles, salvo los indicados
+PERMISOS_EXCEPTO = {
+    # Registrar trámites internos (Mesa de Partes solo registra externos)
+    'tramite_interno': {"Mesa de Partes"},
+}
+
+CLAVE_VERSION = "permisos:version"
+
+
+class Capacidades:
+    """Lo que puede hacer un rol: permisos y procedimientos que puede iniciar."""
+    __slots__ = ('permisos', 'procedimientos')
+
+    def __init__(self, permisos, procedimientos):
+        self.permisos = frozenset(permisos)
+        self.procedimientos = frozenset(procedimientos)
+
+    def __contains__(self, permiso):
+        return permiso in self.permisos
+
+
+def _permisos_de_rol(nombre):
+    permisos = {p for p, roles in PERMISOS.items() if nombre in roles}
+    permisos |= {p for p, excluidos in PERMISOS_EXCEPTO.items() if nombre not in excluidos}
+    return permisos
+
+
+def compilar_matriz():
+    """Arma la tabla completa con 3 consultas (roles, procedimientos y la tabla M2M)."""
+    roles_por_proc = defaultdict(set)
+    for proc_id, rol_id in Procedimiento.roles_inician.through.objects.values_list('procedimiento_id', 'rol_id'):
+        roles_por_proc[proc_id].add(rol_id)
+
+    # Sin roles_inician = cualquiera puede iniciarlo
+    abiertos = {pid for pid in Procedimiento.objects.values_list('id', flat=True) if pid not in roles_por_proc}
+
+    por_rol = {}
+    for rol_id, nombre in Rol.objects.values_list('id', 'nombre'):
+        restringidos = {pid for pid, roles in roles_por_proc.items() if rol_id in roles}
+        por_rol[rol_id] = Capacidades(_permisos_de_rol(nombre), abiertos | restringidos)
+
+    # Usuarios con perfil pero sin rol asignado
+    sin_rol = Capacidades(_permisos_de_rol(None), abiertos)
+    return por_rol, sin_rol
+
+
+# Caché del proceso (cada worker de gunicorn tiene la suya): (version, por_rol, sin_rol)
+_matriz = (None, {}, Capacidades((), ()))
+_lock = threading.Lock()
+_sello_leido_en = None # time.monotonic() de la última lectura del sello (None = leerlo ya)
+
+
+def matriz_permisos():
+    """Devuelve (por_rol, sin_rol), recompilando solo si cambió el sello de versión."""
+    global _matriz, _sello_leido_en
+    ahora = time.monotonic()
+    intervalo = getattr(settings, 'PERMISOS_VERIFICAR_CADA', 5)
+    if _matriz[0] is None or _sello_leido_en is None or ahora - _sello_leido_en >= intervalo:
+        version = obtener_version(CLAVE_VERSION)
+        if _matriz[0] != version:
+            with _lock:
+                if _matriz[0] != version:
+                    _matriz = (version, *compilar_matriz())
+        _sello_leido_en = ahora
+    _, por_rol, sin_rol = _matriz
+    return por_rol, sin_rol
+
+
+def invalidar_permisos():
+    global _sello_leido_en
+    renovar_version(CLAVE_VERSION)
+    _sello_leido_en = None # Este worker recompila en la próxima verificación
+
+
+def capacidades(perfil):
+    """Capacidades del perfil (None = sin perfil: ningún permiso)."""
+    if not perfil:
+        return Capacidades((), ())
+    por_rol, sin_rol = matriz_permisos()
+    return por_rol.get(perfil.rol_id, sin_rol)
+
+
+def tiene_permiso(perfil, permiso):
+    return permiso in capacidades(perfil)
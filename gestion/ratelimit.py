@@ -0,0 +1,138 @@
+# gestion/ratelimit.py
+"""
+Limitador de peticiones para las vistas públicas (ventana deslizante).
+
+Cada balde admite 'capacidad' peticiones en cualquier ventana de 'periodo' segundos.
+Se cuenta con dos contadores de ventana fija (la actual y la anterior, ponderada por
+lo que queda de ella dentro de la ventana deslizante). Sin cupo se responde 429 antes
+de ejecutar la vista (sin tocar la base de datos).
+
+El contador se toma con cache.add + cache.incr, que son atómicos en Redis, Memcached
+y LocMem: dos workers a la vez nunca gastan el mismo cupo. (Los backends 'db' y
+'file' implementan incr como get + set; ahí el límite es aproximado.)
+
+Configuración en settings.RATELIMIT:
+    RATELIMIT = {
+        'consulta': {
+            'ip': '30/60',                 # 30 peticiones por minuto
+            'expediente_id+ip': '10/300',  # por expediente y por IP (frena adivinar la Clave Web)
+            'expediente_id': '30/3600',    # por expediente, venga de donde venga (IPs rotativas)
+        },
+    }
+La clave 'ip' usa la IP del cliente; cualquier otra clave se lee del GET/POST.
+Varias claves unidas con '+' forman un solo balde por combinación de valores: así
+quien insiste con un expediente ajeno agota su balde, no el del ciudadano. El balde
+solo por expediente, más holgado, acota al que reparte los intentos entre muchas IPs.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .cache import normalizar_expediente
+
+
+def parsear_limite(limite):
+    """'30/60' -> (30, 60.0)"""
+    capacidad, periodo = str(limite).split('/')
+    return int(capacidad), float(periodo)
+
+
+def ip_cliente(request):
+    """
+    IP real del cliente. Detrás de un proxy (Render) tomamos la entrada de
+    X-Forwarded-For que añadió el proxy de confianza, no la que manda el cliente.
+    """
+    proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        reenviadas = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(reenviadas) >= proxies:
+            return reenviadas[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _incrementar(clave, expira):
+    """cache.incr atómico; add() crea el contador si no existe (o si expiró entre medio)."""
+    cache.add(clave, 0, expira)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, expira)
+        return cache.incr(clave)
+
+
+def consumir_token(clave, capacidad, periodo):
+    """
+    Intenta tomar un cupo del balde 'clave'.
+    Devuelve (permitido, segundos_de_espera).
+    """
+    ventana, transcurrido = divmod(time.time(), periodo)
+    ventana = int(ventana)
+    expira = int(periodo * 2) + 1 # La ventana actual se lee como "anterior" en la siguiente
+
+    usados = _incrementar(f"{clave}:{ventana}", expira)
+    anteriores = cache.get(f"{clave}:{ventana - 1}", 0)
+    restante = 1 - transcurrido / periodo # Fracción de la ventana anterior aún dentro de la deslizante
+    if anteriores * restante + usados <= capacidad:
+        return True, 0
+
+    # Rechazada: devolvemos el cupo (un cliente insistente no alarga su propio bloqueo)
+    try:
+        cache.decr(f"{clave}:{ventana}")
+    except ValueError:
+        pass # El contador ya expiró
+    if usados > capacidad or not anteriores:
+        return False, periodo - transcurrido
+    # Espera hasta que la ventana anterior pese lo suficiente menos
+    libre = (1 - (capacidad - usados) / anteriores) * periodo
+    return False, max(0.0, libre - transcurrido)
+
+
+def _valor_campo(request, nombre):
+    if nombre == 'ip':
+        return ip_cliente(request)
+    valor = request.GET.get(nombre) or request.POST.get(nombre) or ''
+    return normalizar_expediente(valor) if nombre == 'expediente_id' else valor.strip()
+
+
+def _valor_regla(request, nombre):
+    """Valor del balde; vacío si falta alguno de los campos de la regla."""
+    valores = [_valor_campo(request, campo) for campo in nombre.split('+')]
+    return ':'.join(valores) if all(valores) else ''
+
+
+def limitar_tasa(ambito):
+    """
+    Decorador de vista: aplica las reglas de settings.RATELIMIT[ambito].
+    Ej: @limitar_tasa('consulta')
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if getattr(settings, 'RATELIMIT_ENABLED', True):
+                reglas = getattr(settings, 'RATELIMIT', {}).get(ambito, {})
+                for nombre, limite in reglas.items():
+                    valor = _valor_regla(request, nombre)
+                    if not valor:
+                        continue # Regla no aplicable (p. ej. formulario vacío)
+
+                    capacidad, periodo = parsear_limite(limite)
+                    permitido, espera = consumir_token(f"ratelimit:{ambito}:{nombre}:{valor}", capacidad, periodo)
+                    if not permitido:
+                        return respuesta_limite_excedido(espera)
+            return vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def respuesta_limite_excedido(espera):
+    """Respuesta 429 barata: texto plano, sin plantillas ni consultas."""
+    response = HttpResponse(
+        "Demasiadas consultas. Por favor, espere unos segundos e intente nuevamente.",
+        status=429,
+        content_type='text/plain; charset=utf-8'
+    )
+    response['Retry-After'] = str(max(1, int(espera + 0.999)))
+    return response
@@ -0,0 +1,74 @@
+# gestion/remitentes.py
+"""
+Directorio de remitentes (DNI/RUC).
+
+- vincular_remitente(): al registrar/editar un expediente externo, crea o actualiza
+  la ficha del remitente y la enlaza al documento.
+- buscar_por_prefijo(): autocompletado por DNI/RUC usando el índice único como rango
+  ('1234' -> identificador >= '1234' AND < '1235'), que funciona en cualquier motor.
+- poblar_remitentes(): carga masiva a partir de los expedientes existentes.
+"""
+from django.db.models import OuterRef, Subquery
+
+from .cache import invalidar_consultas
+from .models import Documento, Remitente
+
+
+def vincular_remitente(doc):
+    """Enlaza 'doc' (aún sin guardar o ya guardado) con la ficha de su DNI/RUC."""
+    identificador = (doc.identificador_remitente or '').strip()
+    if not identificador:
+        doc.remitente_registro = None
+        return None
+
+    remitente, creado = Remitente.objects.get_or_create(
+        identificador=identificador,
+        defaults={'nombre': doc.remitente, 'tipo': doc.tipo_remitente}
+    )
+    # El último nombre registrado manda (corrige tipeos anteriores)
+    if not creado and (remitente.nombre, remitente.tipo) != (doc.remitente, doc.tipo_remitente):
+        remitente.nombre, remitente.tipo = doc.remitente, doc.tipo_remitente
+        remitente.save(update_fields=['nombre', 'tipo', 'ultima_actualizacion'])
+    doc.remitente_registro = remitente
+    return remitente
+
+
+def rango_prefijo(prefijo):
+    """Límites del rango que cubre todos los textos que empiezan con 'prefijo'."""
+    return prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+
+def buscar_por_prefijo(prefijo, limite=10):
+    prefijo = (prefijo or '').strip()
+    if not prefijo.isdigit():
+        return Remitente.objects.none()
+    desde, hasta = rango_prefijo(prefijo)
+    return Remitente.objects.filter(identificador__gte=desde, identificador__lt=hasta).order_by('identificador')[:limite]
+
+
+def poblar_remitentes(lote=1000):
+    """
+    Crea las fichas que falten a partir de los expedientes y enlaza los documentos.
+    Usa el nombre del expediente más reciente de cada DNI/RUC. Devuelve (fichas_creadas, documentos_enlazados).
+    """
+    existentes = set(Remitente.objects.values_list('identificador', flat=True))
+    nuevos = {}
+    filas = (
+        Documento.objects.exclude(identificador_remitente__isnull=True).exclude(identificador_remitente='')
+        .order_by('-fecha_ingreso')
+        .values_list('identificador_remitente', 'remitente', 'tipo_remitente')
+    )
+    for identificador, nombre, tipo in filas.iterator(chunk_size=lote):
+        if identificador not in existentes and identificador not in nuevos:
+            nuevos[identificador] = Remitente(identificador=identificador, nombre=nombre, tipo=tipo)
+    Remitente.objects.bulk_create(nuevos.values(), batch_size=lote, ignore_conflicts=True)
+
+    # Un solo UPDATE con subconsulta (sin recorrer los documentos en Python)
+    sin_enlace = Documento.objects.filter(remitente_registro__isnull=True, identificador_remitente__isnull=False)
+    afectados = set(sin_enlace.values_list('identificador_remitente', flat=True).distinct())
+    enlazados = sin_enlace.update(remitente_registro=Subquery(
+        Remitente.objects.filter(identificador=OuterRef('identificador_remitente')).values('id')[:1]
+    ))
+    # update() no dispara señales: el listado público de esos remitentes debe recalcularse
+    invalidar_consultas((), afectados)
+    return len(nuevos), enlazados
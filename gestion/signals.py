@@ -0,0 +1,109 @@
+# gestion/signals.py
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from django.contrib.auth.models import User
+
+from .adjuntos import encolar_extraccion, es_pdf
+from .cache import invalidar_consulta, invalidar_espacio, invalidar_perfil, invalidar_remitente
+from .models import DiaFeriado, Documento, Movimiento, PasoFlujo, PerfilUsuario, Procedimiento, Requisito, Rol
+from .permisos import invalidar_permisos
+
+
+# Cualquier cambio en el expediente o en su historial invalida la consulta pública cacheada
+# (la del expediente y el listado de "mis trámites" de su remitente)
+@receiver(post_save, sender=Documento)
+@receiver(post_delete, sender=Documento)
+def invalidar_consulta_documento(sender, instance, **kwargs):
+    invalidar_consulta(instance.expediente_id)
+    invalidar_remitente(instance.identificador_remitente)
+
+
+@receiver(post_save, sender=Movimiento)
+@receiver(post_delete, sender=Movimiento)
+def invalidar_consulta_movimiento(sender, instance, **kwargs):
+    try:
+        documento = instance.documento
+    except Documento.DoesNotExist:
+        return # El expediente ya fue eliminado (borrado en cascada)
+    invalidar_consulta(documento.expediente_id)
+    invalidar_remitente(documento.identificador_remitente)
+
+
+# Perfil cacheado por el middleware: se descarta al editar el perfil, el usuario o su rol
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_perfil_editado(sender, instance, **kwargs):
+    invalidar_perfil(instance.usuario_id)
+
+
+@receiver(post_save, sender=User)
+def invalidar_perfil_usuario(sender, instance, **kwargs):
+    invalidar_perfil(instance.pk)
+
+
+@receiver(post_save, sender=Rol)
+@receiver(post_delete, sender=Rol)
+def invalidar_perfiles_del_rol(sender, instance, **kwargs):
+    invalidar_perfil(*PerfilUsuario.objects.filter(rol=instance).values_list('usuario_id', flat=True))
+
+
+# Matriz de permisos: se recompila si cambian roles, procedimientos o quién puede iniciarlos
+@receiver(post_save, sender=Rol)
+@receiver(post_delete, sender=Rol)
+@receiver(post_save, sender=Procedimiento)
+@receiver(post_delete, sender=Procedimiento)
+def invalidar_matriz_permisos(sender, **kwargs):
+    invalidar_permisos()
+
+
+@receiver(m2m_changed, sender=Procedimiento.roles_inician.through)
+def invalidar_matriz_roles_inician(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_permisos()
+
+
+# Lecturas cacheadas por espacio (cache.cacheado): cada espacio caduca cuando
+# cambia alguno de los modelos de los que se arma
+ESPACIOS_POR_MODELO = {
+    PasoFlujo: ('flujo',),
+    Rol: ('flujo',),
+    Procedimiento: ('flujo', 'procedimientos'),
+    Requisito: ('procedimientos',),
+    DiaFeriado: ('feriados',),
+}
+
+
+@receiver(post_save, sender=PasoFlujo)
+@receiver(post_delete, sender=PasoFlujo)
+@receiver(post_save, sender=Rol)
+@receiver(post_delete, sender=Rol)
+@receiver(post_save, sender=Procedimiento)
+@receiver(post_delete, sender=Procedimiento)
+@receiver(post_save, sender=Requisito)
+@receiver(post_delete, sender=Requisito)
+@receiver(post_save, sender=DiaFeriado)
+@receiver(post_delete, sender=DiaFeriado)
+def invalidar_lecturas_cacheadas(sender, **kwargs):
+    invalidar_espacio(*ESPACIOS_POR_MODELO[sender])
+
+
+# PDF recién subido (archivo del expediente o adjunto de un paso): extraer su texto
+# en segundo plano. El archivo aún no guardado en el storage es el que es nuevo.
+@receiver(pre_save, sender=Documento)
+@receiver(pre_save, sender=Movimiento)
+def marcar_adjunto_nuevo(sender, instance, **kwargs):
+    archivo = instance.archivo_adjunto
+    instance._adjunto_nuevo = es_pdf(archivo) and not archivo._committed
+
+
+@receiver(post_save, sender=Documento)
+def extraer_adjunto_documento(sender, instance, **kwargs):
+    if getattr(instance, '_adjunto_nuevo', False):
+        encolar_extraccion(instance.pk)
+
+
+@receiver(post_save, sender=Movimiento)
+def extraer_adjunto_movimiento(sender, instance, **kwargs):
+    if getattr(instance, '_adjunto_nuevo', False):
+        encolar_extraccion(instance.documento_id)
@@ -0,0 +1,88 @@
+# gestion/sla.py
+"""
+Barrido periódico de plazos (SLA) de los expedientes.
+
+Se ejecuta con 'manage.py barrer_plazos' (cron cada pocos minutos). En cada pasada:
+  - Vencidos (rojo): avisa al responsable y escala a su jefe de área.
+  - Por vencer (amarillo): avisa solo al responsable.
+Cada expediente guarda el nivel de aviso enviado y la fecha límite a la que
+correspondía (nivel_sla / limite_sla), así cada pasada solo toca los expedientes
+que cruzaron un umbral desde la anterior.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .flujo import enlace_documento
+from .models import Documento, Notificacion, PerfilUsuario, condiciones_semaforo
+
+NIVEL_POR_VENCER = 1
+NIVEL_VENCIDO = 2
+
+
+def pendientes_de_aviso(nivel, ahora):
+    """Expedientes que cruzaron el umbral 'nivel' y aún no fueron avisados para su plazo actual."""
+    color = 'rojo' if nivel == NIVEL_VENCIDO else 'amarillo'
+    return (
+        Documento.objects.filter(condiciones_semaforo(ahora)[color], responsable_actual__isnull=False)
+        .exclude(limite_sla=F('fecha_limite_paso_actual'), nivel_sla__gte=nivel)
+    )
+
+
+def _jefes_por_unidad(unidades):
+    """Primer jefe de cada unidad organizativa (una consulta)."""
+    jefes = {}
+    for perfil in PerfilUsuario.objects.filter(unidad_organizativa__in=unidades, rol__es_jefe=True).order_by('id'):
+        jefes.setdefault(perfil.unidad_organizativa, perfil)
+    return jefes
+
+
+def _avisos(docs, nivel):
+    """Notificaciones del lote: al responsable y, si está vencido, a su jefe."""
+    jefes = _jefes_por_unidad({d.responsable_actual.unidad_organizativa for d in docs}) if nivel == NIVEL_VENCIDO else {}
+    avisos = []
+    for doc in docs:
+        vence = doc.fecha_limite_paso_actual.strftime('%d/%m/%Y %H:%M')
+        enlace = enlace_documento(doc)
+        if nivel == NIVEL_VENCIDO:
+            avisos.append(Notificacion(destinatario=doc.responsable_actual, enlace=enlace,
+                                       mensaje=f"🔴 Plazo VENCIDO: {doc.expediente_id} (venció {vence})"))
+            jefe = jefes.get(doc.responsable_actual.unidad_organizativa)
+            if jefe and jefe.pk != doc.responsable_actual_id:
+                avisos.append(Notificacion(destinatario=jefe, enlace=enlace,
+                                           mensaje=f"Escalamiento: {doc.expediente_id} vencido en bandeja de {doc.responsable_actual.usuario.username}"))
+        else:
+            avisos.append(Notificacion(destinatario=doc.responsable_actual, enlace=enlace,
+                                       mensaje=f"⚠️ Por vencer: {doc.expediente_id} (vence {vence})"))
+    return avisos
+
+
+def barrer_plazos(ahora, lote=500, simular=False):
+    """
+    Ejecuta una pasada. Devuelve {'vencidos': n, 'por_vencer': n, 'notificaciones': n}.
+    Con simular=True solo cuenta (no escribe nada).
+    """
+    resumen = {'vencidos': 0, 'por_vencer': 0, 'notificaciones': 0}
+    for nivel, clave in ((NIVEL_VENCIDO, 'vencidos'), (NIVEL_POR_VENCER, 'por_vencer')):
+        if simular:
+            resumen[clave] = pendientes_de_aviso(nivel, ahora).count()
+            continue
+
+        while True:
+            with transaction.atomic():
+                docs = list(
+                    pendientes_de_aviso(nivel, ahora)
+                    .select_for_update(of=('self',))
+                    .select_related('responsable_actual__usuario')
+                    .order_by('fecha_limite_paso_actual')[:lote]
+                )
+                if not docs:
+                    break
+
+                avisos = _avisos(docs, nivel)
+                Notificacion.objects.bulk_create(avisos, batch_size=lote)
+                Documento.objects.filter(pk__in=[d.pk for d in docs]).update(
+                    nivel_sla=nivel, limite_sla=F('fecha_limite_paso_actual')
+                )
+            resumen[clave] += len(docs)
+            resumen['notificaciones'] += len(avisos)
+    return resumen
@@ -11,11 +11,16 @@ urlpatterns = [
     path('reportes/', views.reportes_dashboard, name='reportes_dashboard'),
     path('reportes/exportar-csv/', views.exportar_documentos_csv, name='exportar_csv'),
     path('nuevo/', views.crear_documento, name='crear_documento'),
+    path('acciones-masivas/', views.accion_masiva, name='accion_masiva'),
     
     # --- AQUÍ MOVEMOS LO NUEVO ---
     path('mi-perfil/', views.perfil_usuario, name='perfil_usuario'),
     path('notificaciones/', views.listar_notificaciones, name='listar_notificaciones'),
     path('notificaciones/marcar-leidas/', views.marcar_notificaciones_leidas, name='marcar_leidas'),
+    path('remitentes/<str:identificador>/', views.historial_remitente, name='historial_remitente'),
+    path('api/remitentes/', views.autocompletar_remitente, name='api_remitentes'),
+    path('historico/', views.listar_historicos, name='listar_historicos'),
+    path('historico/<str:expediente_id>/', views.detalle_historico, name='detalle_historico'),
     # -----------------------------
 
     # 3. Rutas DINÁMICAS (Usan <str:expediente_id>) - Deben ir al final
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     # Esta será la URL para nuestra página de consulta
     path('', views.consulta_expediente, name='consulta_expediente'),
+    # Todos los expedientes de un DNI/RUC (con una Clave Web válida)
+    path('mis-tramites/', views.consulta_remitente, name='consulta_remitente'),
 ]
\ No newline at end of file
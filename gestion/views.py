@@ -1,14 +1,21 @@
+import hmac
+import logging
 import random
 import string
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, Count, F, Value
 from datetime import timedelta
 from django.utils import timezone
 import csv
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import Upper
+from django.utils.cache import patch_cache_control
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from decouple import config
@@ -17,16 +24,27 @@ import json
 from .forms import EditarPerfilForm
 
 # Importamos modelos y formularios
-from .models import Correlativo, Documento, Movimiento, Notificacion, PasoFlujo, Rol, Procedimiento
-from .forms import AnulacionForm, DocumentoForm, DerivacionForm, RedireccionForm
-
-from .models import DiaFeriado
+from .models import Documento, Movimiento, Notificacion, PasoFlujo, Rol, Procedimiento
+from .forms import AccionMasivaForm, AnulacionForm, DocumentoForm, DerivacionForm, RedireccionForm
+
+from .models import DiaFeriado, DocumentoHistorico, Remitente, URGENCIA_SEMAFORO
+from .busqueda import buscar
+from .cache import cacheado, clave_consulta, clave_listado_remitente, huella, normalizar_expediente, tiempo_cache_consulta
+from . import metricas
+from .ratelimit import ip_cliente, limitar_tasa
+from .remitentes import buscar_por_prefijo, vincular_remitente
+from .permisos import tiene_permiso
+from .flujo import (
+    TransicionConcurrente, liberar_numero, obtener_paso, pasos_de, siguiente_numero, transicion, transicion_masiva,
+)
 
 import qrcode
 from io import BytesIO
 import base64
 from django.urls import reverse
 
+logger = logging.getLogger(__name__)
+
 
 # Utilidad para calcular fechas laborales (Salta Sábados, Domingos y Feriados de la BD)
 def calcular_fecha_limite(dias_habiles):
@@ -36,7 +54,8 @@ def calcular_fecha_limite(dias_habiles):
     
     # Obtenemos la lista de feriados futuros para no consultar la BD en cada vuelta del bucle
     # (Optimizamos trayendo solo las fechas como un set de strings o dates)
-    feriados = set(DiaFeriado.objects.filter(fecha__gte=fecha_actual.date()).values_list('fecha', flat=True))
+    hoy = fecha_actual.date()
+    feriados = cacheado('feriados', f"desde:{hoy}", lambda: set(DiaFeriado.objects.filter(fecha__gte=hoy).values_list('fecha', flat=True)))
 
     while dias_agregados < dias_habiles:
         # Avanzamos un día
@@ -56,10 +75,10 @@ def calcular_fecha_limite(dias_habiles):
 
 @login_required
 def listar_documentos(request):
-    usuario = request.user.perfilusuario
+    usuario = request.perfil
     
     # 1. Base QuerySet (Seguridad por Rol)
-    if usuario.rol.nombre in ["Mesa de Partes", "Dirección General", "Área de Calidad"]:
+    if tiene_permiso(usuario, 'ver_todos'):
         docs = Documento.objects.all()
     else:
         docs = Documento.objects.filter(
@@ -70,20 +89,24 @@ def listar_documentos(request):
     # 2. Capturar Filtros
     q = request.GET.get('q')
     estado = request.GET.get('estado')
+    semaforo = request.GET.get('semaforo')
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
 
     # 3. Aplicar Filtros
     if q:
-        docs = docs.filter(
-            Q(expediente_id__icontains=q) |
-            Q(asunto__icontains=q) |
-            Q(remitente__icontains=q)
-        )
+        # Texto completo (tsvector / FTS5), con resultados ordenados por relevancia
+        docs = buscar(docs, q)
     
     if estado:
         docs = docs.filter(estado=estado)
 
+    # Semáforo calculado en la BD (filtrable y ordenable sin cargar todo en memoria)
+    ahora = timezone.now()
+    docs = docs.con_semaforo(ahora)
+    if semaforo in URGENCIA_SEMAFORO:
+        docs = docs.por_semaforo(semaforo, ahora)
+
     if fecha_inicio and fecha_fin:
         # Filtramos por rango de fechas (inclusive)
         # Ajustamos fecha_fin para que incluya todo el día (hasta las 23:59:59)
@@ -91,21 +114,64 @@ def listar_documentos(request):
         fecha_fin_ajustada = datetime.datetime.strptime(fecha_fin, "%Y-%m-%d") + datetime.timedelta(days=1)
         docs = docs.filter(fecha_ingreso__range=[fecha_inicio, fecha_fin_ajustada])
 
+    if request.GET.get('orden') == 'semaforo':
+        docs = docs.order_by('urgencia_semaforo', 'fecha_limite_paso_actual', '-fecha_ingreso')
+    elif q:
+        docs = docs.order_by(F('rango_busqueda').desc(nulls_last=True), '-fecha_ingreso')
+    else:
+        docs = docs.order_by('-fecha_ingreso')
+
     context = {
-        'documentos': docs.order_by('-fecha_ingreso'),
+        'documentos': docs.select_related('procedimiento'), # La tabla muestra el nombre del trámite
         'estados_documento': Documento.ESTADO_DOCUMENTO_CHOICES, # Para el select del HTML
+        'colores_semaforo': [('rojo', "Vencido"), ('amarillo', "Por vencer"), ('verde', "A tiempo")],
+        'form_masivo': AccionMasivaForm(perfil=usuario),
     }
     return render(request, 'gestion/listar_documentos.html', context)
 
 @login_required
-def crear_documento(request):
-    # 1. PREPARACIÓN DE REQUISITOS (JSON para Frontend)
+def accion_masiva(request):
+    """Deriva, asigna o redirecciona varios expedientes de la bandeja en una sola operación."""
+    if request.method != 'POST':
+        return redirect('lista_documentos')
+
+    form = AccionMasivaForm(request.POST, perfil=request.perfil)
+    ids = [int(i) for i in request.POST.getlist('documentos') if i.isdigit()]
+
+    if not ids:
+        messages.warning(request, "Seleccione al menos un expediente.")
+    elif not form.is_valid():
+        errores = "; ".join(e for lista in form.errors.values() for e in lista)
+        messages.error(request, f"No se pudo aplicar la acción masiva: {errores}")
+    else:
+        procesados, omitidos = transicion_masiva(
+            ids, request.perfil,
+            accion=form.cleaned_data['accion'],
+            observaciones=form.cleaned_data['observaciones'],
+            destino=form.cleaned_data['destino'],
+            fecha_limite=calcular_fecha_limite(2) # Mismo plazo que la derivación TUPA individual
+        )
+        if procesados:
+            messages.success(request, f"✅ {len(procesados)} expediente(s) procesados.")
+        if omitidos:
+            messages.warning(request, f"Se omitieron {len(omitidos)} expediente(s) que requieren atención individual: {', '.join(omitidos[:10])}")
+        no_disponibles = len(ids) - len(procesados) - len(omitidos)
+        if no_disponibles:
+            messages.warning(request, f"{no_disponibles} expediente(s) ya no estaban en su bandeja.")
+
+    return redirect('lista_documentos')
+
+def requisitos_json():
+    """{procedimiento_id: [requisitos]} en JSON, para mostrarlos al elegir el trámite."""
     dict_requisitos = {}
     for proc in Procedimiento.objects.prefetch_related('requisitos').all():
-        lista_reqs = [r.nombre for r in proc.requisitos.all()]
-        dict_requisitos[proc.id] = lista_reqs
+        dict_requisitos[proc.id] = [r.nombre for r in proc.requisitos.all()]
+    return json.dumps(dict_requisitos)
 
-    json_requisitos = json.dumps(dict_requisitos)
+@login_required
+def crear_documento(request):
+    # 1. PREPARACIÓN DE REQUISITOS (JSON para Frontend, cacheado hasta que cambie el TUPA)
+    json_requisitos = cacheado('procedimientos', 'requisitos_json', requisitos_json)
 
     if request.method == 'POST':
         # Pasamos user=request.user para validar permisos en el form
@@ -123,16 +189,19 @@ def crear_documento(request):
             # Lógica para Trámite Interno (Si marcaron el switch)
             if request.POST.get('es_interno') == 'on':
                 doc.tipo_remitente = 'PJ' 
-                doc.remitente = request.user.perfilusuario.unidad_organizativa
+                doc.remitente = request.perfil.unidad_organizativa
                 doc.identificador_remitente = None
 
+            # Ficha del remitente (DNI/RUC) en el directorio
+            vincular_remitente(doc)
+
             # Guardamos INICIALMENTE en paso 1 para tener ID
             doc.paso_actual = 1
             doc.save()
             
             # Definimos quién es el origen real (El usuario logueado)
-            usuario_actual = request.user.perfilusuario
-            print(f"--- NUEVO DOC: {doc.expediente_id} ---")
+            usuario_actual = request.perfil
+            logger.info("Nuevo expediente %s", doc.expediente_id)
 
             # 2. REGISTRAR EL INICIO (Paso 1 - Historial de Origen)
             Movimiento.objects.create(
@@ -156,22 +225,22 @@ def crear_documento(request):
                 responsable_destino = destino_manual
                 nuevo_paso = 2 # Simulamos paso 2 lógico
                 es_destino_manual = True
-                print(f"-> Salto Manual a: {responsable_destino}")
+                logger.debug("%s: salto manual a %s", doc.expediente_id, responsable_destino)
             
             # B. Ruta Automática TUPA (Prioridad 2: Si hay flujo definido en BD)
             else:
                 try:
                     # Buscamos el Paso 2 en la BD
-                    paso_2 = PasoFlujo.objects.get(procedimiento=doc.procedimiento, orden=2)
+                    paso_2 = obtener_paso(doc.procedimiento_id, 2)
                     # Buscamos quién es el responsable (Ej: Secretaria Académica)
                     responsable_destino = paso_2.rol_responsable.perfilusuario_set.first()
                     nuevo_paso = 2
-                    print(f"-> Salto Automático a Paso 2: {responsable_destino} (Rol: {paso_2.rol_responsable})")
+                    logger.debug("%s: salto automático a paso 2: %s (rol %s)", doc.expediente_id, responsable_destino, paso_2.rol_responsable)
                 except PasoFlujo.DoesNotExist:
-                    print("-> Info: No existe Paso 2 configurado.")
+                    logger.info("%s: el procedimiento no tiene paso 2 configurado", doc.expediente_id)
                     responsable_destino = None
-                except Exception as e:
-                    print(f"-> Error buscando responsable: {e}")
+                except Exception:
+                    logger.exception("%s: error buscando el responsable del paso 2", doc.expediente_id)
                     responsable_destino = None
 
             # 4. EJECUTAR EL SALTO (Actualizar y Derivar)
@@ -193,7 +262,11 @@ def crear_documento(request):
                 
                 doc.fecha_limite_paso_actual = calcular_fecha_limite(dias_plazo)
                 doc.fecha_limite_total = calcular_fecha_limite(doc.procedimiento.plazo_dias_habiles)
-                doc.save()
+                # Solo los campos del flujo: el primer save() ya encoló la extracción del PDF,
+                # que puede haber guardado texto_adjuntos mientras tanto
+                doc.save(update_fields=[
+                    'responsable_actual', 'paso_actual', 'estado', 'fecha_limite_paso_actual', 'fecha_limite_total',
+                ])
 
                 # Crear movimiento de derivación
                 Movimiento.objects.create(
@@ -216,7 +289,7 @@ def crear_documento(request):
             else:
                 # Si no hubo destino, se queda en bandeja de origen
                 doc.responsable_actual = usuario_actual
-                doc.save()
+                doc.save(update_fields=['responsable_actual'])
                 messages.warning(request, f"Expediente {doc.expediente_id} registrado en su bandeja personal. (No se derivó automáticamente).")
 
             return redirect('lista_documentos')
@@ -234,20 +307,12 @@ def generar_codigo_expediente():
     """Calcula el siguiente número de expediente para el año actual"""
     anio_actual = timezone.now().year
     
-    # Busca el contador de tipo 'EXPEDIENTE' para este año. Si no existe, lo crea en 0.
-    contador, created = Correlativo.objects.get_or_create(
-        anio=anio_actual,
-        tipo='EXPEDIENTE', # Usamos este tipo específico para diferenciar de Resoluciones
-        defaults={'ultimo_numero': 0}
-    )
-    
-    # Incrementamos el número
-    contador.ultimo_numero += 1
-    contador.save()
+    # Contador de tipo 'EXPEDIENTE' (diferente de Resoluciones), incrementado atómicamente en la BD
+    numero = siguiente_numero('EXPEDIENTE', anio_actual)
     
     # Formateamos: EXP-2025-0001
     # :04d significa que rellene con ceros hasta 4 dígitos (0001, 0015, 0100)
-    return f"EXP-{anio_actual}-{contador.ultimo_numero:04d}"
+    return f"EXP-{anio_actual}-{numero:04d}"
 
 # --- VISTAS DE MANTENIMIENTO (EDITAR / ELIMINAR) ---
 
@@ -255,10 +320,10 @@ def generar_codigo_expediente():
 def editar_documento(request, expediente_id):
     documento = get_object_or_404(Documento, expediente_id=expediente_id)
     
-    es_mesa_partes = request.user.perfilusuario.rol.nombre == "Mesa de Partes"
-    es_responsable = documento.responsable_actual == request.user.perfilusuario
+    puede_editar_cualquiera = tiene_permiso(request.perfil, 'editar_cualquiera')
+    es_responsable = documento.responsable_actual == request.perfil
     
-    if not (es_responsable or es_mesa_partes):
+    if not (es_responsable or puede_editar_cualquiera):
         messages.error(request, "No tienes permiso para editar este documento.")
         return redirect('detalle_documento', expediente_id=expediente_id)
 
@@ -293,14 +358,16 @@ def editar_documento(request, expediente_id):
             if request.FILES.get('archivo_adjunto'):
                 cambios_detectados.append("Se reemplazó el archivo principal del expediente.")
 
-            # Guardamos los cambios reales
-            doc_guardado = form.save()
+            # Guardamos los cambios reales (reenlazando la ficha si cambió el DNI/RUC o el nombre)
+            doc_guardado = form.save(commit=False)
+            vincular_remitente(doc_guardado)
+            doc_guardado.save()
 
             # Si hubo cambios, creamos el Log
             if cambios_detectados:
                 LogEdicion.objects.create(
                     documento=doc_guardado,
-                    usuario=request.user.perfilusuario,
+                    usuario=request.perfil,
                     cambios=" | ".join(cambios_detectados)
                 )
             # ---------------------------
@@ -308,7 +375,7 @@ def editar_documento(request, expediente_id):
             messages.success(request, "Documento actualizado correctamente.")
             return redirect('detalle_documento', expediente_id=documento.expediente_id)
         else:
-            print("🔴 ERROR AL EDITAR:", form.errors)
+            logger.warning("No se pudo editar %s: %s", documento.expediente_id, form.errors.as_json())
             messages.error(request, "No se pudo guardar. Revisa los errores.")
     else:
         form = DocumentoForm(instance=documento)
@@ -319,7 +386,7 @@ def editar_documento(request, expediente_id):
 def eliminar_documento(request, expediente_id):
     documento = get_object_or_404(Documento, expediente_id=expediente_id)
     
-    if request.user.perfilusuario.rol.nombre != "Mesa de Partes":
+    if not tiene_permiso(request.perfil, 'eliminar'):
         messages.error(request, "Solo Mesa de Partes tiene autorización para eliminar expedientes.")
         return redirect('detalle_documento', expediente_id=expediente_id)
 
@@ -336,8 +403,14 @@ def eliminar_documento(request, expediente_id):
 
 @login_required
 def detalle_documento(request, expediente_id):
-    doc = get_object_or_404(Documento, expediente_id=expediente_id)
-    movimientos = doc.movimiento_set.all().order_by('-fecha_movimiento')
+    doc = Documento.objects.filter(expediente_id=expediente_id).first()
+    if doc is None:
+        # Los enlaces antiguos (notificaciones, QR) siguen funcionando tras archivarse
+        if DocumentoHistorico.objects.filter(expediente_id=expediente_id).exists():
+            return redirect('detalle_historico', expediente_id=expediente_id)
+        raise Http404("No existe el expediente.")
+    # La línea de tiempo muestra quién envió y quién recibió cada movimiento
+    movimientos = doc.movimiento_set.select_related('usuario_origen__usuario', 'unidad_destino__usuario').order_by('-fecha_movimiento')
     
     # 1. DETECTAR DESVÍO
     # Buscamos si algún movimiento tiene la marca de desvío
@@ -353,9 +426,9 @@ def detalle_documento(request, expediente_id):
         pasos_flujo = []
     else:
         # Si es normal, mostramos el plan teórico
-        pasos_flujo = PasoFlujo.objects.filter(procedimiento=doc.procedimiento).order_by('orden')
+        pasos_flujo = pasos_de(doc.procedimiento_id)
     
-    es_responsable = (doc.responsable_actual == request.user.perfilusuario)
+    es_responsable = (doc.responsable_actual == request.perfil)
     
     # 3. CÁLCULO DE TIEMPO (Igual que antes)
     tiempo_restante_str = ""
@@ -391,6 +464,7 @@ def detalle_documento(request, expediente_id):
         'historial': movimientos,
         'es_responsable': es_responsable,
         'pasos_flujo': pasos_flujo,
+        'logs_edicion': doc.logs_edicion.select_related('usuario__usuario', 'usuario__rol'),
         'tiempo_restante_str': tiempo_restante_str,
         'es_vencido': es_vencido,
     })
@@ -401,7 +475,7 @@ def derivar_documento(request, expediente_id):
     doc = get_object_or_404(Documento, expediente_id=expediente_id)
     
     # 1. SEGURIDAD: Verificar que el usuario actual tiene el documento en su bandeja
-    if doc.responsable_actual != request.user.perfilusuario:
+    if doc.responsable_actual != request.perfil:
         messages.error(request, "No tienes permiso para procesar este documento actualmente.")
         return redirect('lista_documentos')
 
@@ -415,7 +489,7 @@ def derivar_documento(request, expediente_id):
     
     if not es_flujo_libre:
         try:
-            siguiente_paso = PasoFlujo.objects.get(procedimiento=doc.procedimiento, orden=doc.paso_actual + 1)
+            siguiente_paso = obtener_paso(doc.procedimiento_id, doc.paso_actual + 1)
             nombre_siguiente_area = siguiente_paso.rol_responsable.nombre
         except PasoFlujo.DoesNotExist:
             es_ultimo_paso = True
@@ -426,7 +500,7 @@ def derivar_documento(request, expediente_id):
     form = DerivacionForm(request.POST or None, request.FILES or None, user=request.user)
 
     # 4. LÓGICA DE JERARQUÍA (JEFE vs ASISTENTE)
-    perfil_actual = request.user.perfilusuario
+    perfil_actual = request.perfil
     es_jefe = perfil_actual.rol.es_jefe
     
     # Variables para controlar qué botones ve el usuario en el HTML
@@ -450,259 +524,241 @@ def derivar_documento(request, expediente_id):
             mostrar_boton_retornar_jefe = True
 
     # 5. PROCESAMIENTO DEL FORMULARIO (POST)
+    # Cada acción se aplica con flujo.transicion(): una transacción corta con UPDATE
+    # condicional (si otro usuario ya movió el expediente, se lanza TransicionConcurrente).
     if request.method == 'POST':
         accion = request.POST.get('accion')
         
         if form.is_valid():
             obs = form.cleaned_data['observaciones']
             archivo = form.cleaned_data['archivo_adjunto']
+            reserva = None # (anio, numero) del N° de RD reservado para esta derivación
             
-            # ---------------------------------------------------------------
-            # OPCIÓN A: ASIGNACIÓN INTERNA (De Jefe a Asistente)
-            # ---------------------------------------------------------------
-            if accion == 'asignar_interno':
-                # Intentamos obtener el responsable del campo select
-                nuevo_responsable = form.cleaned_data['responsable_interno']
-                
-                # Respaldo: A veces el modal envía el ID en un hidden input si el select está fuera
-                if not nuevo_responsable:
-                    id_resp = request.POST.get('responsable_interno')
-                    if id_resp:
-                        try:
-                            nuevo_responsable = PerfilUsuario.objects.get(id=id_resp)
-                        except:
-                            pass
-
-                if nuevo_responsable:
-                    # Cambiamos responsable, PERO MANTENEMOS EL PASO Y ESTADO
-                    doc.responsable_actual = nuevo_responsable
-                    doc.save()
-                    
-                    Movimiento.objects.create(
-                        documento=doc,
-                        usuario_origen=request.user.perfilusuario,
-                        unidad_destino=nuevo_responsable,
-                        tipo='asignacion_interna',
-                        paso_flujo=doc.paso_actual, # Se mantiene en el mismo paso
-                        observaciones=f"ASIGNACIÓN INTERNA: {obs}",
-                        archivo_adjunto=archivo
-                    )
-                    
-                    Notificacion.objects.create(
-                        destinatario=nuevo_responsable,
-                        mensaje=f"Tarea asignada por Jefatura: {doc.expediente_id}",
-                        enlace=f"/documentos/{doc.expediente_id}/"
-                    )
-                    
-                    messages.success(request, f"Expediente asignado internamente a {nuevo_responsable}.")
-                    return redirect('lista_documentos')
-                else:
-                    messages.error(request, "Debe seleccionar un miembro del equipo para asignar.")
-
-            # ---------------------------------------------------------------
-            # OPCIÓN B: RETORNAR A JEFATURA (De Asistente a Jefe)
-            # ---------------------------------------------------------------
-            elif accion == 'retornar_jefe':
-                if jefe_area:
-                    doc.responsable_actual = jefe_area
-                    doc.save()
+            try:
+                # ---------------------------------------------------------------
+                # OPCIÓN A: ASIGNACIÓN INTERNA (De Jefe a Asistente)
+                # ---------------------------------------------------------------
+                if accion == 'asignar_interno':
+                    # Intentamos obtener el responsable del campo select
+                    nuevo_responsable = form.cleaned_data['responsable_interno']
                     
-                    Movimiento.objects.create(
-                        documento=doc,
-                        usuario_origen=request.user.perfilusuario,
-                        unidad_destino=jefe_area,
-                        tipo='asignacion_interna', # Tipo interno para estadísticas
-                        paso_flujo=doc.paso_actual,
-                        observaciones=f"ENTREGA DE TRABAJO (Retorno a Jefatura): {obs}",
-                        archivo_adjunto=archivo
-                    )
+                    # Respaldo: A veces el modal envía el ID en un hidden input si el select está fuera
+                    if not nuevo_responsable:
+                        id_resp = request.POST.get('responsable_interno')
+                        if id_resp:
+                            try:
+                                nuevo_responsable = PerfilUsuario.objects.get(id=id_resp)
+                            except:
+                                pass
+
+                    if nuevo_responsable:
+                        # Cambiamos responsable, PERO MANTENEMOS EL PASO Y ESTADO
+                        transicion(
+                            doc, request.perfil,
+                            cambios={'responsable_actual': nuevo_responsable},
+                            tipo='asignacion_interna',
+                            accion=accion,
+                            observaciones=f"ASIGNACIÓN INTERNA: {obs}",
+                            destino=nuevo_responsable,
+                            archivo=archivo,
+                            aviso=f"Tarea asignada por Jefatura: {doc.expediente_id}"
+                        )
+                        
+                        messages.success(request, f"Expediente asignado internamente a {nuevo_responsable}.")
+                        return redirect('lista_documentos')
+                    else:
+                        messages.error(request, "Debe seleccionar un miembro del equipo para asignar.")
+
+                # ---------------------------------------------------------------
+                # OPCIÓN B: RETORNAR A JEFATURA (De Asistente a Jefe)
+                # ---------------------------------------------------------------
+                elif accion == 'retornar_jefe':
+                    if jefe_area:
+                        transicion(
+                            doc, request.perfil,
+                            cambios={'responsable_actual': jefe_area},
+                            tipo='asignacion_interna', # Tipo interno para estadísticas
+                            accion=accion,
+                            observaciones=f"ENTREGA DE TRABAJO (Retorno a Jefatura): {obs}",
+                            destino=jefe_area,
+                            archivo=archivo,
+                            aviso=f"Expediente devuelto por asistente: {doc.expediente_id}"
+                        )
+                        messages.success(request, f"Expediente entregado exitosamente a su Jefe ({jefe_area}).")
+                        return redirect('lista_documentos')
+                    else:
+                        messages.error(request, "No se encontró un Jefe de Área asignado para devolver el trámite.")
+
+                # ---------------------------------------------------------------
+                # OPCIÓN C: OBSERVAR / DEVOLVER (Rechazo al área anterior)
+                # ---------------------------------------------------------------
+                elif accion == 'observar':
+                    # Buscamos quién me envió el documento (último movimiento hacia mí)
+                    mov_previo = Movimiento.objects.filter(documento=doc, unidad_destino=request.perfil).select_related('usuario_origen').last()
                     
-                    Notificacion.objects.create(
-                        destinatario=jefe_area,
-                        mensaje=f"Expediente devuelto por asistente: {doc.expediente_id}",
-                        enlace=f"/documentos/{doc.expediente_id}/"
+                    if mov_previo and mov_previo.usuario_origen:
+                        usuario_retorno = mov_previo.usuario_origen
+                        cambios = {'responsable_actual': usuario_retorno, 'estado': 'observado'}
+                        
+                        # Si fue una asignación interna, NO retrocedemos el número de paso del TUPA
+                        if mov_previo.tipo != 'asignacion_interna':
+                            cambios['paso_actual'] = max(1, doc.paso_actual - 1)
+                        
+                        transicion(
+                            doc, request.perfil,
+                            cambios=cambios,
+                            tipo='observacion',
+                            accion=accion,
+                            observaciones=f"OBSERVADO/DEVUELTO: {obs}",
+                            destino=usuario_retorno,
+                            archivo=archivo,
+                            aviso=f"Documento OBSERVADO/DEVUELTO: {doc.expediente_id}"
+                        )
+
+                        messages.warning(request, f"Documento devuelto a {usuario_retorno}.")
+                        return redirect('lista_documentos')
+                    else:
+                        messages.error(request, "No se puede devolver: No se encontró historial de procedencia.")
+
+                # ---------------------------------------------------------------
+                # OPCIÓN D: TRÁMITE EXTERNO (Pausa)
+                # ---------------------------------------------------------------
+                elif accion == 'externo':
+                    transicion(
+                        doc, request.perfil,
+                        cambios={'estado': 'externo', 'fecha_limite_paso_actual': None}, # Pausar reloj
+                        tipo='externo',
+                        accion=accion,
+                        observaciones=f"SALIDA EXTERNA: {obs}",
+                        archivo=archivo
                     )
-                    messages.success(request, f"Expediente entregado exitosamente a su Jefe ({jefe_area}).")
+                    messages.info(request, "Documento marcado como Trámite Externo (Plazo pausado).")
                     return redirect('lista_documentos')
-                else:
-                    messages.error(request, "No se encontró un Jefe de Área asignado para devolver el trámite.")
-
-            # ---------------------------------------------------------------
-            # OPCIÓN C: OBSERVAR / DEVOLVER (Rechazo al área anterior)
-            # ---------------------------------------------------------------
-            elif accion == 'observar':
-                # Buscamos quién me envió el documento (último movimiento hacia mí)
-                mov_previo = Movimiento.objects.filter(documento=doc, unidad_destino=request.user.perfilusuario).last()
-                
-                if mov_previo and mov_previo.usuario_origen:
-                    usuario_retorno = mov_previo.usuario_origen
-                    doc.responsable_actual = usuario_retorno
-                    
-                    # Si fue una asignación interna, NO retrocedemos el número de paso del TUPA
-                    if mov_previo.tipo != 'asignacion_interna':
-                        doc.paso_actual = max(1, doc.paso_actual - 1)
-                    
-                    doc.estado = 'observado'
-                    doc.save()
-                    
-                    Movimiento.objects.create(
-                        documento=doc,
-                        usuario_origen=request.user.perfilusuario,
-                        unidad_destino=usuario_retorno,
-                        tipo='observacion',
-                        paso_flujo=doc.paso_actual,
-                        observaciones=f"OBSERVADO/DEVUELTO: {obs}",
-                        archivo_adjunto=archivo
-                    )
 
-                    Notificacion.objects.create(
-                        destinatario=usuario_retorno,
-                        mensaje=f"Documento OBSERVADO/DEVUELTO: {doc.expediente_id}",
-                        enlace=f"/documentos/{doc.expediente_id}/"
-                    )
+                # ---------------------------------------------------------------
+                # OPCIÓN E: APROBAR / DERIVAR (Avance Normal o Forzado)
+                # ---------------------------------------------------------------
+                elif accion == 'derivar':
+                    destino_final = None
+                    es_finalizacion = False
+                    es_desvio_manual = False # Flag para saber si fue forzado
 
-                    messages.warning(request, f"Documento devuelto a {usuario_retorno}.")
-                    return redirect('lista_documentos')
-                else:
-                    messages.error(request, "No se puede devolver: No se encontró historial de procedencia.")
-
-            # ---------------------------------------------------------------
-            # OPCIÓN D: TRÁMITE EXTERNO (Pausa)
-            # ---------------------------------------------------------------
-            elif accion == 'externo':
-                doc.estado = 'externo'
-                doc.fecha_limite_paso_actual = None # Pausar reloj
-                doc.save()
-                
-                Movimiento.objects.create(
-                    documento=doc, 
-                    usuario_origen=request.user.perfilusuario, 
-                    unidad_destino=None,
-                    tipo='externo', 
-                    paso_flujo=doc.paso_actual, 
-                    observaciones=f"SALIDA EXTERNA: {obs}", 
-                    archivo_adjunto=archivo
-                )
-                messages.info(request, "Documento marcado como Trámite Externo (Plazo pausado).")
-                return redirect('lista_documentos')
-
-            # ---------------------------------------------------------------
-            # OPCIÓN E: APROBAR / DERIVAR (Avance Normal o Forzado)
-            # ---------------------------------------------------------------
-            elif accion == 'derivar':
-                destino_final = None
-                es_finalizacion = False
-                es_desvio_manual = False # Flag para saber si fue forzado
-
-                # --- 1. Generación de PDF Automático (Resoluciones) ---
-                paso_actual_obj = PasoFlujo.objects.filter(procedimiento=doc.procedimiento, orden=doc.paso_actual).first()
-                if paso_actual_obj and "Resolución" in paso_actual_obj.descripcion:
-                    codigo_resolucion = obtener_siguiente_correlativo()
-                    try:
-                        from .utils import generar_pdf_resolucion
-                        scheme = request.is_secure() and "https" or "http"
-                        host_url = f"{scheme}://{request.get_host()}"
-                        pdf_content = generar_pdf_resolucion(doc, codigo_resolucion, host_url)
-                        if pdf_content:
-                            archivo = pdf_content
-                            obs = f"[{codigo_resolucion}] Resolución generada automáticamente.\n{obs}"
-                            messages.success(request, f"📄 ¡Resolución {codigo_resolucion} generada!")
-                    except Exception as e:
-                        print(f"Error PDF: {e}")
-
-                # --- 2. DETERMINAR EL DESTINO (LÓGICA PRIORITARIA) ---
-                
-                # Leemos el check de forzar cambio
-                forzar_cambio = form.cleaned_data.get('forzar_destino')
-                destino_manual = form.cleaned_data.get('destino_libre')
-
-                # PRIORIDAD 1: ¿Es Flujo Libre O se forzó el cambio? -> MANUAL
-                if es_flujo_libre or forzar_cambio:
-                    if destino_manual:
-                        destino_final = destino_manual
-                        if forzar_cambio: es_desvio_manual = True # Marcamos el desvío
-                    else:
-                        # Si forzó cambio pero no eligió nada, error (salvo que sea libre y quiera finalizar)
-                        if forzar_cambio:
-                             messages.error(request, "⚠️ Si activa el cambio de ruta forzado, debe seleccionar un destino.")
-                             return redirect('detalle_documento', expediente_id=expediente_id)
-                        es_finalizacion = True # Si es libre y vacío -> Finalizar
-
-                # PRIORIDAD 2: Flujo TUPA Automático
-                elif es_ultimo_paso:
-                    es_finalizacion = True
-                else:
-                    try:
-                        siguiente_paso_bd = PasoFlujo.objects.get(procedimiento=doc.procedimiento, orden=doc.paso_actual + 1)
-                        destino_final = siguiente_paso_bd.rol_responsable.perfilusuario_set.first()
-                    except PasoFlujo.DoesNotExist:
-                        # Si no hay siguiente paso configurado, finalizamos
+                    # --- 1. DETERMINAR EL DESTINO (LÓGICA PRIORITARIA) ---
+                    
+                    # Leemos el check de forzar cambio
+                    forzar_cambio = form.cleaned_data.get('forzar_destino')
+                    destino_manual = form.cleaned_data.get('destino_libre')
+
+                    # PRIORIDAD 1: ¿Es Flujo Libre O se forzó el cambio? -> MANUAL
+                    if es_flujo_libre or forzar_cambio:
+                        if destino_manual:
+                            destino_final = destino_manual
+                            if forzar_cambio: es_desvio_manual = True # Marcamos el desvío
+                        else:
+                            # Si forzó cambio pero no eligió nada, error (salvo que sea libre y quiera finalizar)
+                            if forzar_cambio:
+                                 messages.error(request, "⚠️ Si activa el cambio de ruta forzado, debe seleccionar un destino.")
+                                 return redirect('detalle_documento', expediente_id=expediente_id)
+                            es_finalizacion = True # Si es libre y vacío -> Finalizar
+
+                    # PRIORIDAD 2: Flujo TUPA Automático
+                    elif es_ultimo_paso:
                         es_finalizacion = True
-
-                # --- 3. EJECUTAR LA ACCIÓN ---
+                    else:
+                        try:
+                            siguiente_paso_bd = obtener_paso(doc.procedimiento_id, doc.paso_actual + 1)
+                            destino_final = siguiente_paso_bd.rol_responsable.perfilusuario_set.first()
+                        except PasoFlujo.DoesNotExist:
+                            # Si no hay siguiente paso configurado, finalizamos
+                            es_finalizacion = True
+
+                    if not (es_finalizacion or destino_final):
+                        messages.error(request, "Error crítico: No se pudo determinar el destino. Contacte al administrador.")
+                        return redirect('detalle_documento', expediente_id=expediente_id)
+
+                    # --- 2. Generación de PDF Automático (Resoluciones) ---
+                    # El N° de RD se reserva en una transacción corta, solo tras comprobar (con el
+                    # expediente bloqueado) que sigue en poder del usuario. El PDF se genera fuera
+                    # de ella, sin bloqueos; si al final otro usuario se adelanta, transicion()
+                    # lanza TransicionConcurrente y la reserva se devuelve (ver except).
+                    paso_actual_obj = next((p for p in pasos_de(doc.procedimiento_id) if p.orden == doc.paso_actual), None)
+                    if paso_actual_obj and "Resolución" in paso_actual_obj.descripcion:
+                        with transaction.atomic():
+                            sigue_en_poder = Documento.objects.select_for_update().filter(
+                                pk=doc.pk, responsable_actual=request.perfil, paso_actual=doc.paso_actual
+                            ).exists()
+                            if not sigue_en_poder:
+                                raise TransicionConcurrente(doc.expediente_id)
+                            anio = timezone.now().year
+                            numero = siguiente_numero('RESOLUCION_DIRECTORAL', anio)
+                        reserva = (anio, numero)
+                        codigo_resolucion = formatear_correlativo(numero, anio)
+                        pdf_content = None
+                        try:
+                            from .utils import generar_pdf_resolucion
+                            scheme = request.is_secure() and "https" or "http"
+                            host_url = f"{scheme}://{request.get_host()}"
+                            pdf_content = generar_pdf_resolucion(doc, codigo_resolucion, host_url)
+                            if pdf_content:
+                                archivo = pdf_content
+                                obs = f"[{codigo_resolucion}] Resolución generada automáticamente.\n{obs}"
+                                messages.success(request, f"📄 ¡Resolución {codigo_resolucion} generada!")
+                        except Exception:
+                            logger.exception("Error generando la resolución %s de %s", codigo_resolucion, doc.expediente_id)
+                        if not pdf_content:
+                            # Sin PDF el N° no figura en ningún documento: se devuelve
+                            liberar_numero('RESOLUCION_DIRECTORAL', anio, numero)
+                            reserva = None
+
+                    # --- 3. EJECUTAR LA ACCIÓN ---
                 
-                if es_finalizacion:
-                    doc.estado = 'atendido'
-                    doc.responsable_actual = None
-                    doc.fecha_limite_paso_actual = None
-                    doc.save()
-                    
-                    Movimiento.objects.create(
-                        documento=doc, 
-                        usuario_origen=request.user.perfilusuario, 
-                        unidad_destino=None,
-                        tipo='finalizacion', 
-                        paso_flujo=doc.paso_actual, 
-                        observaciones=obs, 
-                        archivo_adjunto=archivo
-                    )
-                    messages.success(request, "Trámite finalizado y archivado exitosamente.")
+                    if es_finalizacion:
+                        transicion(
+                            doc, request.perfil,
+                            cambios={'estado': 'atendido', 'responsable_actual': None, 'fecha_limite_paso_actual': None},
+                            tipo='finalizacion',
+                            accion=accion,
+                            observaciones=obs,
+                            archivo=archivo
+                        )
+                        messages.success(request, "Trámite finalizado y archivado exitosamente.")
                 
-                elif destino_final:
-                    doc.responsable_actual = destino_final
-                    
-                    # Avanzamos el paso (contador)
-                    doc.paso_actual += 1
-                    doc.estado = 'en_proceso'
-                    
-
-                    if es_flujo_libre or es_desvio_manual:
-                        dias_a_sumar = doc.procedimiento.plazo_dias_habiles
                     else:
-                        dias_a_sumar = 2
+                        if es_flujo_libre or es_desvio_manual:
+                            dias_a_sumar = doc.procedimiento.plazo_dias_habiles
+                        else:
+                            dias_a_sumar = 2
                     
-                    doc.fecha_limite_paso_actual = calcular_fecha_limite(dias_a_sumar)
-                    # -------------------
+                        # Si hubo desvío, lo indicamos en la observación para auditoría
+                        obs_final = f"[DESVÍO DE RUTA] {obs}" if es_desvio_manual else obs
                     
-                    doc.save()
+                        # Avanzamos el paso (contador)
+                        transicion(
+                            doc, request.perfil,
+                            cambios={
+                                'responsable_actual': destino_final,
+                                'paso_actual': doc.paso_actual + 1,
+                                'estado': 'en_proceso',
+                                'fecha_limite_paso_actual': calcular_fecha_limite(dias_a_sumar),
+                            },
+                            tipo='derivacion',
+                            accion=accion,
+                            observaciones=obs_final,
+                            destino=destino_final,
+                            archivo=archivo,
+                            aviso=f"Expediente recibido: {doc.expediente_id}"
+                        )
                     
-                    # Si hubo desvío, lo indicamos en la observación para auditoría
-                    obs_final = f"[DESVÍO DE RUTA] {obs}" if es_desvio_manual else obs
-                    
-                    Movimiento.objects.create(
-                        documento=doc, 
-                        usuario_origen=request.user.perfilusuario, 
-                        unidad_destino=destino_final,
-                        tipo='derivacion', 
-                        paso_flujo=doc.paso_actual, 
-                        observaciones=obs_final, 
-                        archivo_adjunto=archivo
-                    )
-                    
-                    Notificacion.objects.create(
-                        destinatario=destino_final,
-                        mensaje=f"Expediente recibido: {doc.expediente_id}",
-                        enlace=f"/documentos/{doc.expediente_id}/"
-                    )
-                    
-                    msg_extra = " (Ruta modificada manualmente)" if es_desvio_manual else ""
-                    messages.success(request, f"Derivado correctamente a {destino_final.unidad_organizativa}{msg_extra}.")
-                
-                else:
-                    messages.error(request, "Error crítico: No se pudo determinar el destino. Contacte al administrador.")
-                    return redirect('detalle_documento', expediente_id=expediente_id)
+                        msg_extra = " (Ruta modificada manualmente)" if es_desvio_manual else ""
+                        messages.success(request, f"Derivado correctamente a {destino_final.unidad_organizativa}{msg_extra}.")
+
+                    return redirect('lista_documentos')
 
-                return redirect('lista_documentos')
+            except TransicionConcurrente:
+                if reserva:
+                    liberar_numero('RESOLUCION_DIRECTORAL', *reserva)
+                messages.error(request, "⚠️ Otro usuario procesó este expediente mientras usted lo atendía. Revise su estado actual.")
+                return redirect('detalle_documento', expediente_id=expediente_id)
 
     # Renderizar vista con todas las variables de control
     return render(request, 'gestion/derivar_documento.html', {
@@ -717,13 +773,10 @@ def derivar_documento(request, expediente_id):
     })
 
 
-@login_required
-def reportes_dashboard(request):
-    usuario = request.user.perfilusuario
-    rol_nombre = usuario.rol.nombre
-    
+def _contexto_reportes(usuario, es_directivo):
+    """KPIs y datos de los gráficos del dashboard (todo en listas/valores, para poder cachearlo)."""
     # 1. UNIVERSO DE DATOS (Fuente de Verdad)
-    if rol_nombre in ["Dirección General", "Área de Calidad"]:
+    if es_directivo:
         # Directivos: Ven todo el sistema
         docs_base = Documento.objects.all()
     else:
@@ -761,7 +814,7 @@ def reportes_dashboard(request):
     # 3. GRÁFICOS
     
     # Gráfico 1: Estado (Doughnut)
-    docs_por_estado = docs_base.values('estado').annotate(total=Count('id')).order_by('-total')
+    docs_por_estado = list(docs_base.values('estado').annotate(total=Count('id')).order_by('-total'))
     estado_map = dict(Documento.ESTADO_DOCUMENTO_CHOICES)
     chart_labels = [estado_map.get(item['estado'], item['estado']) for item in docs_por_estado]
     chart_data = [item['total'] for item in docs_por_estado]
@@ -769,14 +822,18 @@ def reportes_dashboard(request):
     # Gráfico 2: Carga Laboral (Barras)
     area_labels = []
     area_data = []
+    alertas_area = []
     
-    if rol_nombre in ["Dirección General", "Área de Calidad"]:
+    if es_directivo:
         # Directivo: Carga por Área
         carga = Documento.objects.exclude(responsable_actual__isnull=True)\
             .values('responsable_actual__unidad_organizativa')\
             .annotate(total=Count('id')).order_by('-total')
         area_labels = [item['responsable_actual__unidad_organizativa'] for item in carga]
         area_data = [item['total'] for item in carga]
+
+        # Semáforo por área: vencidos y por vencer (una consulta agrupada)
+        alertas_area = Documento.objects.alertas_por_area(now)
     else:
         # Empleado: "Lo que tengo" vs "Lo que procesé"
         # Usamos distinct() para contar expedientes únicos procesados históricamente
@@ -804,13 +861,25 @@ def reportes_dashboard(request):
         'chart_data': chart_data,
         'area_labels': area_labels,
         'area_data': area_data,
+        'alertas_area': list(alertas_area),
     }
-    
+    return context
+
+@login_required
+def reportes_dashboard(request):
+    usuario = request.perfil
+    es_directivo = tiene_permiso(usuario, 'reportes_globales')
+    # Los conteos recorren toda la tabla: se reutilizan unos segundos (REPORTES_CACHE_TIMEOUT)
+    # en vez de invalidarlos con cada movimiento, que los vaciaría a cada rato.
+    context = cacheado(
+        'reportes', f"perfil:{getattr(usuario, 'pk', None)}",
+        lambda: _contexto_reportes(usuario, es_directivo), timeout=settings.REPORTES_CACHE_TIMEOUT,
+    )
     return render(request, 'gestion/reportes_dashboard.html', context)
 
 @login_required
 def exportar_documentos_csv(request):
-    if request.user.perfilusuario.rol.nombre not in ["Dirección General", "Área de Calidad"]:
+    if not tiene_permiso(request.perfil, 'exportar_csv'):
         return redirect('lista_documentos')
 
     response = HttpResponse(content_type='text/csv')
@@ -825,13 +894,16 @@ def exportar_documentos_csv(request):
     # Capturamos filtros de la URL
     q = request.GET.get('q')
     estado = request.GET.get('estado')
+    semaforo = request.GET.get('semaforo')
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
 
     if q:
-        docs = docs.filter(Q(expediente_id__icontains=q) | Q(asunto__icontains=q) | Q(remitente__icontains=q))
+        docs = buscar(docs, q)
     if estado:
         docs = docs.filter(estado=estado)
+    if semaforo in URGENCIA_SEMAFORO:
+        docs = docs.por_semaforo(semaforo)
     if fecha_inicio and fecha_fin:
         import datetime
         try:
@@ -841,8 +913,8 @@ def exportar_documentos_csv(request):
         except ValueError:
             pass # Si las fechas no son válidas, ignoramos el filtro
 
-    # Escribimos el CSV con los datos filtrados
-    for doc in docs:
+    # Escribimos el CSV con los datos filtrados (trámite y ubicación en la misma consulta)
+    for doc in docs.select_related('procedimiento', 'responsable_actual'):
         ubicacion = doc.responsable_actual.unidad_organizativa if doc.responsable_actual else "Archivo / Finalizado"
         writer.writerow([
             doc.expediente_id,
@@ -860,7 +932,7 @@ def exportar_documentos_csv(request):
 def marcar_notificaciones_leidas(request):
     if request.method == 'POST':
         try:
-            Notificacion.objects.filter(destinatario=request.user.perfilusuario, leida=False).update(leida=True)
+            Notificacion.objects.filter(destinatario=request.perfil, leida=False).update(leida=True)
             return JsonResponse({'status': 'success'})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -868,6 +940,7 @@ def marcar_notificaciones_leidas(request):
 
 # gestion/views.py
 
+@limitar_tasa('consulta')
 def consulta_expediente(request):
     documento = None
     error = None
@@ -878,17 +951,40 @@ def consulta_expediente(request):
     expediente_query = request.GET.get('expediente_id', '').strip()
     identificador_query = request.GET.get('identificador', '').strip()
 
+    # 0. CACHÉ (solo visitantes anónimos, p. ej. escaneos del QR del cargo)
+    # Si ya tenemos la respuesta para (expediente, credencial) la servimos sin tocar la BD.
+    usar_cache = bool(expediente_query and identificador_query) and not request.user.is_authenticated
+    if usar_cache:
+        clave_cache, etag = clave_consulta(expediente_query, identificador_query)
+        if etag in request.headers.get('If-None-Match', ''):
+            return _cabeceras_consulta(HttpResponseNotModified(), etag)
+        html_cacheado = cache.get(clave_cache)
+        if html_cacheado is not None:
+            return _cabeceras_consulta(HttpResponse(html_cacheado), etag)
+
     if 'expediente_id' in request.GET:
         if expediente_query and identificador_query:
             try:
                 # 1. BUSCAR DOCUMENTO
-                documento = Documento.objects.get(
-                    Q(expediente_id__iexact=expediente_query) & 
-                    (Q(identificador_remitente=identificador_query) | Q(clave_seguridad=identificador_query))
-                )
+                # Buscamos por la clave normalizada (usa el índice UPPER(expediente_id))
+                # y validamos la credencial en Python, sin OR en el SQL.
+                # Si ya no está entre los activos, se busca en el archivo histórico
+                candidato = None
+                for modelo in (Documento, DocumentoHistorico):
+                    candidato = modelo.objects.select_related('procedimiento').alias(
+                        expediente_normalizado=Upper('expediente_id')
+                    ).filter(expediente_normalizado=normalizar_expediente(expediente_query)).first()
+                    if candidato:
+                        break
+                if candidato is None:
+                    raise Documento.DoesNotExist
+
+                if identificador_query not in (candidato.identificador_remitente, candidato.clave_seguridad):
+                    raise Documento.DoesNotExist
+                documento = candidato
 
                 # 2. OBTENER MOVIMIENTOS REALES
-                movimientos = documento.movimiento_set.exclude(tipo='inicio').order_by('fecha_movimiento')
+                movimientos = documento.movimiento_set.exclude(tipo='inicio').select_related('usuario_origen').order_by('fecha_movimiento')
 
                 # --- 3. LÓGICA DE RUTA VISUAL ---
                 # Verificamos si hubo algún desvío manual en el historial
@@ -904,7 +1000,7 @@ def consulta_expediente(request):
 
                 if not hubo_desvio and not es_libre:
                     # SI ES NORMAL: Mostramos la ruta teórica TUPA
-                    pasos = PasoFlujo.objects.filter(procedimiento=documento.procedimiento).order_by('orden')
+                    pasos = pasos_de(documento.procedimiento_id)
                 else:
                     # SI HUBO DESVÍO O ES LIBRE: No mandamos pasos, forzamos ruta dinámica
                     pasos = []
@@ -949,7 +1045,81 @@ def consulta_expediente(request):
         'identificador_query': identificador_query,
         'movimientos': movimientos
     }
-    return render(request, 'gestion/consulta_expediente.html', context)
+    response = render(request, 'gestion/consulta_expediente.html', context)
+
+    # 5. GUARDAR EN CACHÉ (solo resultados válidos; los intentos fallidos no ocupan caché)
+    if usar_cache and documento:
+        cache.set(clave_cache, response.content, tiempo_cache_consulta())
+        _cabeceras_consulta(response, etag)
+    return response
+
+@limitar_tasa('consulta_remitente')
+def consulta_remitente(request):
+    """
+    "Mis trámites": lista todos los expedientes de un DNI/RUC si la Clave Web
+    corresponde a alguno de ellos. Se arma con una sola consulta y se cachea por
+    remitente (se invalida con cada movimiento de cualquiera de sus expedientes).
+    """
+    identificador = request.GET.get('identificador', '').strip()
+    clave = request.GET.get('clave', '').strip().upper()
+    expedientes = None
+    error = None
+
+    if 'identificador' in request.GET:
+        if identificador and clave:
+            listado = _listado_remitente(identificador)
+            if listado and huella(identificador, clave) in listado['claves']:
+                expedientes = listado['expedientes']
+            else:
+                error = "DNI/RUC o Clave Web incorrectos."
+        else:
+            error = "Complete ambos campos."
+
+    response = render(request, 'gestion/consulta_remitente.html', {
+        'identificador_query': identificador,
+        'expedientes': expedientes,
+        'error': error,
+    })
+    # La URL lleva la credencial: que ningún proxy la guarde
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+def _listado_remitente(identificador):
+    """Expedientes del DNI/RUC (desde la caché o con una consulta indexada). None si no tiene."""
+    clave_cache = clave_listado_remitente(identificador)
+    listado = cache.get(clave_cache)
+    if listado is not None:
+        return listado
+
+    estados = dict(Documento.ESTADO_DOCUMENTO_CHOICES)
+    campos = ('expediente_id', 'procedimiento__nombre', 'estado', 'fecha_ingreso', 'color_semaforo',
+              'clave_seguridad', 'responsable_actual__unidad_organizativa')
+    # Activos + archivo histórico en una sola consulta (UNION)
+    activos = (
+        Documento.objects.filter(remitente_registro__identificador=identificador)
+        .con_semaforo().order_by().values(*campos)
+    )
+    archivados = (
+        DocumentoHistorico.objects.filter(remitente_registro__identificador=identificador)
+        .annotate(color_semaforo=Value('azul')).order_by().values(*campos)
+    )
+    filas = list(activos.union(archivados, all=True).order_by('-fecha_ingreso'))
+    if not filas:
+        return None # Los DNI/RUC inexistentes no ocupan caché
+
+    listado = {
+        # Solo huellas de las claves, nunca las claves en claro
+        'claves': {huella(identificador, fila.pop('clave_seguridad') or '') for fila in filas},
+        'expedientes': [dict(fila, estado_display=estados.get(fila['estado'], fila['estado'])) for fila in filas],
+    }
+    cache.set(clave_cache, listado, tiempo_cache_consulta())
+    return listado
+
+def _cabeceras_consulta(response, etag):
+    """Cabeceras HTTP para que el navegador reutilice la consulta (la URL lleva la credencial: 'private')."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=tiempo_cache_consulta())
+    return response
 
 @login_required
 def imprimir_cargo(request, expediente_id):
@@ -975,7 +1145,7 @@ def imprimir_cargo(request, expediente_id):
     context = {
         'documento': documento,
         'fecha_impresion': timezone.now(),
-        'usuario_impresion': request.user.perfilusuario,
+        'usuario_impresion': request.perfil,
         'qr_b64': qr_b64, # <--- ENVIAMOS LA IMAGEN AL TEMPLATE
         'url_texto': url_publica # <--- ENVIAMOS EL LINK TEXTO TAMBIÉN
     }
@@ -992,7 +1162,7 @@ def imprimir_historial(request, expediente_id):
         'documento': documento,
         'movimientos': movimientos,
         'fecha_impresion': timezone.now(),
-        'usuario_impresion': request.user.perfilusuario
+        'usuario_impresion': request.perfil
     }
     return render(request, 'gestion/imprimir_historial.html', context)
 
@@ -1004,7 +1174,7 @@ def redireccionar_documento(request, expediente_id):
     doc = get_object_or_404(Documento, expediente_id=expediente_id)
     
     # Seguridad: Solo el responsable actual puede redireccionar
-    if doc.responsable_actual != request.user.perfilusuario:
+    if doc.responsable_actual != request.perfil:
         messages.error(request, "No tienes permiso para redireccionar este documento.")
         return redirect('detalle_documento', expediente_id=expediente_id)
 
@@ -1017,7 +1187,7 @@ def redireccionar_documento(request, expediente_id):
             # Registramos el movimiento
             Movimiento.objects.create(
                 documento=doc,
-                usuario_origen=request.user.perfilusuario,
+                usuario_origen=request.perfil,
                 unidad_destino=nuevo_responsable,
                 tipo='redireccion',
                 paso_flujo=doc.paso_actual, # Mantenemos el paso, solo cambia el responsable
@@ -1026,7 +1196,7 @@ def redireccionar_documento(request, expediente_id):
             
             # Actualizamos responsable (El paso y estado se mantienen igual)
             doc.responsable_actual = nuevo_responsable
-            doc.save()
+            doc.save(update_fields=['responsable_actual'])
             
             # Notificamos al nuevo responsable
             Notificacion.objects.create(
@@ -1048,8 +1218,7 @@ def anular_documento(request, expediente_id):
     doc = get_object_or_404(Documento, expediente_id=expediente_id)
     
     # Seguridad: Solo Mesa de Partes, Secretaría o Director pueden anular
-    roles_permitidos = ["Mesa de Partes", "Secretaría Académica", "Dirección General"]
-    if request.user.perfilusuario.rol.nombre not in roles_permitidos:
+    if not tiene_permiso(request.perfil, 'anular'):
         messages.error(request, "No tienes autorización para anular expedientes.")
         return redirect('detalle_documento', expediente_id=expediente_id)
 
@@ -1062,7 +1231,7 @@ def anular_documento(request, expediente_id):
             # Registramos el movimiento final
             Movimiento.objects.create(
                 documento=doc,
-                usuario_origen=request.user.perfilusuario,
+                usuario_origen=request.perfil,
                 unidad_destino=None,
                 tipo='anulacion',
                 paso_flujo=doc.paso_actual,
@@ -1074,7 +1243,8 @@ def anular_documento(request, expediente_id):
             doc.estado = 'archivado' # O 'cancelado' si prefieres distinguirlo
             doc.responsable_actual = None
             doc.fecha_limite_paso_actual = None
-            doc.save()
+            # Sin pisar texto_adjuntos: el PDF de sustento se está indexando en segundo plano
+            doc.save(update_fields=['estado', 'responsable_actual', 'fecha_limite_paso_actual'])
             
             messages.success(request, "Expediente anulado y archivado correctamente.")
             return redirect('detalle_documento', expediente_id=expediente_id)
@@ -1086,21 +1256,14 @@ def anular_documento(request, expediente_id):
 def obtener_siguiente_correlativo(tipo='RESOLUCION_DIRECTORAL'):
     anio_actual = timezone.now().year
     
-    # Busca el contador o lo crea si no existe (con get_or_create)
-    contador, created = Correlativo.objects.get_or_create(
-        anio=anio_actual, 
-        tipo=tipo
-    )
-    
-    # Incrementa atómicamente (thread-safe)
-    contador.ultimo_numero += 1
-    contador.save()
-    
-    # Formatea: RD-0001-2025-IESPHVEG
-    numero_formateado = f"{contador.ultimo_numero:04d}" # Rellena con ceros (0001)
-    codigo_final = f"RD-{numero_formateado}-{anio_actual}-IESPHVEG"
-    
-    return codigo_final
+    # Incrementa atómicamente (UPDATE ... SET ultimo_numero = ultimo_numero + 1)
+    numero = siguiente_numero(tipo, anio_actual)
+    return formatear_correlativo(numero, anio_actual)
+
+
+def formatear_correlativo(numero, anio):
+    """Formatea: RD-0001-2025-IESPHVEG (número rellenado con ceros)"""
+    return f"RD-{numero:04d}-{anio}-IESPHVEG"
 
 @login_required
 def imprimir_etiqueta(request, expediente_id):
@@ -1172,7 +1335,7 @@ def perfil_usuario(request):
 
 @login_required
 def listar_notificaciones(request):
-    notificaciones = Notificacion.objects.filter(destinatario=request.user.perfilusuario).order_by('-fecha_creacion')
+    notificaciones = Notificacion.objects.filter(destinatario=request.perfil).order_by('-fecha_creacion')
     # Opcional: Marcar todas como leídas al entrar aquí
     # notificaciones.update(leida=True) 
     return render(request, 'gestion/listar_notificaciones.html', {'notificaciones': notificaciones})
@@ -1182,11 +1345,87 @@ def generar_clave_web():
     caracteres = string.ascii_uppercase + string.digits
     return ''.join(random.choice(caracteres) for _ in range(6))
 
+@login_required
+def autocompletar_remitente(request):
+    """Sugerencias por prefijo de DNI/RUC para la mesa de partes (JSON)."""
+    resultados = [
+        {'identificador': r.identificador, 'nombre': r.nombre, 'tipo': r.tipo}
+        for r in buscar_por_prefijo(request.GET.get('q'))
+    ]
+    return JsonResponse({'resultados': resultados})
+
+@login_required
+def historial_remitente(request, identificador):
+    if not tiene_permiso(request.perfil, 'ver_todos'):
+        messages.error(request, "No tiene permiso para ver el historial de remitentes.")
+        return redirect('lista_documentos')
+
+    remitente = get_object_or_404(Remitente, identificador=identificador)
+    expedientes = (
+        remitente.expedientes.select_related('procedimiento', 'responsable_actual')
+        .con_semaforo().order_by('-fecha_ingreso')
+    )
+    historicos = remitente.expedientes_historicos.select_related('procedimiento').order_by('-fecha_ingreso')
+    return render(request, 'gestion/historial_remitente.html', {
+        'remitente': remitente,
+        'expedientes': expedientes,
+        'historicos': historicos,
+    })
+
+# --- ARCHIVO HISTÓRICO ---
+
+@login_required
+def listar_historicos(request):
+    """Buscador del archivo histórico (expedientes finalizados y antiguos)."""
+    if not tiene_permiso(request.perfil, 'ver_todos'):
+        messages.error(request, "No tiene permiso para consultar el archivo histórico.")
+        return redirect('lista_documentos')
+
+    q = request.GET.get('q', '').strip()
+    expedientes = DocumentoHistorico.objects.select_related('procedimiento')
+    if q:
+        expedientes = expedientes.filter(
+            Q(expediente_id__icontains=q) | Q(identificador_remitente=q) | Q(remitente__icontains=q) | Q(asunto__icontains=q)
+        )
+    return render(request, 'gestion/listar_historicos.html', {
+        'expedientes': expedientes.order_by('-fecha_ingreso')[:100],
+        'q': q,
+    })
+
+@login_required
+def detalle_historico(request, expediente_id):
+    """Detalle de un expediente del archivo histórico (mismo permiso que el buscador)."""
+    if not tiene_permiso(request.perfil, 'ver_todos'):
+        messages.error(request, "No tiene permiso para consultar el archivo histórico.")
+        return redirect('lista_documentos')
+
+    doc = get_object_or_404(DocumentoHistorico.objects.select_related('procedimiento'), expediente_id=expediente_id)
+    historial = doc.movimiento_set.select_related('usuario_origen__usuario', 'unidad_destino__usuario').order_by('-fecha_movimiento')
+    return render(request, 'gestion/detalle_historico.html', {
+        'documento': doc,
+        'historial': historial,
+    })
+
 @login_required
 def check_nuevas_notificaciones(request):
     try:
         # Contamos las no leídas
-        count = Notificacion.objects.filter(destinatario=request.user.perfilusuario, leida=False).count()
+        count = Notificacion.objects.filter(destinatario=request.perfil, leida=False).count()
         return JsonResponse({'status': 'success', 'count': count})
     except:
-        return JsonResponse({'status': 'error', 'count': 0})
\ No newline at end of file
+        return JsonResponse({'status': 'error', 'count': 0})
+
+
+def metricas_prometheus(request):
+    """
+    Métricas en formato de texto de Prometheus (ver metricas.py), para un scraper local.
+    Con METRICAS_TOKEN exige 'Authorization: Bearer <token>'; sin él, solo acepta loopback.
+    """
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    if token:
+        autorizado = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    else:
+        autorizado = ip_cliente(request) in ('127.0.0.1', '::1')
+    if not autorizado:
+        return HttpResponse("Acceso denegado.\n", status=403, content_type='text/plain')
+    return HttpResponse(metricas.exportar_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
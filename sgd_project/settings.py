@@ -14,7 +14,9 @@ from pathlib import Path
 # --- 1. IMPORTA decouple ---
 from decouple import config
 import dj_database_url # <--- AÑADE ESTE
+import importlib.util
 import os              # <--- Y ESTE
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,12 +52,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gestion.middleware.InstrumentacionMiddleware', # Server-Timing + log por petición (primero: mide a todos)
+    'gestion.middleware.DetectorNMas1Middleware', # Consultas N+1 (solo si NMAS1_MODO está activo)
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gestion.middleware.PerfilUsuarioMiddleware', # request.perfil (perfil + rol cacheados)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,7 +69,8 @@ ROOT_URLCONF = 'sgd_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + tiempo de render por petición (Server-Timing 'tpl')
+        'BACKEND': 'gestion.instrumentacion.DjangoTemplatesMedidas',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,6 +81,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # --- AÑADE ESTA LÍNEA ---
                 'gestion.context_processors.notificaciones_processor', 
+                'gestion.context_processors.permisos_processor',
             ],
         },
     },
@@ -90,10 +97,119 @@ DATABASES = {
     'default': dj_database_url.config(
         # Esta es una base de datos por defecto para desarrollo, no la usaremos ahora
         default='sqlite:///db.sqlite3',
-        conn_max_age=600
+        # Conexiones persistentes: cada worker reutiliza la suya entre peticiones y,
+        # antes de reutilizarla, comprueba que siga viva (p. ej. tras un reinicio de Postgres)
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
     )
 }
 
+# Pool de conexiones (PostgreSQL con psycopg 3: pip install "psycopg[binary,pool]").
+# Cada worker abre como mucho DB_POOL_MAX_SIZE conexiones y las comparte entre sus
+# hilos; si todas están ocupadas, la petición espera hasta DB_POOL_TIMEOUT segundos
+# en lugar de abrir otra contra el servidor. Sin psycopg 3 / psycopg_pool (o con
+# SQLite) se mantienen las conexiones persistentes de arriba.
+# Solo acota algo con workers de varios hilos: gunicorn --worker-class gthread
+# --threads N y DB_POOL_MAX_SIZE <= N (conexiones totales = WEB_CONCURRENCY x máximo).
+# Con los workers 'sync' por defecto cada proceso atiende una petición a la vez y
+# ya usa una sola conexión persistente: ahí el pool no reduce nada.
+DB_POOL = (
+    config('DB_POOL', default=False, cast=bool)
+    and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+    and importlib.util.find_spec('psycopg') is not None # psycopg_pool no instala psycopg 3
+    and importlib.util.find_spec('psycopg_pool') is not None
+)
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0 # El pool ya conserva las conexiones (Django exige 0)
+    # Con el pool, Django traduce esto a ConnectionPool(check=check_connection): cada
+    # conexión se comprueba al sacarla del pool (descarta las que cortó el servidor)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_POOL_HEALTH_CHECKS', default=True, cast=bool)
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=4, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float), # Espera por una conexión libre
+        'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float), # Cierra las ociosas (s)
+        'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800, cast=float), # Las renueva (s)
+    }
+
+# SQLite para un solo servidor (instalaciones pequeñas sin PostgreSQL). En cada conexión:
+#   - journal_mode=WAL: los lectores no bloquean al escritor ni al revés
+#   - synchronous=NORMAL: en WAL es seguro ante caídas del proceso y evita un fsync por commit
+#   - busy_timeout: un escritor espera el bloqueo en lugar de fallar con "database is locked"
+#   - mmap_size / cache_size: lecturas desde memoria (cache_size negativo = KiB)
+# y las transacciones empiezan con BEGIN IMMEDIATE: toman el bloqueo de escritura al
+# entrar, así una transacción que lee y luego escribe (derivar) no choca con otra a mitad
+# de camino, que es el caso en que SQLite falla sin respetar busy_timeout.
+SQLITE_OPTIMIZADO = (
+    config('SQLITE_OPTIMIZADO', default=True, cast=bool)
+    and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+)
+if SQLITE_OPTIMIZADO:
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ";".join([
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            f"PRAGMA busy_timeout={config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int)}", # ms
+            f"PRAGMA mmap_size={config('SQLITE_MMAP_SIZE', default=134217728, cast=int)}", # 128 MiB
+            f"PRAGMA cache_size={config('SQLITE_CACHE_SIZE', default=-20000, cast=int)}", # ~20 MiB
+        ]),
+    })
+
+# --- CACHÉ (gestion/cache.py) ---
+# 'locmem': memoria de cada proceso (desarrollo, un solo worker)
+# 'db':     tabla compartida por todos los workers (requiere 'manage.py createcachetable')
+# 'file':   carpeta compartida (CACHE_DIR), para varios workers en una misma máquina
+# 'redis':  servidor Redis en REDIS_URL (si el paquete 'redis' no está instalado, se usa 'db')
+# Producción con varios workers: 'redis' (render.yaml lo configura). Con 'db' cada
+# lectura de un sello, del perfil o de un balde de límite de tasa es una consulta SQL,
+# y cada escritura varias (conteo y purga por MAX_ENTRIES). Medido con benchmark_vistas
+# sobre 20k expedientes: detalle_documento pasa de 10 a 30 consultas, consulta_expediente
+# de 2 a 30 y check_nuevas_notificaciones de 3 a 10. 'db' queda solo como respaldo.
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis' if REDIS_URL else 'locmem')
+if CACHE_BACKEND == 'redis' and importlib.util.find_spec('redis') is None:
+    CACHE_BACKEND = 'db'
+BACKENDS_CACHE = {
+    'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sgd'},
+    'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'sgd_cache'},
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=str(Path(tempfile.gettempdir()) / 'sgd_cache')),
+    },
+    'redis': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL},
+}
+CACHES = {
+    'default': {**BACKENDS_CACHE[CACHE_BACKEND], 'KEY_PREFIX': 'sgd', 'OPTIONS': {}},
+}
+if CACHE_BACKEND in ('locmem', 'db', 'file'):
+    CACHES['default']['OPTIONS']['MAX_ENTRIES'] = config('CACHE_MAX_ENTRIES', default=10000, cast=int)
+
+# Segundos que se conserva una lectura cacheada por espacio (flujo, procedimientos, feriados).
+# Se invalidan por señales al cambiar los modelos, así que el tope es solo por memoria.
+CACHE_LECTURAS_TIMEOUT = config('CACHE_LECTURAS_TIMEOUT', default=3600, cast=int)
+# Segundos que se reutilizan los conteos del dashboard de reportes
+REPORTES_CACHE_TIMEOUT = config('REPORTES_CACHE_TIMEOUT', default=60, cast=int)
+
+# --- PERFIL DE PRODUCCIÓN (render.yaml lo activa con PERFIL_PRODUCCION=True) ---
+# Sesiones que no leen django_session en cada petición: con una caché compartida en
+# memoria (redis) 'cached_db'; si no, cookies firmadas (la caché 'db' no ahorraría nada)
+SESION_BACKEND_PRODUCCION = 'django.contrib.sessions.backends.' + config(
+    'SESION_BACKEND', default='cached_db' if CACHE_BACKEND == 'redis' else 'signed_cookies'
+)
+# Plantillas compiladas una sola vez por proceso
+CARGADORES_PLANTILLAS_PRODUCCION = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+PERFIL_PRODUCCION = config('PERFIL_PRODUCCION', default=False, cast=bool)
+if PERFIL_PRODUCCION:
+    SESSION_ENGINE = SESION_BACKEND_PRODUCCION
+    TEMPLATES[0]['APP_DIRS'] = False # Incompatible con 'loaders' explícitos
+    TEMPLATES[0]['OPTIONS']['loaders'] = CARGADORES_PLANTILLAS_PRODUCCION
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,4 +277,95 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
-EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+
+# --- CONSULTA PÚBLICA ---
+# Segundos que se reutiliza una consulta de expediente ya resuelta (QR del cargo, etiqueta)
+CONSULTA_CACHE_TIMEOUT = config('CONSULTA_CACHE_TIMEOUT', default=300, cast=int)
+
+# Limitador de peticiones (ventana deslizante) para la consulta pública.
+# Formato "capacidad/segundos": peticiones admitidas en cualquier ventana de esa duración.
+RATELIMIT_ENABLED = config('RATELIMIT_ENABLED', default=True, cast=bool)
+# Cantidad de proxies de confianza delante de la app (Render añade 1 a X-Forwarded-For)
+RATELIMIT_TRUSTED_PROXIES = config('RATELIMIT_TRUSTED_PROXIES', default=1 if RENDER_EXTERNAL_HOSTNAME else 0, cast=int)
+RATELIMIT = {
+    'consulta': {
+        'ip': config('RATELIMIT_CONSULTA_IP', default='30/60'),
+        # Por expediente y por IP: un tercero no puede bloquear la consulta del ciudadano
+        'expediente_id+ip': config('RATELIMIT_CONSULTA_EXPEDIENTE', default='10/300'),
+        # Tope holgado por expediente, venga de la IP que venga (frena a quien rota IPs)
+        'expediente_id': config('RATELIMIT_CONSULTA_EXPEDIENTE_TOTAL', default='30/3600'),
+    },
+    # "Mis trámites": por DNI/RUC e IP (frena adivinar la Clave Web de un remitente
+    # sin que un tercero pueda bloquear al titular) y un tope holgado solo por DNI/RUC
+    'consulta_remitente': {
+        'ip': config('RATELIMIT_CONSULTA_IP', default='30/60'),
+        'identificador+ip': config('RATELIMIT_CONSULTA_REMITENTE', default='10/300'),
+        'identificador': config('RATELIMIT_CONSULTA_REMITENTE_TOTAL', default='30/3600'),
+    },
+}
+
+# Segundos que se reutiliza el perfil/rol del usuario entre peticiones (request.perfil)
+PERFIL_CACHE_TIMEOUT = config('PERFIL_CACHE_TIMEOUT', default=60, cast=int)
+# Segundos entre lecturas del sello de la matriz de permisos (gestion/permisos.py)
+PERMISOS_VERIFICAR_CADA = config('PERMISOS_VERIFICAR_CADA', default=5, cast=float)
+
+# --- TEXTO DE LOS PDF ADJUNTOS (buscador) ---
+# Hilos que extraen el texto fuera de la petición (0 = en el momento, sin hilos)
+ADJUNTOS_WORKERS = config('ADJUNTOS_WORKERS', default=2, cast=int)
+# Tope de texto guardado por expediente (acota memoria y tamaño del índice)
+ADJUNTOS_TEXTO_MAX_CARACTERES = config('ADJUNTOS_TEXTO_MAX_CARACTERES', default=200000, cast=int)
+
+# --- ARCHIVO HISTÓRICO ---
+# Días sin movimientos tras los que un expediente finalizado pasa al archivo (archivar_expedientes)
+ARCHIVO_ANTIGUEDAD_DIAS = config('ARCHIVO_ANTIGUEDAD_DIAS', default=365, cast=int)
+
+# --- BENCHMARK DE VISTAS (manage.py benchmark_vistas) ---
+BENCHMARK_LINEA_BASE = config('BENCHMARK_LINEA_BASE', default=str(BASE_DIR / 'benchmarks' / 'linea_base.json'))
+
+# --- INSTRUMENTACIÓN POR PETICIÓN (gestion/instrumentacion.py) ---
+# Fracción de peticiones con medición detallada de SQL y plantillas (0 = solo tiempo total).
+# Todas en DEBUG; en producción se activa explícitamente (p. ej. 0.01) para no pagar el
+# execute_wrapper ni la línea de log en cada petición.
+INSTRUMENTACION_MUESTREO = config('INSTRUMENTACION_MUESTREO', default=1.0 if DEBUG else 0.0, cast=float)
+# Peticiones más lentas que esto se registran como WARNING con su SQL más lento
+INSTRUMENTACION_UMBRAL_LENTO_MS = config('INSTRUMENTACION_UMBRAL_LENTO_MS', default=1000, cast=int)
+INSTRUMENTACION_SQL_LENTAS = config('INSTRUMENTACION_SQL_LENTAS', default=5, cast=int)
+# Server-Timing solo en DEBUG o para el personal (is_staff), salvo que se abra a todos
+INSTRUMENTACION_SERVER_TIMING_PUBLICO = config('INSTRUMENTACION_SERVER_TIMING_PUBLICO', default=False, cast=bool)
+
+# --- MÉTRICAS PROMETHEUS (gestion/metricas.py, endpoint /metricas/) ---
+# Carpeta compartida por los workers de gunicorn (un JSON por proceso)
+METRICAS_DIR = config('METRICAS_DIR', default=str(Path(tempfile.gettempdir()) / 'sgd_metricas'))
+METRICAS_INTERVALO = config('METRICAS_INTERVALO', default=5, cast=float)
+# Si está definido, el endpoint exige 'Authorization: Bearer <token>'; si no, solo loopback
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+# --- DETECTOR DE CONSULTAS N+1 (gestion/nmas1.py) ---
+# 'avisar' (log WARNING), 'fallar' (lanza excepción) o '' (desactivado).
+# Por defecto avisa en DEBUG; las pruebas usan NMAS1_MODO_PRUEBAS (ver TEST_RUNNER).
+NMAS1_MODO = config('NMAS1_MODO', default='avisar' if DEBUG else '')
+# Repeticiones de una misma consulta (desde el mismo sitio) permitidas por petición
+NMAS1_UMBRAL = config('NMAS1_UMBRAL', default=5, cast=int)
+
+# --- PRUEBAS (gestion/ejecutor_pruebas.py) ---
+# El ejecutor de 'manage.py test' aplica estos valores durante la corrida: el detector
+# N+1 hace fallar la prueba (la regresión no llega a producción) y el logger 'gestion'
+# queda en WARNING para no llenar la salida con una línea por petición.
+TEST_RUNNER = 'gestion.ejecutor_pruebas.EjecutorPruebas'
+NMAS1_MODO_PRUEBAS = config('NMAS1_MODO_PRUEBAS', default='fallar')
+LOG_LEVEL_PRUEBAS = config('LOG_LEVEL_PRUEBAS', default='WARNING')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'gestion': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO')},
+    },
+}
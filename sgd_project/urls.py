@@ -7,6 +7,8 @@ from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from gestion.views import metricas_prometheus
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -23,6 +25,9 @@ urlpatterns = [
     
     # 3. Mantenemos la URL de nuestra aplicación de documentos.
     path('documentos/', include('gestion.urls')),
+
+    # 4. Métricas en formato Prometheus (token o solo loopback, ver gestion/metricas.py)
+    path('metricas/', metricas_prometheus, name='metricas'),
 ]
 
 # --- AÑADE ESTO AL FINAL ---